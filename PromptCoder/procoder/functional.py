@@ -2,7 +2,7 @@ import copy
 
 from PromptCoder.procoder.utils.my_typing import *
 
-from .prompt.base import TS, Module, Single, T, as_module
+from .prompt.base import TS, Module, Single, T, as_module, mutation_version
 from .prompt.proxy import AddIndentProxy, SilenceProxy
 
 
@@ -75,6 +75,19 @@ def collect_refnames(vars: Union[Dict[str, Any], T]) -> Dict[str, Any]:
     return target
 
 
+def prompt_refnames(prompt: T, include_brackets: bool = True) -> Dict[str, Any]:
+    """collect_refnames(dict(prompt=prompt)), cached on the prompt until any module changes.
+
+    The returned dict is shared and must not be modified.
+    """
+    cached = prompt.__dict__.get("_refnames")
+    if cached is None or cached[0] != mutation_version():
+        refnames = collect_refnames(dict(prompt=prompt))
+        cached = (mutation_version(), refnames, add_brackets(refnames))
+        prompt._refnames = cached
+    return cached[2] if include_brackets else cached[1]
+
+
 def format_refnames(inputs: Dict[str, Any], format_func: Callable[[Any], str]):
     """Format the names with format_func"""
     return {k: format_func(v) for k, v in inputs.items()}
@@ -115,13 +128,32 @@ def format_prompt(
     if isinstance(prompt, str):
         return prompt
     if refnames is None:
-        refnames = collect_refnames(dict(prompt=prompt))
-    if include_brackets:
+        refnames = prompt_refnames(prompt, include_brackets)
+    elif include_brackets:
         refnames = add_brackets(refnames)
     check_duplicate_keys(inputs, refnames)
     return prompt(x={**inputs, **refnames})
 
 
+def format_prompt_segments(
+    prompt: Optional[TS],
+    inputs: Dict[str, Any],
+    refnames: Dict[str, Any] = None,
+    include_brackets: bool = True,
+) -> Optional[Tuple[str, ...]]:
+    """format_prompt, as a tuple of strings that share the static text between calls"""
+    if prompt is None:
+        return None
+    if isinstance(prompt, str):
+        return (prompt,)
+    if refnames is None:
+        refnames = prompt_refnames(prompt, include_brackets)
+    elif include_brackets:
+        refnames = add_brackets(refnames)
+    check_duplicate_keys(inputs, refnames)
+    return tuple(prompt.segments(x={**inputs, **refnames}))
+
+
 def format_multiple_prompts(
     prompts: List[Optional[TS]],
     inputs: Dict[str, Any],
@@ -152,13 +184,26 @@ def format_multiple_prompts(
     return results
 
 
+def shallow_copy(x: T) -> T:
+    """Copy a single module; its submodules are shared with x, not copied.
+
+    The tree transforms below only copy the modules on the path from the root to the
+    modified one, every untouched subtree is shared between the old and the new tree.
+    Modules should therefore be treated as immutable once they are part of a prompt.
+    """
+    y = copy.copy(x)
+    object.__setattr__(y, "_modules", OrderedDict(x._modules))
+    y._changed()
+    return y
+
+
 def remove_direct_submodule(
     x: T, names: List[str] = None, refnames: List[str] = None
 ) -> T:
     """Remove a list of direct submodules by names or refnames"""
     if names is None and refnames is None:
         raise ValueError("Either names or refnames should be specified")
-    y = copy.deepcopy(x)
+    y = shallow_copy(x)
     remains = OrderedDict()
     for name, module in x.named_children():
         if names is not None and name in names:
@@ -182,7 +227,7 @@ def remove_submodule(x: T, refname: str, recursive=True) -> Tuple[T, bool]:
         elif recursive:
             removed, success_ = remove_submodule(module, refname, recursive)
             if success_:
-                y = copy.deepcopy(x)
+                y = shallow_copy(x)
                 y._replace_submodule(name, removed)
             success = success or success_
         if success:
@@ -211,11 +256,11 @@ def replace_submodule(
 ) -> Tuple[T, bool]:
     """Replace a module [recursively] with a new module, by refname."""
     # TODO: support replacement for multiple occurrences of the module
-    y = copy.deepcopy(x)
-    success = False
+    y, success = x, False
 
     for name, module in x.named_children():
         if module.refname == refname:
+            y = shallow_copy(x)
             y._replace_submodule(name, new_module)
             # set new_module's refname to refname
             assert new_module.refname is None or new_module.refname == refname
@@ -226,6 +271,7 @@ def replace_submodule(
                 module, refname, new_module, recursive
             )
             if success_:
+                y = shallow_copy(x)
                 y._replace_submodule(name, replaced)
             success = success or success_
         if success:
@@ -250,10 +296,11 @@ def find_submodule(x: T, refname: str) -> T:
 def replace_prompt(x: T, replace_func: Callable[[str], str], inplace=False) -> T:
     """Replace the prompt of a module or its direct submodules by a replace function"""
     # TODO: maybe support recursive
-    y = x if inplace else copy.deepcopy(x)
-    if isinstance(y, Single):
+    if isinstance(x, Single):
+        y = x if inplace else copy.copy(x)
         y.prompt = replace_func(y.prompt)
     else:
+        y = x if inplace else shallow_copy(x)
         for name, module in y.named_children():
             y._replace_submodule(name, replace_prompt(module, replace_func))
     return y
@@ -0,0 +1,175 @@
+import math
+import string
+import threading
+
+from PromptCoder.procoder.utils.my_typing import *
+
+from .functional import add_brackets, check_duplicate_keys, prompt_refnames
+from .prompt.base import TS, Module, Single
+from .prompt.proxy import SilenceProxy
+
+try:
+    import tiktoken
+except ImportError:  # optional, token counts fall back to ~4 characters per token
+    tiktoken = None
+
+_formatter = string.Formatter()
+_encodings = {}
+
+
+def count_tokens(text: str, encoding: str = "cl100k_base") -> int:
+    """Number of tokens of text (tiktoken if installed, otherwise an estimate)."""
+    if tiktoken is None:
+        return math.ceil(len(text) / 4)
+    if encoding not in _encodings:
+        _encodings[encoding] = tiktoken.get_encoding(encoding)
+    return len(_encodings[encoding].encode(text))
+
+
+class BlockSize(NamedTuple):
+    """Size of one module of a rendered prompt, split into static text and input fields."""
+
+    path: str
+    key: Optional[str]  # refname, or the explicit name of the module
+    chars: int
+    tokens: int
+    static_chars: int
+    static_tokens: int
+    inputs: Dict[str, Tuple[int, int]]  # field -> (chars, tokens)
+
+
+class PromptProfile(NamedTuple):
+    text: str
+    chars: int
+    tokens: int
+    layout_chars: int  # indexing prefixes, separators and indents
+    blocks: List[BlockSize]  # pre-order, blocks[0] is the whole prompt
+
+    @property
+    def inputs(self) -> Dict[str, Tuple[int, int]]:
+        return self.blocks[0].inputs
+
+
+def _split_single(single: Single, x: Dict[str, Any], inputs: Dict[str, Any]):
+    """The static text of a Single and the rendered text of each input field it references."""
+    if not single._need_format or x is None:
+        return single.prompt, {}
+    static, fields = [], {}
+    for literal, field_name, format_spec, conversion in _formatter.parse(single.prompt):
+        static.append(literal)
+        if field_name is None:
+            continue
+        value, root = _formatter.get_field(field_name, (), x)
+        text = _formatter.format_field(_formatter.convert_field(value, conversion), format_spec or "")
+        if root in inputs:
+            fields[root] = fields.get(root, "") + text
+        else:  # refnames render as static text
+            static.append(text)
+    return "".join(static), fields
+
+
+def _walk(module: Module, path: str, x, inputs, blocks: List[BlockSize]) -> BlockSize:
+    index = len(blocks)
+    blocks.append(None)
+    if isinstance(module, SilenceProxy):
+        static, fields = "", {}
+        chars = tokens = static_chars = static_tokens = 0
+        sizes = {}
+    elif isinstance(module, Single):
+        static, fields = _split_single(module, x, inputs)
+        sizes = {k: (len(v), count_tokens(v)) for k, v in fields.items()}
+        static_chars, static_tokens = len(static), count_tokens(static)
+        chars = static_chars + sum(c for c, _ in sizes.values())
+        tokens = static_tokens + sum(t for _, t in sizes.values())
+    else:
+        chars = tokens = static_chars = static_tokens = 0
+        sizes = {}
+        for name, child in module.named_children():
+            size = _walk(child, f"{path}/{name}", x, inputs, blocks)
+            chars += size.chars
+            tokens += size.tokens
+            static_chars += size.static_chars
+            static_tokens += size.static_tokens
+            for k, (c, t) in size.inputs.items():
+                c0, t0 = sizes.get(k, (0, 0))
+                sizes[k] = (c0 + c, t0 + t)
+
+    key = module.refname or module._name
+    blocks[index] = BlockSize(path, key, chars, tokens, static_chars, static_tokens, sizes)
+    return blocks[index]
+
+
+def profile_prompt(
+    prompt: TS,
+    inputs: Dict[str, Any],
+    refnames: Dict[str, Any] = None,
+    include_brackets: bool = True,
+) -> PromptProfile:
+    """Render the prompt as format_prompt does and measure every submodule of it"""
+    if isinstance(prompt, str):
+        prompt = Single(prompt, need_format=False)
+    if refnames is None:
+        refnames = prompt_refnames(prompt, include_brackets)
+    elif include_brackets:
+        refnames = add_brackets(refnames)
+    check_duplicate_keys(inputs, refnames)
+    x = {**inputs, **refnames}
+
+    text = prompt(x=x)
+    blocks = []
+    _walk(prompt, "", x, inputs, blocks)
+    return PromptProfile(text, len(text), count_tokens(text), len(text) - blocks[0].chars, blocks)
+
+
+class PromptProfiler:
+    """Accumulates prompt profiles over a run, by block (refname or name) and by input field.
+
+    Use profiler.format_prompt in place of functional.format_prompt; it is thread safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.chars = 0
+        self.tokens = 0
+        self.blocks: Dict[str, List[int]] = {}  # key -> [renders, chars, tokens, static chars, static tokens]
+        self.inputs: Dict[str, List[int]] = {}  # field -> [renders, chars, tokens]
+
+    def format_prompt(self, prompt: Optional[TS], inputs: Dict[str, Any], refnames: Dict[str, Any] = None,
+                      include_brackets: bool = True) -> Optional[str]:
+        if prompt is None:
+            return None
+        profile = profile_prompt(prompt, inputs, refnames, include_brackets)
+        self.add(profile)
+        return profile.text
+
+    def add(self, profile: PromptProfile):
+        with self._lock:
+            self.renders += 1
+            self.chars += profile.chars
+            self.tokens += profile.tokens
+            for block in profile.blocks:
+                if block.key is None:
+                    continue
+                stats = self.blocks.setdefault(block.key, [0, 0, 0, 0, 0])
+                for i, v in enumerate((1, block.chars, block.tokens, block.static_chars, block.static_tokens)):
+                    stats[i] += v
+            for field, (chars, tokens) in profile.inputs.items():
+                stats = self.inputs.setdefault(field, [0, 0, 0])
+                stats[0] += 1
+                stats[1] += chars
+                stats[2] += tokens
+
+    def report(self, top: int = None) -> str:
+        """Blocks and input fields as text tables, largest token share first."""
+        with self._lock:
+            lines = [f"{self.renders} prompts, {self.chars} chars, {self.tokens} tokens"]
+            lines.append(f"{'block':<32}{'renders':>9}{'chars':>12}{'tokens':>10}{'share':>8}{'static':>8}")
+            for key, (n, chars, tokens, _, static_tokens) in sorted(
+                    self.blocks.items(), key=lambda kv: -kv[1][2])[:top]:
+                lines.append(f"{key[:31]:<32}{n:>9}{chars:>12}{tokens:>10}"
+                             f"{tokens / max(self.tokens, 1):>8.1%}{static_tokens / max(tokens, 1):>8.1%}")
+            lines.append(f"{'input':<32}{'renders':>9}{'chars':>12}{'tokens':>10}{'share':>8}")
+            for field, (n, chars, tokens) in sorted(self.inputs.items(), key=lambda kv: -kv[1][2])[:top]:
+                lines.append(f"{field[:31]:<32}{n:>9}{chars:>12}{tokens:>10}{tokens / max(self.tokens, 1):>8.1%}")
+        return "\n".join(lines)
@@ -1,8 +1,18 @@
+import string
+
 from PromptCoder.procoder.utils.my_typing import *
 
 T = TypeVar("T", bound="Module")
 TS = Union[T, str]
 
+# Bumped by every structural change of any module. Modules share subtrees and have no parent
+# pointers, so cached traversals are keyed on this global version instead of per-node flags.
+_version = 0
+
+
+def mutation_version() -> int:
+    return _version
+
 # Mimicing the pytorch design of nn.Module
 
 
@@ -52,6 +62,7 @@ class Module:
 
     def set_refname(self, refname: str) -> "Module":
         self._refname = refname
+        self._changed()
         return self
 
     def forward(
@@ -69,6 +80,16 @@ class Module:
         """
         raise NotImplementedError
 
+    def segments(
+        self, newline: bool = True, indent: str = "", x: Dict[str, Any] = None
+    ) -> List[str]:
+        """The output of forward as a list of strings whose concatenation is the output.
+
+        Static text is returned as the same string objects on every call, so stored renders of the
+        same prompt share it and only hold their own copies of the interpolated values.
+        """
+        return [self.forward(newline, indent, x)]
+
     def _call_impl(self, *args, **kwargs):
         if self._debug:
             print(f"entered {self} with refname={self.refname}")
@@ -99,6 +120,7 @@ class Module:
         elif name == "":
             raise KeyError('module name can\'t be empty string ""')
         self._modules[name] = module
+        self._changed()
 
     def _replace_submodule(self, name: str, module: Optional["Module"]) -> None:
         """Replace one of the submodule of this module by name."""
@@ -107,6 +129,7 @@ class Module:
         if name not in self._modules:
             raise KeyError("attribute '{}' not exists".format(name))
         self._modules[name] = module
+        self._changed()
 
     def set_submodules(self, modules: Dict[str, Optional["Module"]]) -> None:
         """Sets the submodules of this module."""
@@ -114,6 +137,12 @@ class Module:
             if not isinstance(module, Module) and module is not None:
                 raise TypeError("{} is not a Module subclass".format(typename(module)))
         self._modules = modules
+        self._changed()
+
+    def _changed(self) -> None:
+        """Called whenever the submodules change, to drop anything cached from them."""
+        global _version
+        _version += 1
 
     def get_submodule(self, target: str) -> "Module":
         """
@@ -193,31 +222,119 @@ class Module:
                 memo.add(module)
                 yield name, module
 
-    def get_all_submodules(self) -> Set["Module"]:
-        r"""Returns an iterator over all submodules.
+    def get_all_submodules(self) -> FrozenSet["Module"]:
+        r"""Returns all submodules.
 
-        Yields:
-            Module: a submodule
+        The result is cached until any module is changed, and must not be modified.
         """
+        cached = self.__dict__.get("_all_submodules")
+        if cached is not None and cached[0] == _version:
+            return cached[1]
+
         modules = set()
-        for module in self.children():
-            modules.add(module)
-            modules |= module.get_all_submodules()
+        stack = list(self.children())
+        while stack:
+            module = stack.pop()
+            if module not in modules:
+                modules.add(module)
+                stack.extend(module.children())
+        modules = frozenset(modules)
+        self._all_submodules = (_version, modules)
         return modules
 
 
+_formatter = string.Formatter()
+
+
+def _field_roots(prompt: str) -> Optional[Tuple[str, ...]]:
+    """Names of the inputs a format string references, or None if it uses positional fields."""
+    roots = []
+    for _, field_name, format_spec, _ in _formatter.parse(prompt):
+        if field_name is None:
+            continue
+        root = field_name.split(".", 1)[0].split("[", 1)[0]
+        if root == "" or root.isdigit():
+            return None
+        if root not in roots:
+            roots.append(root)
+        if format_spec and "{" in format_spec:
+            nested = _field_roots(format_spec)
+            if nested is None:
+                return None
+            roots.extend(r for r in nested if r not in roots)
+    return tuple(roots)
+
+
 class Single(Module):
+    # renders memoized per Single, keyed on the values of the inputs it references
+    MAX_CACHED_RENDERS = 64
+
     def __init__(self, prompt: str, need_format: bool = True):
         super().__init__()
         self.prompt = prompt
         self._need_format = need_format
 
+    @property
+    def prompt(self) -> str:
+        return self._prompt
+
+    @prompt.setter
+    def prompt(self, prompt: str):
+        # placeholders are parsed once per prompt text, not on every render
+        self._prompt = prompt
+        try:
+            self._fields = _field_roots(prompt)
+            self._static = prompt.format() if self._fields == () else None
+            self._pieces = list(_formatter.parse(prompt)) if self._fields else None
+        except ValueError:  # malformed, let str.format raise when (and if) it is rendered
+            self._fields = self._static = self._pieces = None
+        self._renders = {}
+
+    def _render(self, x: Dict[str, Any]) -> str:
+        if self._static is not None:
+            return self._static
+        if self._fields is None:
+            return self._prompt.format(**x)
+        try:
+            # type is part of the key: 1, 1.0 and True are equal but format differently
+            key = tuple((type(x[name]), x[name]) for name in self._fields)
+            content = self._renders.get(key)
+        except (KeyError, TypeError):  # missing input (format raises) or unhashable value
+            key = content = None
+        if key is None:
+            return self._prompt.format(**x)
+        if content is None:
+            content = self._prompt.format(**x)
+            if len(self._renders) >= self.MAX_CACHED_RENDERS:
+                self._renders = {}
+            self._renders[key] = content
+        return content
+
     def forward(self, newline: bool = True, indent: str = "", x: Dict[str, Any] = None):
-        content = self.prompt
+        content = self._prompt
         if self._need_format and x is not None:
-            content = content.format(**x)
+            content = self._render(x)
         return indent + content if newline else content
 
+    def segments(self, newline: bool = True, indent: str = "", x: Dict[str, Any] = None) -> List[str]:
+        res = [indent] if newline and indent else []
+        if not self._need_format or x is None:
+            res.append(self._prompt)
+        elif self._pieces is None:
+            res.append(self._render(x))
+        else:
+            # literal text and formatted fields as separate strings, same result as str.format
+            for literal, field_name, format_spec, conversion in self._pieces:
+                if literal:
+                    res.append(literal)
+                if field_name is None:
+                    continue
+                value = _formatter.get_field(field_name, (), x)[0]
+                if format_spec and "{" in format_spec:
+                    format_spec = _formatter.vformat(format_spec, (), x)
+                res.append(_formatter.format_field(_formatter.convert_field(value, conversion), format_spec or ""))
+        return res
+
 
 def as_module(x: TS):
     if isinstance(x, Module):
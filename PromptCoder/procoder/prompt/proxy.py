@@ -18,6 +18,9 @@ class AddIndentProxy(Module):
     def forward(self, newline=True, indent="", x=None):
         return self.prompt(newline, indent + self._delta, x)
 
+    def segments(self, newline=True, indent="", x=None):
+        return self.prompt.segments(newline, indent + self._delta, x)
+
 
 class SilenceProxy(Module):
     """Proxy to silence the output."""
@@ -30,3 +33,6 @@ class SilenceProxy(Module):
 
     def forward(self, newline=True, indent="", x=None):
         return ""
+
+    def segments(self, newline=True, indent="", x=None):
+        return []
@@ -1,3 +1,4 @@
+import sys
 from typing import overload
 
 from PromptCoder.procoder.utils.my_typing import *
@@ -12,6 +13,7 @@ class Sequential(Module):
     _modules: Dict[str, Module]
     _indexing_method: Callable[[int], str] = None
     _name_enabled: bool = False
+    _parts: List[Tuple[str, Module]] = None  # (prefix, child) pairs, rebuilt when the layout changes
 
     @overload
     def __init__(self, *args: Module) -> None:
@@ -47,6 +49,7 @@ class Sequential(Module):
 
     def enable_name(self):
         self._name_enabled = True
+        self._parts = None
         return self
 
     @property
@@ -59,22 +62,36 @@ class Sequential(Module):
 
     def set_indexing_method(self, func: Callable[[int], str]):
         self._indexing_method = func
+        self._parts = None
         return self
 
+    def _changed(self):
+        super()._changed()
+        self._parts = None
+
+    def _get_parts(self) -> List[Tuple[str, Module]]:
+        parts = self._parts
+        if parts is None:
+            # compute prefix based on indexing method and naming method
+            parts = []
+            for i, (k, p) in enumerate(self.named_children()):
+                prefix = ""
+                if self.indexing_method:
+                    prefix += self.indexing_method(i)
+                if self.name_enabled:
+                    prefix += f"{k}: "
+                parts.append((prefix, p))
+            self._parts = parts
+        return parts
+
     def forward(self, newline=True, indent="", x=None):
         indent += self._delta_indent
         sep = self._sep
         res = []
-        for i, (k, p) in enumerate(self.named_children()):
+        for i, (prefix, p) in enumerate(self._get_parts()):
             if i > 0:
                 res.append(sep)
 
-            # compute prefix based on indexing method and naming method
-            prefix = ""
-            if self.indexing_method:
-                prefix += self.indexing_method(i)
-            if self.name_enabled:
-                prefix += f"{k}: "
             if prefix != "":
                 if newline:
                     prefix = indent + prefix
@@ -83,3 +100,20 @@ class Sequential(Module):
             res.append(prefix + p(newline, indent, x))
             newline = sep.endswith("\n")
         return "".join(res)
+
+    def segments(self, newline=True, indent="", x=None):
+        indent += self._delta_indent
+        sep = self._sep
+        res = []
+        for i, (prefix, p) in enumerate(self._get_parts()):
+            if i > 0:
+                res.append(sep)
+
+            if prefix != "":
+                if newline:
+                    prefix = sys.intern(indent + prefix)
+                newline = False
+                res.append(prefix)
+            res.extend(p.segments(newline, indent, x))
+            newline = sep.endswith("\n")
+        return res
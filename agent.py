@@ -1,117 +1,266 @@
-import math
+import json
 import time
-import openai
-import random
-import google.generativeai as genai
-
-import util
-from log.custom_logger import log
+import functools
+import numpy as np
 
 from prompt.agent_prompt import *
-from PromptCoder.procoder.functional import format_prompt
 from PromptCoder.procoder.prompt import *
+from breaker import get_breaker
+from fallback import DEFAULT_DECISIONS, fallback_decision
+from streaming import RESPONSE_KEYS, read_stream
+
+
+@functools.lru_cache(maxsize=None)
+def get_openai_client(api_key, base_url):
+    # OpenAI 客户端是线程安全的，同一进程内的所有模拟共享同一个连接池
+    # 模型后端在第一次调用时才导入，回放、--help 等不调用模型的运行不必加载它们
+    import openai
+    return openai.OpenAI(api_key=api_key, base_url=base_url)
+
+
+NO_ESTIMATE = DEFAULT_DECISIONS["estimate"]
+
+# 交易员的挂单与成交记录；side 为 1（买）或 -1（卖）
+ACTION_DTYPE = np.dtype([("date", np.int32), ("session", np.int16), ("stock", np.int32), ("kind", np.int8),
+                         ("side", np.int8), ("price", np.float64), ("amount", np.int64)])
+ORDER, FILL, LIQUIDATION = 0, 1, 2
+
 
+def message_text(content):
+    # chat_history 中的提示词按片段保存（ctx.format_prompt），静态片段是所有交易员共享的同一个字符串对象，
+    # 每个交易员只保存自己填入的部分；发送请求时才拼接成完整文本
+    return content if isinstance(content, str) else "".join(content)
 
-def random_init(stock_a_initial, stock_b_initial):
-    stock_a, stock_b, cash, debt_amount = 0.0, 0.0, 0.0, 0.0
 
-    while stock_a * stock_a_initial + stock_b * stock_b_initial + cash < util.MIN_INITIAL_PROPERTY \
-            or stock_a * stock_a_initial + stock_b * stock_b_initial + cash > util.MAX_INITIAL_PROPERTY \
-            or debt_amount > stock_a * stock_a_initial + stock_b * stock_b_initial + cash:
-        stock_a = int(random.uniform(0, util.MAX_INITIAL_PROPERTY / stock_a_initial))
-        stock_b = int(random.uniform(0, util.MAX_INITIAL_PROPERTY / stock_b_initial))
-        cash = random.uniform(0, util.MAX_INITIAL_PROPERTY)
-        debt_amount = random.uniform(0, util.MAX_INITIAL_PROPERTY)
+def random_init(ctx, initial_prices):
+    config, rng = ctx.config, ctx.rng
+    holdings = np.zeros(len(initial_prices), dtype=np.int64)
+    cash, debt_amount = 0.0, 0.0
+    # 每支股票的最大初始市值随股票数量缩小，两支股票时与原先的分布一致
+    max_values = config.MAX_INITIAL_PROPERTY / max(1.0, len(initial_prices) / 2) / initial_prices
+
+    total = 0.0
+    while total < config.MIN_INITIAL_PROPERTY or total > config.MAX_INITIAL_PROPERTY or debt_amount > total:
+        for i, max_value in enumerate(max_values):
+            holdings[i] = int(rng.uniform(0, max_value))
+        cash = rng.uniform(0, config.MAX_INITIAL_PROPERTY)
+        debt_amount = rng.uniform(0, config.MAX_INITIAL_PROPERTY)
+        total = float(holdings @ initial_prices) + cash
 
     debt = {
         "loan": "yes",
         "amount": debt_amount,
-        "loan_type": random.randint(0, len(util.LOAN_TYPE) - 1),
-        "repayment_date": random.choice(util.REPAYMENT_DAYS)
+        "loan_type": rng.randint(0, len(config.LOAN_TYPE) - 1),
+        "repayment_date": rng.choice(config.REPAYMENT_DAYS)
     }
 
-    return stock_a, stock_b, cash, debt
+    return holdings, cash, debt
+
+
+class ActionLog:
+    """Growable log of one agent's orders and fills, with its running average cost and realized P&L per stock.
+
+    Cost basis follows the average cost method; the initial holdings are booked at the initial prices.
+    """
+
+    def __init__(self, holdings, prices, capacity=16):
+        self.data = np.zeros(capacity, dtype=ACTION_DTYPE)
+        self.size = 0
+        self.position = np.array(holdings, dtype=np.int64)
+        self.cost = self.position * np.asarray(prices, dtype=float)  # 当前持仓的总成本
+        self.realized = np.zeros(len(self.position))
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, n):
+        if self.size + n > len(self.data):
+            grown = np.zeros(max(2 * len(self.data), self.size + n), dtype=ACTION_DTYPE)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+
+    def order(self, date, session, stock, side, price, amount):
+        self._reserve(1)
+        self.data[self.size] = (date, session, stock, ORDER, side, price, amount)
+        self.size += 1
+
+    def fills(self, dates, sessions, stocks, sides, prices, amounts, kind=FILL):
+        """Book a batch of fills (arrays; kind may be one per fill) at once; its buys are booked before its sells."""
+        n = len(stocks)
+        self._reserve(n)
+        new = self.data[self.size:self.size + n]
+        new["date"], new["session"], new["stock"], new["kind"] = dates, sessions, stocks, kind
+        new["side"], new["price"], new["amount"] = sides, prices, amounts
+        self.size += n
+
+        buy = sides > 0
+        np.add.at(self.position, stocks[buy], amounts[buy])
+        np.add.at(self.cost, stocks[buy], prices[buy] * amounts[buy])
+
+        sell = ~buy
+        avg = self.avg_cost()[stocks[sell]]
+        np.add.at(self.realized, stocks[sell], (prices[sell] - avg) * amounts[sell])
+        np.subtract.at(self.cost, stocks[sell], avg * amounts[sell])
+        np.subtract.at(self.position, stocks[sell], amounts[sell])
+
+    @property
+    def actions(self):
+        return self.data[:self.size]
+
+    def avg_cost(self):
+        """Average cost per share of each position (0 where nothing is held)."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.position > 0, self.cost / self.position, 0.0)
+
+    def unrealized(self, prices):
+        return self.position * np.asarray(prices, dtype=float) - self.cost
 
 
 class Agent:
-    def __init__(self, i, stock_a_price, stock_b_price, secretary, model):
+    def __init__(self, ctx, i, market, secretary):
+        self.ctx = ctx
         self.order = i
+        self.market = market
         self.secretary = secretary
-        self.model = model
-        self.character = random.choice(["Conservative", "Aggressive", "Balanced", "Growth-Oriented"])
+        self.model = ctx.model
+        self.character = ctx.rng.choice(["Conservative", "Aggressive", "Balanced", "Growth-Oriented"])
 
-        self.stock_a_amount, self.stock_b_amount, self.cash, init_debt = random_init(stock_a_price, stock_b_price)
-        self.init_proper = self.get_total_proper(stock_a_price, stock_b_price)
+        # holdings[i] 为持有 market.tickers[i] 的股数
+        self.holdings, self.cash, init_debt = random_init(ctx, market.prices)
+        self.init_proper = self.get_total_proper(market.prices)
 
-        self.action_history = [[] for _ in range(util.TOTAL_DATE)]
+        # 本交易员的挂单与成交记录，以及持仓成本和已实现盈亏
+        self.action_history = ActionLog(self.holdings, market.prices)
         self.chat_history = []
+        self.last_decisions = {}  # 各类决策最近一次的结果，供超时回退策略使用
         self.loans = [init_debt]
-        self.is_bankrupt = False
         self.quit = False
 
-    def run_api(self, prompt, temperature: float = 1):
-        if 'gpt' in self.model:
-            return self.run_api_gpt(prompt, temperature)
-        elif 'gemini' in self.model:
-            return self.run_api_gemini(prompt, temperature)
+    def run_api(self, prompt, kind="action", failures=0, temperature: float = 1):
+        # 按提示词类型路由到不同模型（util.MODEL_ROUTES），chat_history 与后端无关
+        model = self.ctx.model_for(kind, failures)
+        # 流式模式下，决策类回答在 JSON 完整后即结束
+        stream_kind = kind if self.ctx.config.STREAM_RESPONSES and kind in RESPONSE_KEYS else None
+        if 'gpt' in model:
+            return self.run_api_gpt(prompt, model, temperature, stream_kind)
+        elif 'gemini' in model:
+            return self.run_api_gemini(prompt, model, temperature, stream_kind)
+
+    def read_stream(self, chunks, kind):
+        resp, stopped_early = read_stream(chunks, RESPONSE_KEYS[kind])
+        if stopped_early:
+            self.ctx.early_stop(kind)
+        return resp
 
-    def run_api_gemini(self, prompt, temperature: float = 1):
-        genai.configure(api_key=util.GOOGLE_API_KEY, transport='rest')
+    def run_api_gemini(self, prompt, model_name, temperature: float = 1, stream_kind=None):
+        import google.generativeai as genai
+        genai.configure(api_key=self.ctx.config.GOOGLE_API_KEY, transport='rest')
         generation_config = genai.types.GenerationConfig(
             candidate_count=1,
             temperature=temperature)
-        model = genai.GenerativeModel(self.model)
-        self.chat_history.append({"role": "user", "parts": [prompt]})
+        model = genai.GenerativeModel(model_name)
+        breaker = get_breaker("gemini", self.ctx.config)
+        call = self.ctx.current_call()
+        cancelled = call.cancelled
+        if not call.append(self.chat_history, {"role": "user", "content": prompt}):
+            return ""
+        contents = [{"role": "model" if m["role"] == "assistant" else "user", "parts": [message_text(m["content"])]}
+                    for m in self.chat_history]
         max_retry = 2
         retry = 0
         while retry < max_retry:
+            if cancelled.is_set():
+                return ""
+            # 熔断时抛出 BackendUnavailable（或等待恢复），而不是每个交易员各自重试后返回空回答
+            breaker.before_call()
             try:
-                response = model.generate_content(contents=self.chat_history, generation_config=generation_config)
-                new_message_dict = {"role": 'model', "parts": [response.text]}
-                self.chat_history.append(new_message_dict)
-                return response.text
+                if stream_kind is None:
+                    response = model.generate_content(contents=contents, generation_config=generation_config)
+                    resp = response.text
+                else:
+                    response = model.generate_content(contents=contents, generation_config=generation_config,
+                                                      stream=True)
+                    resp = self.read_stream((chunk.text for chunk in response), stream_kind)
             except Exception as e:
-                log.logger.warning("Gemini api retry...{}".format(e))
+                breaker.record(False)
+                self.ctx.log.logger.warning("Gemini api retry...{}".format(e))
                 retry += 1
                 time.sleep(1)
-        log.logger.error("ERROR: GEMINI API FAILED. SKIP THIS INTERACTION.")
+                continue
+            except BaseException:
+                # 中断等异常也要记录结果，否则半开状态的探测名额一直被占用
+                breaker.record(False)
+                raise
+            breaker.record(True)
+            # 超过决策时限后才到达的回答直接丢弃，不写入对话
+            if not call.append(self.chat_history, {"role": "assistant", "content": resp}):
+                return ""
+            return resp
+        self.ctx.log.logger.error("ERROR: GEMINI API FAILED. SKIP THIS INTERACTION.")
         return ""
 
-    def run_api_gpt(self, prompt, temperature: float = 1):
-        openai.api_key = util.OPENAI_API_KEY
-        openai.base_url = util.OPENAI_BASE_URL
-        client = openai.OpenAI(api_key=openai.api_key, base_url=openai.base_url)
-        self.chat_history.append({"role": "user", "content": prompt})
+    def run_api_gpt(self, prompt, model, temperature: float = 1, stream_kind=None):
+        import openai
+        client = self.ctx.openai_client or get_openai_client(self.ctx.config.OPENAI_API_KEY,
+                                                             self.ctx.config.OPENAI_BASE_URL)
+        breaker = get_breaker("openai", self.ctx.config)
+        call = self.ctx.current_call()
+        cancelled = call.cancelled
+        if not call.append(self.chat_history, {"role": "user", "content": prompt}):
+            return ""
+        messages = [{"role": m["role"], "content": message_text(m["content"])} for m in self.chat_history]
         max_retry = 2
         retry = 0
 
         while retry < max_retry:
+            if cancelled.is_set():
+                return ""
+            breaker.before_call()
             try:
-                response = client.chat.completions.create(
-                    model=self.model,
-                    messages=self.chat_history,
-                    temperature=temperature,
-                )
-                new_message_dict = {"role": response.choices[0].message.role,
-                                    "content": response.choices[0].message.content}
-                self.chat_history.append(new_message_dict)
-                resp = response.choices[0].message.content
-                return resp
+                if stream_kind is None:
+                    response = client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                    )
+                    resp = response.choices[0].message.content
+                else:
+                    stream = client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        stream=True,
+                    )
+                    try:
+                        resp = self.read_stream((chunk.choices[0].delta.content for chunk in stream if chunk.choices),
+                                                stream_kind)
+                    finally:
+                        # 提前结束时关闭连接，服务端停止生成
+                        stream.close()
             except openai.OpenAIError as e:
-                log.logger.warning("OpenAI api retry...{}".format(e))
+                breaker.record(False)
+                self.ctx.log.logger.warning("OpenAI api retry...{}".format(e))
                 retry += 1
                 time.sleep(1)
-        log.logger.error("ERROR: OPENAI API FAILED. SKIP THIS INTERACTION.")
+                continue
+            except BaseException:
+                # 非 OpenAIError 的异常（中断、解析错误等）同样记为失败，再向上抛出
+                breaker.record(False)
+                raise
+            breaker.record(True)
+            # 超过决策时限后才到达的回答直接丢弃，不写入对话
+            if not call.append(self.chat_history, {"role": "assistant", "content": resp}):
+                return ""
+            return resp
+        self.ctx.log.logger.error("ERROR: OPENAI API FAILED. SKIP THIS INTERACTION.")
         return ""
 
-    def get_total_proper(self, stock_a_price, stock_b_price):
-        return self.stock_a_amount * stock_a_price + self.stock_b_amount * stock_b_price + self.cash
+    def get_total_proper(self, prices):
+        return float(self.holdings @ prices) + self.cash
 
-    def get_proper_cash_value(self, stock_a_price, stock_b_price):
-        proper = self.stock_a_amount * stock_a_price + self.stock_b_amount * stock_b_price + self.cash
-        a_value = self.stock_a_amount * stock_a_price
-        b_value = self.stock_b_amount * stock_b_price
-        return proper, self.cash, a_value, b_value
+    def get_proper_cash_value(self, prices):
+        values = self.holdings * prices
+        return float(values.sum()) + self.cash, self.cash, values
 
     def get_total_loan(self):
         debt = 0
@@ -119,56 +268,73 @@ class Agent:
             debt += loan["amount"]
         return debt
 
-    def plan_loan(self, date, stock_a_price, stock_b_price, lastday_forum_message):
+    def plan_loan(self, date, lastday_forum_message):
         if self.quit:
             return {"loan": "no"}
 
+        max_loan = self.init_proper - self.get_total_loan()
+        if max_loan <= 0:
+            self.ctx.skip_call("loan")
+            return {"loan": "no"}
+
+        loan = self.ctx.decide("loan", date, 0, self.order,
+                               lambda: self.ask_loan(date, lastday_forum_message, max_loan), {"loan": "no"},
+                               lambda: fallback_decision(self, "loan", date, 0))
+        if loan["loan"] == "yes":
+            # 回放或超时回退得到的贷款不一定符合当前额度，按当前状态重新检查
+            loan_format_check, _, _ = self.secretary.check_loan(json.dumps(loan), max_loan)
+            if not loan_format_check:
+                loan = {"loan": "no"}
+        self.last_decisions["loan"] = dict(loan)
+
+        if loan["loan"] == "yes":
+            loan["repayment_date"] = date + self.ctx.config.LOAN_TYPE_DATE[loan["loan_type"]]
+            self.loans.append(loan)
+            self.cash += loan["amount"]
+            self.ctx.log.logger.info("INFO: Agent {} decide to loan: {}".format(self.order, loan))
+        else:
+            self.ctx.log.logger.info("INFO: Agent {} decide not to loan".format(self.order))
+
+        return loan
+
+    def ask_loan(self, date, lastday_forum_message, max_loan):
         if date == 1:
-            prompt = Collection(BACKGROUND_PROMPT,
-                                LOAN_TYPE_PROMPT,
-                                DECIDE_IF_LOAN_PROMPT).set_indexing_method(sharp2_indexing).set_sep("\n")
-            max_loan = self.init_proper - self.get_total_loan()
+            prompt = FIRST_DAY_LOAN_PROMPT
             inputs = {
                 'date': date,
                 'character': self.character,
-                'stock_a': self.stock_a_amount,
-                'stock_b': self.stock_b_amount,
+                'stock_count': len(self.market),
+                'stock_names': ", ".join(self.market.tickers),
+                'holdings': self.market.holdings_text(self.holdings),
                 'cash': self.cash,
                 'debt': self.loans,
                 'max_loan': max_loan,
-                'loan_rate1': util.LOAN_RATE[0],
-                'loan_rate2': util.LOAN_RATE[1],
-                'loan_rate3': util.LOAN_RATE[2],
+                'loan_rate1': self.ctx.loan_rate[0],
+                'loan_rate2': self.ctx.loan_rate[1],
+                'loan_rate3': self.ctx.loan_rate[2],
             }
 
         else:
-            prompt = Collection(BACKGROUND_PROMPT,
-                                LASTDAY_FORUM_AND_STOCK_PROMPT,
-                                LOAN_TYPE_PROMPT,
-                                DECIDE_IF_LOAN_PROMPT).set_indexing_method(sharp2_indexing).set_sep("\n")
-            max_loan = self.init_proper - self.get_total_loan()
+            prompt = LOAN_PROMPT
             inputs = {
                 "date": date,
                 "character": self.character,
-                "stock_a": self.stock_a_amount,
-                "stock_b": self.stock_b_amount,
+                "stock_count": len(self.market),
+                "stock_names": ", ".join(self.market.tickers),
+                "holdings": self.market.holdings_text(self.holdings),
                 "cash": self.cash,
                 "debt": self.loans,
                 "max_loan": max_loan,
-                "stock_a_price": stock_a_price,
-                "stock_b_price": stock_b_price,
+                "stock_prices": self.market.prices_text(),
                 "lastday_forum_message": lastday_forum_message,
-                'loan_rate1': util.LOAN_RATE[0],
-                'loan_rate2': util.LOAN_RATE[1],
-                'loan_rate3': util.LOAN_RATE[2],
+                'loan_rate1': self.ctx.loan_rate[0],
+                'loan_rate2': self.ctx.loan_rate[1],
+                'loan_rate3': self.ctx.loan_rate[2],
             }
 
-        if max_loan <= 0:
-            return {"loan": "no"}
-
         try_times = 0
         MAX_TRY_TIMES = 3
-        resp = self.run_api(format_prompt(prompt, inputs))
+        resp = self.run_api(self.ctx.format_prompt(prompt, inputs), "loan")
 
         if resp == "":
             return {"loan": "no"}
@@ -177,151 +343,130 @@ class Agent:
         while not loan_format_check:
             try_times += 1
             if try_times > MAX_TRY_TIMES:
-                log.logger.warning("WARNING: Loan format try times > MAX_TRY_TIMES. Skip as no loan today.")
+                self.ctx.log.logger.warning("WARNING: Loan format try times > MAX_TRY_TIMES. Skip as no loan today.")
                 loan = {"loan": "no"}
                 break
 
-            resp = self.run_api(format_prompt(LOAN_RETRY_PROMPT, {"fail_response": fail_response}))
+            resp = self.run_api(self.ctx.format_prompt(LOAN_RETRY_PROMPT, {"fail_response": fail_response}),
+                                "loan_retry", try_times)
             if resp == "":
                 return {"loan": "no"}
-            loan_format_check, fail_response, loan = self.secretary.check_loan(date, resp)
-
-        if loan["loan"] == "yes":
-            loan["repayment_date"] = date + util.LOAN_TYPE_DATE[loan["loan_type"]]
-            self.loans.append(loan)
-            self.cash += loan["amount"]
-            log.logger.info("INFO: Agent {} decide to loan: {}".format(self.order, loan))
-        else:
-            log.logger.info("INFO: Agent {} decide not to loan".format(self.order))
+            loan_format_check, fail_response, loan = self.secretary.check_loan(resp, max_loan)
 
         return loan
 
-    def plan_stock(self, date, time, stock_a, stock_b, stock_a_deals, stock_b_deals):
+    def plan_stock(self, date, time, reports=None):
         if self.quit:
             return {"action_type": "no"}
 
-        if date in util.SEASON_REPORT_DAYS and time == 1:
-            index = util.SEASON_REPORT_DAYS.index(date)
-            prompt = Collection(FIRST_DAY_FINANCIAL_REPORT, FIRST_DAY_BACKGROUND_KNOWLEDGE, SEASONAL_FINANCIAL_REPORT,
-                                DECIDE_BUY_STOCK_PROMPT).set_indexing_method(sharp2_indexing).set_sep("\n")
-            inputs = {
-                "date": date,
-                "time": time,
-                "stock_a": self.stock_a_amount,
-                "stock_b": self.stock_b_amount,
-                "stock_a_price": stock_a.get_price(),
-                "stock_b_price": stock_b.get_price(),
-                "stock_a_deals": stock_a_deals,
-                "stock_b_deals": stock_b_deals,
-                "cash": self.cash,
-                "stock_a_report": stock_a.gen_financial_report(index),
-                "stock_b_report": stock_b.gen_financial_report(index)
-            }
+        action = self.ctx.decide("action", date, time, self.order,
+                                 lambda: self.ask_action(date, time, reports), {"action_type": "no"},
+                                 lambda: fallback_decision(self, "action", date, time))
+        if action["action_type"] != "no":
+            action_format_check, _, action = self.secretary.check_action(
+                json.dumps(action), self.cash, self.holdings, self.market, self.market.open_orders.of(self.order))
+            if not action_format_check:
+                action = {"action_type": "no"}
+        self.last_decisions["action"] = dict(action)
+
+        if action["action_type"] == "buy":
+            self.ctx.log.logger.info("INFO: Agent {} decide to action: {}".format(self.order, action))
+            self.action_history.order(date, time, self.market.index[action["stock"]], 1,
+                                      action["price"], action["amount"])
+            return action
+
+        elif action["action_type"] == "sell":
+            self.ctx.log.logger.info("INFO: Agent {} decide to action: {}".format(self.order, action))
+            self.action_history.order(date, time, self.market.index[action["stock"]], -1,
+                                      action["price"], action["amount"])
+            return action
+
+        elif action["action_type"] == "replace":
+            self.ctx.log.logger.info("INFO: Agent {} decide to action: {}".format(self.order, action))
+            order = self.market.open_orders.by_id[action["order_id"]]
+            self.action_history.order(date, time, self.market.index[order["stock"]],
+                                      1 if order["action_type"] == "buy" else -1, action["price"], action["amount"])
+            return action
+
+        elif action["action_type"] == "cancel":
+            self.ctx.log.logger.info("INFO: Agent {} decide to action: {}".format(self.order, action))
+            return action
+
+        elif action["action_type"] == "no":
+            self.ctx.log.logger.info("INFO: Agent {} decide not to action".format(self.order))
+            return action
+
+        self.ctx.log.logger.error("ERROR: WRONG ACTION: {}".format(action))
+        return {"action_type": "no"}
+
+    def action_sides(self):
+        # 买入至少要买得起一股最便宜的股票，卖出要有持仓；两者都不满足时唯一合法的回答是 "no"
+        sides = []
+        if self.cash >= self.market.prices.min():
+            sides.append("buy")
+        if self.holdings.any():
+            sides.append("sell")
+        return sides
+
+    def ask_action(self, date, time, reports=None):
+        market = self.market
+        sides = self.action_sides()
+        if not sides:
+            self.ctx.skip_call("action")
+            return {"action_type": "no"}
+
+        # 提示词中只列出可行的买卖方向和股票
+        choices = {"action_choices": "|".join(f'"{side}"' for side in sides),
+                   "stock_choices": market.stock_choices(None if "buy" in sides else self.holdings),
+                   "tif_default": f'"{self.ctx.config.DEFAULT_TIME_IN_FORCE}"'}
+        inputs = {
+            "date": date,
+            "time": time,
+            "holdings": market.holdings_text(self.holdings),
+            "stock_prices": market.prices_text(),
+            "order_books": market.books_text(),
+            "open_orders": market.open_orders_text(self.order),
+            "cash": self.cash,
+            **choices,
+        }
+
+        if reports and time == 1:
+            prompt = REPORT_SESSION_STOCK_PROMPT
+            inputs["stock_reports"] = market.reports_text(reports)
 
         elif time == 1:
-            prompt = Collection(FIRST_DAY_FINANCIAL_REPORT, FIRST_DAY_BACKGROUND_KNOWLEDGE,
-                                DECIDE_BUY_STOCK_PROMPT).set_indexing_method(sharp2_indexing).set_sep("\n")
-            inputs = {
-                "date": date,
-                "time": time,
-                "stock_a": self.stock_a_amount,
-                "stock_b": self.stock_b_amount,
-                "stock_a_price": stock_a.get_price(),
-                "stock_b_price": stock_b.get_price(),
-                "stock_a_deals": stock_a_deals,
-                "stock_b_deals": stock_b_deals,
-                "cash": self.cash
-            }
+            prompt = FIRST_SESSION_STOCK_PROMPT
 
         else:
             prompt = DECIDE_BUY_STOCK_PROMPT
-            inputs = {
-                "date": date,
-                "time": time,
-                "stock_a": self.stock_a_amount,
-                "stock_b": self.stock_b_amount,
-                "stock_a_price": stock_a.get_price(),
-                "stock_b_price": stock_b.get_price(),
-                "stock_a_deals": stock_a_deals,
-                "stock_b_deals": stock_b_deals,
-                "cash": self.cash
-            }
 
         try_times = 0
         MAX_TRY_TIMES = 3
-        resp = self.run_api(format_prompt(prompt, inputs))
+        resp = self.run_api(self.ctx.format_prompt(prompt, inputs), "action")
 
         if resp == "":
             return {"action_type": "no"}
 
+        open_orders = market.open_orders.of(self.order)
         action_format_check, fail_response, action = self.secretary.check_action(
-            resp, self.cash, self.stock_a_amount, self.stock_b_amount, stock_a.get_price(), stock_b.get_price())
+            resp, self.cash, self.holdings, market, open_orders)
 
         while not action_format_check:
             try_times += 1
             if try_times > MAX_TRY_TIMES:
-                log.logger.warning("WARNING: Action format try times > MAX_TRY_TIMES. Skip as no loan today.")
+                self.ctx.log.logger.warning("WARNING: Action format try times > MAX_TRY_TIMES. Skip as no loan today.")
                 action = {"action_type": "no"}
                 break
 
-            resp = self.run_api(format_prompt(BUY_STOCK_RETRY_PROMPT, {"fail_response": fail_response}))
+            resp = self.run_api(self.ctx.format_prompt(BUY_STOCK_RETRY_PROMPT,
+                                                       {"fail_response": fail_response, **choices}),
+                                "action_retry", try_times)
             if resp == "":
                 return {"action_type": "no"}
             action_format_check, fail_response, action = self.secretary.check_action(
-                resp, self.cash, self.stock_a_amount, self.stock_b_amount, stock_a.get_price(), stock_b.get_price())
+                resp, self.cash, self.holdings, market, open_orders)
 
-        if action["action_type"] == "buy":
-            log.logger.info("INFO: Agent {} decide to action: {}".format(self.order, action))
-            return action
-
-        elif action["action_type"] == "sell":
-            log.logger.info("INFO: Agent {} decide to action: {}".format(self.order, action))
-            return action
-
-        elif action["action_type"] == "no":
-            log.logger.info("INFO: Agent {} decide not to action".format(self.order))
-            return action
-
-        log.logger.error("ERROR: WRONG ACTION: {}".format(action))
-        return {"action_type": "no"}
-
-    def buy_stock(self, stock_name, price, amount):
-        if self.quit:
-            return False
-
-        if self.cash < price * amount or stock_name not in ['A', 'B']:
-            log.logger.warning("ILLEGAL STOCK BUY BEHAVIOR: remain cash {}".format(self.cash))
-            return False
-
-        self.cash -= price * amount
-
-        if stock_name == 'A':
-            self.stock_a_amount += amount
-        elif stock_name == 'B':
-            self.stock_b_amount += amount
-
-        return True
-
-    def sell_stock(self, stock_name, price, amount):
-        if self.quit:
-            return False
-
-        if stock_name == 'B' and self.stock_b_amount < amount:
-            log.logger.warning(
-                "ILLEGAL STOCK SELL BEHAVIOR: remain stock_b {}, amount {}".format(self.stock_b_amount, amount))
-            return False
-        elif stock_name == 'A' and self.stock_a_amount < amount:
-            log.logger.warning(
-                "ILLEGAL STOCK SELL BEHAVIOR: remain stock_a {}, amount {}".format(self.stock_a_amount, amount))
-            return False
-
-        if stock_name == 'A':
-            self.stock_a_amount -= amount
-        elif stock_name == 'B':
-            self.stock_b_amount -= amount
-        self.cash += price * amount
-
-        return True
+        return action
 
     def loan_repayment(self, date):
         if self.quit:
@@ -329,69 +474,51 @@ class Agent:
 
         for loan in self.loans[:]:
             if loan["repayment_date"] == date:
-                self.cash -= loan["amount"] * (1 + util.LOAN_RATE[loan["loan_type"]])
+                self.cash -= loan["amount"] * (1 + self.ctx.loan_rate[loan["loan_type"]])
                 self.loans.remove(loan)
 
-        if self.cash < 0:
-            self.is_bankrupt = True
-
     def interest_payment(self):
         if self.quit:
             return
 
         for loan in self.loans:
-            self.cash -= loan["amount"] * util.LOAN_RATE[loan["loan_type"]] / 12
-            if self.cash < 0:
-                self.is_bankrupt = True
+            self.cash -= loan["amount"] * self.ctx.loan_rate[loan["loan_type"]] / 12
 
-    def bankrupt_process(self, stock_a_price, stock_b_price):
-        if self.quit:
-            return False
-
-        total_value_of_stock = self.stock_a_amount * stock_a_price + self.stock_b_amount * stock_b_price
-        if total_value_of_stock + self.cash < 0:
-            log.logger.warning(f"Agent {self.order} bankrupt. ")
-            return True
-
-        if stock_a_price * self.stock_a_amount >= -self.cash:
-            sell_a = math.ceil(-self.cash / stock_a_price)
-            self.stock_a_amount -= sell_a
-            self.cash += sell_a * stock_a_price
-        else:
-            self.cash += stock_a_price * self.stock_a_amount
-            self.stock_a_amount = 0
-            sell_b = math.ceil(-self.cash / stock_b_price)
-            self.stock_b_amount -= sell_b
-            self.cash += sell_b * stock_b_price
-
-        if self.stock_a_amount < 0 or self.stock_b_amount < 0 or self.cash < 0:
-            raise RuntimeError("ERROR: WRONG BANKRUPT PROCESS")
-
-        self.is_bankrupt = False
-        return False
-
-    def post_message(self):
+    def post_message(self, date):
         if self.quit:
             return ""
 
-        prompt = format_prompt(POST_MESSAGE_PROMPT, inputs={})
+        message = self.ctx.decide("post", date, 0, self.order, self.ask_message, "",
+                                  lambda: fallback_decision(self, "post", date, 0))
+        self.last_decisions["post"] = message
+        return message
 
-        resp = self.run_api(prompt)
+    def ask_message(self):
+        prompt = self.ctx.format_prompt(POST_MESSAGE_PROMPT, inputs={})
+
+        resp = self.run_api(prompt, "post")
 
         return resp
 
-    def next_day_estimate(self):
+    def next_day_estimate(self, date):
         if self.quit:
-            return {"buy_A": "no", "buy_B": "no", "sell_A": "no", "sell_B": "no", "loan": "no"}
+            return dict(NO_ESTIMATE)
+
+        estimate = self.ctx.decide("estimate", date, 0, self.order, self.ask_estimate, NO_ESTIMATE,
+                                   lambda: fallback_decision(self, "estimate", date, 0))
+        self.last_decisions["estimate"] = estimate
+        return estimate
 
-        prompt = format_prompt(NEXT_DAY_ESTIMATE_PROMPT, inputs={})
+    def ask_estimate(self):
+        example = self.market.estimate_example()
+        prompt = self.ctx.format_prompt(NEXT_DAY_ESTIMATE_PROMPT, inputs={"estimate_example": example})
 
-        resp = self.run_api(prompt)
+        resp = self.run_api(prompt, "estimate")
 
         if resp == "":
-            return {"buy_A": "no", "buy_B": "no", "sell_A": "no", "sell_B": "no", "loan": "no"}
+            return dict(NO_ESTIMATE)
 
-        format_check, fail_response, estimate = self.secretary.check_estimate(resp)
+        format_check, fail_response, estimate = self.secretary.check_estimate(resp, self.market)
 
         try_times = 0
         MAX_TRY_TIMES = 3
@@ -399,14 +526,18 @@ class Agent:
         while not format_check:
             try_times += 1
             if try_times > MAX_TRY_TIMES:
-                log.logger.warning("WARNING: Estimation format try times > MAX_TRY_TIMES. Skip as all 'no' today.")
-                estimate = {"buy_A": "no", "buy_B": "no", "sell_A": "no", "sell_B": "no", "loan": "no"}
+                self.ctx.log.logger.warning(
+                    "WARNING: Estimation format try times > MAX_TRY_TIMES. Skip as all 'no' today.")
+                estimate = dict(NO_ESTIMATE)
                 break
 
-            resp = self.run_api(format_prompt(NEXT_DAY_ESTIMATE_RETRY, {"fail_response": fail_response}))
+            resp = self.run_api(self.ctx.format_prompt(NEXT_DAY_ESTIMATE_RETRY,
+                                                       {"fail_response": fail_response,
+                                                        "estimate_example": example}),
+                                "estimate_retry", try_times)
             if resp == "":
-                return {"buy_A": "no", "buy_B": "no", "sell_A": "no", "sell_B": "no", "loan": "no"}
+                return dict(NO_ESTIMATE)
 
-            format_check, fail_response, estimate = self.secretary.check_estimate(resp)
+            format_check, fail_response, estimate = self.secretary.check_estimate(resp, self.market)
 
         return estimate
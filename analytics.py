@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+SUMMARY_FILE = "summary.xlsx"
+
+TRADE_COLUMNS = {"交易日": "date", "交易阶段": "session", "股票类型": "stock", "买入交易员": "buyer",
+                 "卖出交易员": "seller", "交易数量": "amount", "交易价格": "price"}
+SESSION_COLUMNS = {"交易员": "agent", "交易日": "date", "交易阶段": "session", "交易前资产总额": "equity",
+                   "交易前持有现金": "cash"}
+DAILY_COLUMNS = {"交易员": "agent", "交易日": "date", "是否贷款": "loan", "贷款数量": "loan_amount"}
+
+AGENT_HEADERS = {"agent": "交易员", "initial_equity": "初始资产", "final_equity": "最终资产", "return": "收益率",
+                 "return_vol": "阶段收益率波动", "max_drawdown": "最大回撤", "realized_pnl": "已实现盈亏",
+                 "unrealized_pnl": "未实现盈亏", "turnover": "换手率", "traded_value": "成交额",
+                 "loan_taken": "新增贷款", "loan_leverage": "贷款杠杆"}
+STOCK_HEADERS = {"stock": "股票", "first_price": "初始价格", "last_price": "最终价格", "session_vol": "阶段收益率波动",
+                 "daily_vol": "日收益率波动", "volume": "成交量", "trades": "成交笔数"}
+
+
+class RunFrames:
+    """The records of one run, loaded once into columnar frames with English column names."""
+
+    def __init__(self, trades, prices, sessions, daily, tickers):
+        self.trades = trades  # date, session, stock, buyer, seller, amount, price
+        self.prices = prices  # date, session, one price column per ticker
+        self.sessions = sessions  # agent, date, session, equity, cash, value_{ticker}...
+        self.daily = daily  # agent, date, loan, loan_amount
+        self.tickers = tickers
+
+    @classmethod
+    def from_excel(cls, res_dir="res"):
+        trades = pd.read_excel(os.path.join(res_dir, "trades.xlsx")).rename(columns=TRADE_COLUMNS)
+        prices = pd.read_excel(os.path.join(res_dir, "stocks.xlsx"))
+        tickers = [c[len("阶段结束后股票"):-len("价格")] for c in prices.columns[2:]]
+        prices.columns = ["date", "session"] + tickers
+
+        sessions = pd.read_excel(os.path.join(res_dir, "agent_session_record.xlsx"))
+        sessions = sessions.rename(columns={**SESSION_COLUMNS,
+                                            **{f"交易前持有的{t}股价值": f"value_{t}" for t in tickers}})
+        daily = pd.read_excel(os.path.join(res_dir, "agent_day_record.xlsx")).rename(columns=DAILY_COLUMNS)
+        return cls(trades, prices, sessions, daily, tickers)
+
+    @classmethod
+    def from_sqlite(cls, path, prefix=""):
+        """Load the tables of one run (table prefix, e.g. "run0" or "seed42") from a records.db."""
+        prefix = prefix + "_" if prefix else ""
+        with sqlite3.connect(path) as conn:
+            def read(table, columns="*"):
+                return pd.read_sql_query(f"SELECT {columns} FROM {prefix}{table}", conn)
+
+            trades = read("trades")
+            prices = read("stocks").pivot(index=["date", "session"], columns="stock", values="price")
+            tickers = list(dict.fromkeys(read("stocks", "DISTINCT stock")["stock"]))
+            prices = prices[tickers].reset_index()
+            prices.columns.name = None
+            values = read("agent_session_values").pivot(index=["agent", "date", "session"], columns="stock",
+                                                        values="value")
+            values = values[tickers].add_prefix("value_").reset_index()
+            sessions = read("agent_session", "agent, date, session, proper AS equity, cash").merge(
+                values, on=["agent", "date", "session"])
+            daily = read("agent_day", "agent, date, loan, loan_amount")
+        return cls(trades, prices, sessions, daily, tickers)
+
+
+def equity_matrix(sessions):
+    """Pre-trade equity of every agent at every session, agents x sessions (NaN once an agent quits)."""
+    time = sessions["date"].to_numpy(np.int64) * 1000 + sessions["session"].to_numpy(np.int64)
+    agents, agent_idx = np.unique(sessions["agent"].to_numpy(), return_inverse=True)
+    times, time_idx = np.unique(time, return_inverse=True)
+    equity = np.full((len(agents), len(times)), np.nan)
+    equity[agent_idx, time_idx] = sessions["equity"].to_numpy(float)
+    return agents, equity
+
+
+def max_drawdown(equity):
+    """Largest peak-to-trough loss of each row, as a fraction of the peak."""
+    peak = np.fmax.accumulate(equity, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = 1 - equity / peak
+    return np.nan_to_num(np.nanmax(np.where(np.isnan(drawdown), -np.inf, drawdown), axis=1), neginf=0.0)
+
+
+def last_valid(matrix):
+    """Last non-NaN value of each row."""
+    valid = ~np.isnan(matrix)
+    last = matrix.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    return np.where(valid.any(axis=1), matrix[np.arange(len(matrix)), last], np.nan)
+
+
+def trade_pnl(frames, agents, initial_prices):
+    """Realized and unrealized P&L and traded value per agent, on a running average-cost basis.
+
+    Fills are booked session by session in time order, each session's buys before its sells (as ActionLog
+    books them), so a sell realizes against the average cost at that time and later buys do not change it.
+    Holdings at the first session are booked at the initial prices. Forced liquidations are on the trade
+    tape as sells of the liquidated agent (fills of its liquidation orders, or direct sales to the market
+    with buyer -1) and are counted like any other sell; bankrupt agents keep their holdings.
+    """
+    trades, tickers = frames.trades, frames.tickers
+    size = len(agents) * len(tickers)
+    first = frames.sessions.sort_values(["date", "session"]).drop_duplicates("agent").set_index("agent")
+    init_value = np.nan_to_num(np.concatenate(
+        [first.reindex(agents)[f"value_{t}"].to_numpy(float)[:, None] for t in tickers], axis=1).ravel())
+    init_price = np.tile(np.array([initial_prices[t] for t in tickers], dtype=float), len(agents))
+    qty = init_value / init_price
+    cost = init_value.copy()
+    realized = np.zeros(size)
+    traded = np.zeros(size)
+
+    # 每笔成交在 (交易员, 股票) 展平后的下标；不在 agents 中的一方（市场、跟随者）为 -1
+    stock = pd.Categorical(trades["stock"], categories=tickers).codes.astype(np.int64)
+    index = pd.Index(agents)
+    buyer = index.get_indexer(trades["buyer"])
+    seller = index.get_indexer(trades["seller"])
+    buy_key = np.where(buyer >= 0, buyer * len(tickers) + stock, -1)
+    sell_key = np.where(seller >= 0, seller * len(tickers) + stock, -1)
+    amount = trades["amount"].to_numpy(float)
+    notional = amount * trades["price"].to_numpy(float)
+
+    time = trades["date"].to_numpy(np.int64) * 1000 + trades["session"].to_numpy(np.int64)
+    order = np.argsort(time, kind="stable")
+    for rows in np.split(order, np.flatnonzero(np.diff(time[order])) + 1):
+        buys = rows[buy_key[rows] >= 0]
+        qty += np.bincount(buy_key[buys], amount[buys], size)
+        bought = np.bincount(buy_key[buys], notional[buys], size)
+        cost += bought
+        sells = rows[sell_key[rows] >= 0]
+        sold_qty = np.bincount(sell_key[sells], amount[sells], size)
+        sold = np.bincount(sell_key[sells], notional[sells], size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_cost = np.where(qty > 0, cost / qty, 0.0)
+        realized += sold - sold_qty * avg_cost
+        cost -= sold_qty * avg_cost
+        qty -= sold_qty
+        traded += bought + sold
+
+    last_price = np.tile(frames.prices.sort_values(["date", "session"])[tickers].iloc[-1].to_numpy(float),
+                         len(agents))
+    unrealized = qty * last_price - cost
+    shape = (len(agents), len(tickers))
+    return realized.reshape(shape).sum(axis=1), unrealized.reshape(shape).sum(axis=1), traded.reshape(shape).sum(axis=1)
+
+
+def agent_summary(frames, initial_prices):
+    agents, equity = equity_matrix(frames.sessions)
+    initial = equity[:, 0]
+    final = last_valid(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(equity, axis=1) / equity[:, :-1]
+    realized, unrealized, traded = trade_pnl(frames, agents, initial_prices)
+    mean_equity = np.nanmean(equity, axis=1)
+
+    loans = frames.daily[frames.daily["loan"] == "yes"].groupby("agent")["loan_amount"].sum()
+    loan_taken = loans.reindex(agents, fill_value=0).to_numpy(float)
+
+    return pd.DataFrame({
+        "agent": agents,
+        "initial_equity": initial,
+        "final_equity": final,
+        "return": final / initial - 1,
+        "return_vol": np.nanstd(returns, axis=1) if returns.shape[1] else np.zeros(len(agents)),
+        "max_drawdown": max_drawdown(equity),
+        "realized_pnl": realized,
+        "unrealized_pnl": unrealized,
+        "turnover": traded / mean_equity,
+        "traded_value": traded,
+        "loan_taken": loan_taken,
+        "loan_leverage": loan_taken / mean_equity,
+    })
+
+
+def stock_summary(frames):
+    prices = frames.prices.sort_values(["date", "session"])
+    close = prices[frames.tickers].to_numpy(float)
+    daily_close = prices.groupby("date")[frames.tickers].last().to_numpy(float)
+    session_returns = close[1:] / close[:-1] - 1
+    daily_returns = daily_close[1:] / daily_close[:-1] - 1
+    volume = frames.trades.groupby("stock")["amount"].agg(["sum", "count"]).reindex(frames.tickers, fill_value=0)
+    return pd.DataFrame({
+        "stock": frames.tickers,
+        "first_price": close[0],
+        "last_price": close[-1],
+        "session_vol": session_returns.std(axis=0) if len(session_returns) else 0.0,
+        "daily_vol": daily_returns.std(axis=0) if len(daily_returns) else 0.0,
+        "volume": volume["sum"].to_numpy(),
+        "trades": volume["count"].to_numpy(),
+    })
+
+
+def run_prices(decisions):
+    """Initial prices of a run (its STOCKS setting), read from the header of its decision log."""
+    if not os.path.isfile(decisions):
+        raise FileNotFoundError(f"No decision log at {decisions} to take the run's initial prices from; "
+                                f"pass initial_prices (or --decisions) explicitly")
+    with open(decisions, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+    if header.get("kind") != "run":
+        raise ValueError(f"{decisions} is not a decision log: missing run header")
+    return header["config"]["STOCKS"]
+
+
+def summarize(res_dir="res", initial_prices=None, frames=None, decisions=None):
+    """Compute the per-agent and per-stock summary of a run and write it to res_dir/summary.xlsx.
+
+    initial_prices defaults to the STOCKS setting recorded in the run's decision log (res_dir/decisions.jsonl).
+    """
+    if frames is None:
+        frames = RunFrames.from_excel(res_dir)
+    if initial_prices is None:
+        initial_prices = run_prices(decisions or os.path.join(res_dir, "decisions.jsonl"))
+    agents = agent_summary(frames, initial_prices)
+    stocks = stock_summary(frames)
+    with pd.ExcelWriter(os.path.join(res_dir, SUMMARY_FILE)) as writer:
+        agents.rename(columns=AGENT_HEADERS).to_excel(writer, sheet_name="agents", index=False)
+        stocks.rename(columns=STOCK_HEADERS).to_excel(writer, sheet_name="stocks", index=False)
+    return agents, stocks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("res_dir", nargs="?", default="res", help="output directory of the run")
+    parser.add_argument("--sqlite", type=str, default=None,
+                        help="read the run from res_dir/records.db, tables with this prefix (e.g. seed42)")
+    parser.add_argument("--decisions", type=str, default=None,
+                        help="decision log of the run, for its initial prices (default: res_dir/decisions.jsonl; "
+                             "for a replay, the replayed log)")
+    args = parser.parse_args()
+    summarize(args.res_dir, frames=RunFrames.from_sqlite(os.path.join(args.res_dir, "records.db"), args.sqlite)
+              if args.sqlite is not None else None, decisions=args.decisions)
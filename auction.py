@@ -0,0 +1,91 @@
+import numpy as np
+
+ALLOCATION_METHODS = ["pro_rata", "time"]
+
+
+def clearing_price(buys, sells, reference_price):
+    """Uniform price that maximizes executed volume, in one sorted pass over the price levels.
+
+    Ties are broken by the smallest demand/supply imbalance, then by the distance to reference_price.
+    Returns (price, volume), or (None, 0) if the books do not cross.
+    """
+    if not buys or not sells:
+        return None, 0
+
+    buy_price = np.array([order["price"] for order in buys], dtype=float)
+    buy_amount = np.array([order["amount"] for order in buys], dtype=float)
+    sell_price = np.array([order["price"] for order in sells], dtype=float)
+    sell_amount = np.array([order["amount"] for order in sells], dtype=float)
+
+    levels = np.unique(np.concatenate((buy_price, sell_price)))
+    # demand[i]: 出价不低于 levels[i] 的买单总量；supply[i]: 要价不高于 levels[i] 的卖单总量
+    demand = np.bincount(np.searchsorted(levels, buy_price), buy_amount, len(levels))[::-1].cumsum()[::-1]
+    supply = np.bincount(np.searchsorted(levels, sell_price), sell_amount, len(levels)).cumsum()
+    executed = np.minimum(demand, supply)
+
+    volume = executed.max()
+    if volume <= 0:
+        return None, 0
+    candidates = np.flatnonzero(executed == volume)
+    imbalance = np.abs(demand[candidates] - supply[candidates])
+    candidates = candidates[imbalance == imbalance.min()]
+    best = candidates[np.argmin(np.abs(levels[candidates] - reference_price))]
+    return levels[best].item(), int(volume)
+
+
+def allocate(orders, volume, priority, method="pro_rata"):
+    """Split volume over orders by price priority; the marginal price level is shared by method.
+
+    priority maps an order to its price sort key (better prices first). Returns [(order, amount)].
+    """
+    if method not in ALLOCATION_METHODS:
+        raise ValueError(f"Unknown allocation method {method}, should be one of {ALLOCATION_METHODS}")
+
+    orders = sorted(orders, key=lambda order: (priority(order), order["id"]))
+    fills = []
+    remaining = volume
+    start = 0
+    while remaining > 0 and start < len(orders):
+        end = start
+        while end < len(orders) and orders[end]["price"] == orders[start]["price"]:
+            end += 1
+        level = orders[start:end]
+        level_amount = sum(order["amount"] for order in level)
+
+        if level_amount <= remaining or method == "time":
+            for order in level:
+                amount = min(order["amount"], remaining)
+                if amount > 0:
+                    fills.append((order, amount))
+                    remaining -= amount
+        else:
+            # 按比例分配，整数股的余量按最大余数（同余数按时间）补足
+            quotas = [order["amount"] * remaining / level_amount for order in level]
+            amounts = [int(quota) for quota in quotas]
+            rest = remaining - sum(amounts)
+            for k in sorted(range(len(level)), key=lambda k: amounts[k] - quotas[k])[:rest]:
+                amounts[k] += 1
+            for order, amount in zip(level, amounts):
+                if amount > 0:
+                    fills.append((order, amount))
+            remaining = 0
+        start = end
+    return fills
+
+
+def pair_fills(buy_fills, sell_fills):
+    """Match allocated buy and sell quantities into trades [(buy_order, sell_order, amount)]."""
+    trades = []
+    buy_fills = [list(fill) for fill in buy_fills]
+    sell_fills = [list(fill) for fill in sell_fills]
+    i = j = 0
+    while i < len(buy_fills) and j < len(sell_fills):
+        amount = min(buy_fills[i][1], sell_fills[j][1])
+        trades.append((buy_fills[i][0], sell_fills[j][0], amount))
+        buy_fills[i][1] -= amount
+        sell_fills[j][1] -= amount
+        if buy_fills[i][1] == 0:
+            i += 1
+        if sell_fills[j][1] == 0:
+            j += 1
+    return trades
@@ -0,0 +1,54 @@
+"""Time of one risk check over many accounts.
+
+    python bench/bench_risk.py [--accounts 10000] [--stocks 2] [--repeat 20]
+
+Accounts are stand-ins with random cash, holdings and loans; about a tenth of them have negative cash.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from risk import RiskEngine  # noqa: E402
+
+
+class Account:
+    def __init__(self, order, rng, n_stocks):
+        self.order = order
+        self.quit = False
+        self.cash = rng.uniform(-1e5, 1e6)
+        self.holdings = rng.integers(0, 10000, n_stocks)
+        self.loans = [{"amount": rng.uniform(0, 1e6)}]
+
+    def get_total_loan(self):
+        return sum(loan["amount"] for loan in self.loans)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=10000)
+    parser.add_argument("--stocks", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    accounts = [Account(i, rng, args.stocks) for i in range(args.accounts)]
+    config = SimpleNamespace(MAINTENANCE_MARGIN=0.25)
+    engine = RiskEngine(SimpleNamespace(config=config), None, accounts)
+    prices = rng.uniform(10, 100, args.stocks)
+
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        risk = engine.measure(prices)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    print(f"{args.accounts} accounts: median {median * 1000:.2f} ms per check, "
+          f"{median / args.accounts * 1e6:.2f} us per account, "
+          f"{int(risk['short'].sum())} short, {int(risk['bankrupt'].sum())} bankrupt")
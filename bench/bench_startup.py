@@ -0,0 +1,56 @@
+"""Startup time of the CLI, as paid by every short-lived sweep worker.
+
+    python bench/bench_startup.py [--repeat 10]
+
+Each case runs in a fresh interpreter from the repository root; the median wall time is reported,
+together with the modules that `import main` spends the most time in.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    "python -c pass": [sys.executable, "-c", "pass"],
+    "import main": [sys.executable, "-c", "import main"],
+    "main.py --help": [sys.executable, "main.py", "--help"],
+}
+
+
+def run_case(cmd, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def slowest_imports(top):
+    """Cumulative import time of the slowest modules pulled in by `import main` (python -X importtime)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    for name, cmd in CASES.items():
+        print(f"{name:<20}{run_case(cmd, args.repeat) * 1000:>10.1f} ms")
+    print("\nslowest imports of `import main` (cumulative):")
+    for cumulative, name in slowest_imports(args.top):
+        print(f"{cumulative / 1000:>10.1f} ms  {name}")
@@ -0,0 +1,54 @@
+"""Latency and delivered characters per decision, waiting for the full answer vs. stopping at the JSON.
+
+    python bench/bench_streaming.py [--decisions 50] [--explanation 600] [--delay 0.002]
+
+Answers come from streaming.LocalStreamingClient: a decision JSON followed by `explanation` characters
+of reasoning, delivered 4 characters per `delay` seconds.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import RESPONSE_KEYS, LocalStreamingClient, read_stream  # noqa: E402
+
+
+def responder(explanation, rng):
+    def answer(messages):
+        action = {"action_type": "buy", "stock": "A", "amount": rng.randint(1, 500), "price": 30.1}
+        return "Decision:\n" + json.dumps(action) + "\nReasoning: " + "x" * explanation
+    return answer
+
+
+def run(client, streamed, decisions):
+    times = []
+    for _ in range(decisions):
+        start = time.perf_counter()
+        if streamed:
+            stream = client.chat.completions.create(model="local", messages=[], stream=True)
+            read_stream((chunk.choices[0].delta.content for chunk in stream), RESPONSE_KEYS["action"])
+            stream.close()
+        else:
+            client.chat.completions.create(model="local", messages=[])
+        times.append(time.perf_counter() - start)
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--decisions", type=int, default=50)
+    parser.add_argument("--explanation", type=int, default=600)
+    parser.add_argument("--delay", type=float, default=0.002)
+    args = parser.parse_args()
+
+    for name, streamed in [("full answer", False), ("stream, stop at JSON", True)]:
+        client = LocalStreamingClient(responder(args.explanation, random.Random(0)), delay=args.delay)
+        times = run(client, streamed, args.decisions)
+        p95 = sorted(times)[int(0.95 * (len(times) - 1))]
+        print(f"{name:<22}median {statistics.median(times) * 1000:>7.1f} ms  p95 {p95 * 1000:>7.1f} ms  "
+              f"{client.sent / args.decisions:>6.0f} chars/decision")
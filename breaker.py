@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import deque
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class BackendUnavailable(RuntimeError):
+    """Raised instead of calling a model backend whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker shared by every caller of one model backend.
+
+    closed: calls go through; once at least `min_calls` of the last `window` calls were made and the
+    share of failures among them reaches `failure_rate`, the breaker opens.
+    open: calls fail fast with BackendUnavailable until `cooldown` seconds have passed. A call never waits
+    out the cooldown; with on_open="wait" the run pauses at the next session boundary instead
+    (wait_until_available, at most `max_wait` seconds).
+    half-open: one probe call goes through; its success closes the breaker, its failure opens it again.
+    Other calls fail fast (on_open="fail") or wait for the probe's result (on_open="wait").
+    """
+
+    def __init__(self, name, window=20, min_calls=10, failure_rate=0.5, cooldown=30.0, on_open="fail",
+                 max_wait=600.0, clock=time.monotonic):
+        self.name = name
+        self.window = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.on_open = on_open
+        self.max_wait = max_wait
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._cond = threading.Condition()
+
+    def _reason(self):
+        failures = self.window.count(False)
+        return f"{self.name} backend failed {failures} of the last {len(self.window)} calls"
+
+    def before_call(self):
+        """Reject a call according to the state, or wait for a running probe; returns once the call may go ahead."""
+        deadline = None
+        with self._cond:
+            while True:
+                if self.state == CLOSED:
+                    return
+                if self.state == OPEN and self.clock() - self.opened_at >= self.cooldown:
+                    self.state = HALF_OPEN
+                if self.state == HALF_OPEN and not self._probing:
+                    self._probing = True
+                    return
+                if self.state == OPEN or self.on_open != "wait":
+                    raise BackendUnavailable(f"circuit breaker open: {self._reason()}")
+                now = self.clock()
+                if deadline is None:
+                    deadline = now + self.max_wait
+                if now >= deadline:
+                    raise BackendUnavailable(f"circuit breaker probe still running after {self.max_wait:.0f}s: "
+                                             f"{self._reason()}")
+                # 半开状态下等待探测结果
+                self._cond.wait(min(1.0, deadline - now))
+
+    def is_open(self):
+        with self._cond:
+            return self.state == OPEN and self.clock() - self.opened_at < self.cooldown
+
+    def wait_until_available(self):
+        """Block until the cooldown of an open breaker has passed; BackendUnavailable after max_wait seconds."""
+        with self._cond:
+            deadline = self.clock() + self.max_wait
+            while self.state == OPEN and self.clock() - self.opened_at < self.cooldown:
+                now = self.clock()
+                if now >= deadline:
+                    raise BackendUnavailable(f"circuit breaker still open after {self.max_wait:.0f}s: "
+                                             f"{self._reason()}")
+                self._cond.wait(min(max(self.cooldown - (now - self.opened_at), 0.01), deadline - now))
+
+    def record(self, success):
+        with self._cond:
+            if self._probing:
+                self._probing = False
+                if success:
+                    self.state = CLOSED
+                    self.window.clear()
+                else:
+                    self._open()
+                self._cond.notify_all()
+                return
+            self.window.append(success)
+            if self.state == CLOSED and len(self.window) >= self.min_calls \
+                    and self.window.count(False) >= self.failure_rate * len(self.window):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.trips += 1
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def open_breakers():
+    """The breakers of the process that are open and still cooling down."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker for breaker in breakers if breaker.is_open()]
+
+
+def get_breaker(backend, config):
+    """The process-wide breaker of a backend ("openai", "gemini"), shared by all runs in the process."""
+    with _breakers_lock:
+        if backend not in _breakers:
+            _breakers[backend] = CircuitBreaker(
+                backend, window=config.BREAKER_WINDOW, min_calls=config.BREAKER_MIN_CALLS,
+                failure_rate=config.BREAKER_FAILURE_RATE, cooldown=config.BREAKER_COOLDOWN,
+                on_open=config.BREAKER_ON_OPEN, max_wait=config.BREAKER_MAX_WAIT)
+        return _breakers[backend]
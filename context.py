@@ -0,0 +1,279 @@
+import copy
+import os
+import random
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import util
+from breaker import BackendUnavailable, open_breakers
+from log.custom_logger import CustomLogger, log
+from PromptCoder.procoder.functional import format_prompt_segments
+from PromptCoder.procoder.profiler import PromptProfiler
+from record import create_sink
+from replay import DecisionLog, ReplaySource
+
+
+class DecisionCall:
+    """A decision being asked for on a worker thread, which the asking thread may abandon at its deadline.
+
+    The worker adds to the agent's chat history only through append(); abandon() takes back everything the
+    call added and makes later appends no-ops, so a reply that arrives after the deadline changes nothing.
+    """
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.finished = False
+        self._lock = threading.Lock()
+        self._added = []  # (列表, 本次提问开始写入前的长度)
+
+    def append(self, history, entry):
+        """history.append(entry) unless the call was abandoned; returns whether it was appended."""
+        with self._lock:
+            if self.cancelled.is_set():
+                return False
+            if not any(added is history for added, _ in self._added):
+                self._added.append((history, len(history)))
+            history.append(entry)
+            return True
+
+    def abandon(self):
+        with self._lock:
+            self.cancelled.set()
+            for history, length in self._added:
+                del history[length:]
+            self._added.clear()
+
+
+class _Unbounded:
+    """The call of a decision without deadline: never cancelled, appends directly."""
+
+    cancelled = threading.Event()
+
+    @staticmethod
+    def append(history, entry):
+        history.append(entry)
+        return True
+
+
+_UNBOUNDED = _Unbounded()
+
+
+class Config:
+    """Per-run snapshot of the upper-case settings in util.py."""
+
+    def __init__(self, **overrides):
+        for key in dir(util):
+            if key.isupper():
+                setattr(self, key, copy.deepcopy(getattr(util, key)))
+        for key, value in overrides.items():
+            self.set(key, value)
+
+    def set(self, key, value):
+        if not hasattr(self, key):
+            raise KeyError(f"Unknown config key {key}")
+        setattr(self, key, value)
+
+
+class SimulationContext:
+    """Everything one simulation run reads or writes besides its agents and stocks.
+
+    Agents, stocks, the secretary and the record writers take the context explicitly instead of
+    reading util / log globals, so several runs can share one process without interfering.
+
+    A live run logs every decision to res_dir/decisions.jsonl; a context built with `replay` takes
+    its decisions from such a log instead and does not call the model at all.
+    """
+
+    def __init__(self, model, config=None, seed=None, run_name="", res_dir="res", logger=None, sink=None,
+                 replay=None):
+        self.model = model
+        self.run_name = run_name
+        self.config = config if config is not None else Config()
+        self.loan_rate = list(self.config.LOAN_RATE)  # 当前贷款利率，随场景事件变化
+        # 未指定时也固定一个种子并写入决策日志，任何一次运行都可以回放
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        if logger is None:
+            logger = CustomLogger(run_name) if run_name else log
+        self.log = logger
+        # 先独占创建决策日志：同一输出目录已有其他运行时在写任何记录之前报错
+        self.decisions = DecisionLog(os.path.join(res_dir, "decisions.jsonl"), self) if replay is None else None
+        if sink is None:
+            # 多个进程共用同一个数据库时按运行名（未指定时按种子）分表；表已存在时报错，不与其他运行混写
+            try:
+                sink = create_sink(self.config.RECORD_SINK, res_dir, run_name or f"seed{self.seed}")
+            except BaseException:
+                if self.decisions is not None:
+                    self.decisions.discard()
+                raise
+        self.sink = sink
+        self.replay = replay
+        # 所有按交易员并发的阶段共用同一个线程池，即共用同一个并发上限
+        self.pool = ThreadPoolExecutor(max_workers=self.config.LLM_CONCURRENCY)
+        self.profiler = PromptProfiler() if self.config.PROFILE_PROMPTS else None
+        self.model_calls = Counter()  # 各模型的调用次数
+        self.skipped_calls = Counter()  # 因交易员无可选决策而省去的调用次数，按提示词类型
+        self.early_stops = Counter()  # 收到完整 JSON 后提前结束的流式回答数，按提示词类型
+        self.openai_client = None  # 替代共享 OpenAI 客户端（如 streaming.LocalStreamingClient）
+        # 有决策时限时，提问在单独的线程池中进行（与 map_agents 的线程池分开，避免互相等待）
+        self.deadline_workers = 2 * self.config.LLM_CONCURRENCY
+        self.deadline_pool = ThreadPoolExecutor(max_workers=self.deadline_workers) \
+            if any(self.config.DECISION_DEADLINES.values()) else None
+        self.stuck_calls = set()  # 已超时放弃、仍占着 deadline_pool 线程的提问
+        self.replaced_pools = 0
+        self.deadline_calls = Counter()  # 有时限的决策数，按类型
+        self.fallbacks = Counter()  # 超时后按回退策略决定的次数，按类型
+        self.unavailable = Counter()  # "wait" 模式下因模型接口熔断而按回退策略决定的次数，按类型
+        self._call = threading.local()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_run(cls, model, index, seed=None, res_dir="res", **config_overrides):
+        """Context of the index-th run of a batch, with its own output directory and log file."""
+        run_name = f"run{index}"
+        return cls(model, config=Config(**config_overrides),
+                   seed=None if seed is None else seed + index,
+                   run_name=run_name, res_dir=os.path.join(res_dir, run_name))
+
+    @classmethod
+    def for_replay(cls, path, res_dir, run_name="", **config_overrides):
+        """Context replaying the decision log at path; config_overrides are the counterfactual settings."""
+        replay = ReplaySource(path)
+        config = Config(**config_overrides)
+        for key, value in replay.config.items():
+            config.set(key, value)
+        return cls(replay.model, config=config, seed=replay.seed, run_name=run_name, res_dir=res_dir, replay=replay)
+
+    def decide(self, kind, date, session, agent, ask, default, fallback=None):
+        """The recorded decision when replaying; otherwise ask() it and log it.
+
+        If DECISION_DEADLINES sets a deadline for the kind and ask() misses it, the decision is fallback()
+        (default if not given) instead: the call is abandoned, its prompts are taken back out of the chat
+        history and the late answer is dropped. With BREAKER_ON_OPEN "wait", a decision whose call finds the
+        backend's breaker open is fallback() too, and the run pauses before the next session (wait_for_backends).
+        """
+        if self.replay is not None:
+            return self.replay.decision(kind, date, session, agent, default)
+        fallback = fallback or (lambda: copy.deepcopy(default))
+        try:
+            decision = self._ask_within_deadline(kind, ask, fallback)
+        except BackendUnavailable:
+            if self.config.BREAKER_ON_OPEN != "wait":
+                raise
+            with self._lock:
+                self.unavailable[kind] += 1
+            decision = fallback()
+        self.decisions.record(kind, date, session, agent, decision)
+        return decision
+
+    def _ask_within_deadline(self, kind, ask, fallback):
+        deadline = self.config.DECISION_DEADLINES.get(kind)
+        if not deadline:
+            return ask()
+        call = DecisionCall()
+
+        def run():
+            if call.cancelled.is_set():
+                return None  # 排队期间已经超时
+            self._call.current = call
+            try:
+                return ask()
+            finally:
+                self._call.current = None
+                with self._lock:
+                    call.finished = True
+                    self.stuck_calls.discard(call)
+
+        with self._lock:
+            pool = self.deadline_pool
+            self.deadline_calls[kind] += 1
+        future = pool.submit(run)
+        try:
+            return future.result(timeout=deadline)
+        except TimeoutError:
+            call.abandon()
+            if not future.cancel():
+                self._hold_stuck(pool, call)
+            with self._lock:
+                self.fallbacks[kind] += 1
+            self.log.logger.warning(f"WARNING: {kind} decision missed its {deadline}s deadline, using the fallback.")
+            return fallback()
+
+    def _hold_stuck(self, pool, call):
+        """Count an abandoned call still running on pool; once half the workers hang, ask on a fresh pool."""
+        with self._lock:
+            if call.finished or pool is not self.deadline_pool:
+                return
+            self.stuck_calls.add(call)
+            if len(self.stuck_calls) * 2 < self.deadline_workers:
+                return
+            # 旧线程池中的提问不再等待，回答迟到后各自结束；之后的决策用新的线程池，不被卡住的线程拖住
+            self.deadline_pool = ThreadPoolExecutor(max_workers=self.deadline_workers)
+            self.stuck_calls.clear()
+            self.replaced_pools += 1
+        pool.shutdown(wait=False)
+        self.log.logger.warning(f"WARNING: {self.deadline_workers // 2} abandoned calls still hang, "
+                                f"later decisions are asked on a new thread pool.")
+
+    def wait_for_backends(self):
+        """With BREAKER_ON_OPEN "wait", pause until no backend breaker of the process is cooling down."""
+        if self.config.BREAKER_ON_OPEN != "wait" or self.replay is not None:
+            return
+        for breaker in open_breakers():
+            self.log.logger.warning(f"Model backend {breaker.name} unavailable, pausing the run until its "
+                                    f"circuit breaker lets a probe call through.")
+            breaker.wait_until_available()
+
+    def current_call(self):
+        """The DecisionCall the current thread is asking for (one that is never cancelled without a deadline)."""
+        call = getattr(self._call, "current", None)
+        return call if call is not None else _UNBOUNDED
+
+    def model_for(self, kind, failures=0):
+        """Model of a call of the given prompt kind (see MODEL_ROUTES), counted in model_calls.
+
+        `failures` is the number of failed format checks so far; retries escalate from the cheap tier to
+        the main model once it reaches ESCALATE_AFTER.
+        """
+        tier = self.config.MODEL_ROUTES.get(kind, "main")
+        if tier == "cheap" and self.config.ESCALATE_AFTER and failures >= self.config.ESCALATE_AFTER:
+            tier = "main"
+        if tier == "main":
+            model = self.model
+        elif tier == "cheap":
+            model = self.config.CHEAP_MODEL or self.model
+        else:
+            model = tier
+        with self._lock:
+            self.model_calls[model] += 1
+        return model
+
+    def skip_call(self, kind):
+        with self._lock:
+            self.skipped_calls[kind] += 1
+
+    def early_stop(self, kind):
+        with self._lock:
+            self.early_stops[kind] += 1
+
+    def format_prompt(self, prompt, inputs):
+        """The rendered prompt as a tuple of segments, see agent.message_text."""
+        if self.profiler is not None:
+            return (self.profiler.format_prompt(prompt, inputs),)
+        return format_prompt_segments(prompt, inputs)
+
+    def map_agents(self, fn, agents):
+        """fn(agent) for every agent, concurrently; results come back in agent order."""
+        return list(self.pool.map(fn, agents))
+
+    def close(self):
+        self.pool.shutdown()
+        if self.deadline_pool is not None:
+            # 不等待已超时的提问返回
+            self.deadline_pool.shutdown(wait=False, cancel_futures=True)
+        if self.replaced_pools:
+            self.log.logger.info(f"Deadline thread pools replaced because of hanging calls: {self.replaced_pools}")
+        self.sink.close()
+        if self.decisions is not None:
+            self.decisions.close()
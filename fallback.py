@@ -0,0 +1,66 @@
+import copy
+import json
+import math
+
+# 各类决策的"不作为"回答
+DEFAULT_DECISIONS = {
+    "loan": {"loan": "no"},
+    "action": {"action_type": "no"},
+    "estimate": {"buy": [], "sell": [], "loan": "no"},
+    "post": "",
+}
+
+
+def default_policy(agent, kind, date, session):
+    """Do nothing: no loan, hold, no estimate, no forum post."""
+    return copy.deepcopy(DEFAULT_DECISIONS[kind])
+
+
+def previous_policy(agent, kind, date, session):
+    """Repeat the agent's last decision of this kind, if it is still valid."""
+    previous = agent.last_decisions.get(kind)
+    if previous is None:
+        return default_policy(agent, kind, date, session)
+    if kind == "action" and previous["action_type"] != "no":
+        valid, _, _ = agent.secretary.check_action(json.dumps(previous), agent.cash, agent.holdings, agent.market,
+                                                   agent.market.open_orders.of(agent.order))
+        if not valid:
+            return default_policy(agent, kind, date, session)
+    return copy.deepcopy(previous)
+
+
+def momentum_policy(agent, kind, date, session, budget=0.1):
+    """Trade the stock with the largest move in the last session in its direction, at the last price.
+
+    Buys with `budget` of the cash, sells half of the holding; other kinds fall back to the default.
+    """
+    if kind != "action":
+        return default_policy(agent, kind, date, session)
+    market = agent.market
+    moves = [(abs(r[-1]), r[-1], i) for i, r in enumerate(stock.returns() for stock in market.stocks) if len(r)]
+    if not moves:
+        return default_policy(agent, kind, date, session)
+    _, move, i = max(moves)
+    price = market.prices[i].item()
+    if move > 0:
+        amount = math.floor(agent.cash * budget / price)
+        if amount > 0:
+            return {"action_type": "buy", "stock": market.tickers[i], "amount": amount, "price": price}
+    elif move < 0 and agent.holdings[i] > 0:
+        amount = math.ceil(agent.holdings[i] / 2)
+        return {"action_type": "sell", "stock": market.tickers[i], "amount": int(amount), "price": price}
+    return default_policy(agent, kind, date, session)
+
+
+# 回退策略表，可按名称注册自定义策略：fn(agent, kind, date, session) -> decision
+POLICIES = {
+    "default": default_policy,
+    "previous": previous_policy,
+    "momentum": momentum_policy,
+}
+
+
+def fallback_decision(agent, kind, date, session):
+    """The decision of the policy FALLBACK_POLICIES assigns to this kind."""
+    policy = agent.ctx.config.FALLBACK_POLICIES.get(kind, "default")
+    return POLICIES[policy](agent, kind, date, session)
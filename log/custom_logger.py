@@ -19,15 +19,23 @@ class ColoredFormatter(logging.Formatter):
 
 
 class CustomLogger:
-    def __init__(self):
-        # 动态生成日志文件名
+    def __init__(self, run_name=""):
+        # 动态生成日志文件名，同一进程内的多个模拟按 run_name 区分
         current_time = datetime.now().strftime('%d%H%M%S')
-        self.log_file = f'log/log_{current_time}.txt'
-        self.logger = logging.getLogger('Stocklogger')
+        if run_name:
+            self.log_file = f'log/log_{current_time}_{run_name}.txt'
+            self.logger = logging.getLogger(f'Stocklogger.{run_name}')
+            self.logger.propagate = False
+        else:
+            self.log_file = f'log/log_{current_time}.txt'
+            self.logger = logging.getLogger('Stocklogger')
         self.logger.setLevel(logging.DEBUG)
 
-        # 创建一个handler用于写入日志文件
-        file_handler = logging.FileHandler(self.log_file)
+        if self.logger.handlers:
+            return
+
+        # 创建一个handler用于写入日志文件；日志文件在第一条日志写入时才创建
+        file_handler = logging.FileHandler(self.log_file, delay=True)
         file_handler.setLevel(logging.DEBUG)
         plain_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         file_handler.setFormatter(plain_formatter)
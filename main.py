@@ -1,179 +1,248 @@
 import argparse
-import random
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 import util
 from agent import Agent
+from breaker import BackendUnavailable
+from context import Config, SimulationContext
+from market import Market
+from population import Population
+from risk import RiskEngine
 from secretary import Secretary
-from stock import Stock
-from log.custom_logger import log
-from record import create_stock_record, create_trade_record, AgentRecordDaily, create_agentses_record
+from settlement import Settlement
+from timeline import Timeline
+from record import SINKS, create_stock_record, AgentRecordDaily, create_agentses_record
 
 
-def get_agent(all_agents, order):
-    for agent in all_agents:
-        if agent.order == order:
-            return agent
-    return None
-
-
-def handle_action(action, stock_deals, all_agents, stock, session):
-    try:
-        if action["action_type"] == "buy":
-            for sell_action in stock_deals["sell"][:]:
-                if action["price"] == sell_action["price"]:
-                    close_amount = min(action["amount"], sell_action["amount"])
-                    get_agent(all_agents, action["agent"]).buy_stock(stock.name, close_amount, action["price"])
-
-                    if not sell_action["agent"] == -1:
-                        get_agent(all_agents, sell_action["agent"]).sell_stock(stock.name, close_amount,
-                                                                               action["price"])
-
-                    stock.add_session_deal({"price": action["price"], "amount": close_amount})
-                    create_trade_record(action["date"], session, stock.name, action["agent"], sell_action["agent"],
-                                        close_amount, action["price"])
-
-                    if action["amount"] > close_amount:
-                        log.logger.info(f"ACTION - BUY:{action['agent']}, SELL:{sell_action['agent']}, "
-                                        f"STOCK:{stock.name}, PRICE:{action['price']}, AMOUNT:{close_amount}")
-                        stock_deals["sell"].remove(sell_action)
-                        action["amount"] -= close_amount
-                    else:
-                        log.logger.info(f"ACTION - BUY:{action['agent']}, SELL:{sell_action['agent']}, "
-                                        f"STOCK:{stock.name}, PRICE:{action['price']}, AMOUNT:{close_amount}")
-                        sell_action["amount"] -= close_amount
-                        return
-            stock_deals["buy"].append(action)
-
-        else:
-            for buy_action in stock_deals["buy"][:]:
-                if action["price"] == buy_action["price"]:
-                    close_amount = min(action["amount"], buy_action["amount"])
-                    get_agent(all_agents, action["agent"]).sell_stock(stock.name, close_amount, action["price"])
-                    get_agent(all_agents, buy_action["agent"]).buy_stock(stock.name, close_amount, action["price"])
-
-                    stock.add_session_deal({"price": action["price"], "amount": close_amount})
-                    create_trade_record(action["date"], session, stock.name, buy_action["agent"], action["agent"],
-                                        close_amount, action["price"])
-
-                    if action["amount"] > close_amount:
-                        log.logger.info(f"ACTION - BUY:{buy_action['agent']}, SELL:{action['agent']}, "
-                                        f"STOCK:{stock.name}, PRICE:{action['price']}, AMOUNT:{close_amount}")
-                        stock_deals["buy"].remove(buy_action)
-                        action["amount"] -= close_amount
-                    else:
-                        log.logger.info(f"ACTION - BUY:{buy_action['agent']}, SELL:{action['agent']}, "
-                                        f"STOCK:{stock.name}, PRICE:{action['price']}, AMOUNT:{close_amount}")
-                        buy_action["amount"] -= close_amount
-                        return
-            stock_deals["sell"].append(action)
-    except Exception as e:
-        log.logger.error(f"handle_action error: {e}")
-        return
-
-
-def simulation(args):
-    secretary = Secretary(args.model)
-    stock_a = Stock("A", util.STOCK_A_INITIAL_PRICE, 0, is_new=False)
-    stock_b = Stock("B", util.STOCK_B_INITIAL_PRICE, 0, is_new=False)
+def run_simulation(ctx, timeline):
+    config = ctx.config
+    secretary = Secretary(ctx)
+    market = Market(ctx, config.STOCKS)
     all_agents = []
-    log.logger.debug("Agents initial...")
+    agents = {}  # {agent.order: agent}，仅包含未退出的交易员
+    ctx.log.logger.debug("Agents initial...")
 
-    for i in range(0, util.AGENTS_NUM):
-        agent = Agent(i, stock_a.get_price(), stock_b.get_price(), secretary, args.model)
+    for i in range(0, config.AGENTS_NUM):
+        agent = Agent(ctx, i, market, secretary)
         all_agents.append(agent)
-        log.logger.debug("cash: {}, stock a: {}, stock b:{}, debt: {}".format(agent.cash, agent.stock_a_amount,
-                                                                              agent.stock_b_amount, agent.loans))
+        agents[agent.order] = agent
+        ctx.log.logger.debug("cash: {}, holdings: {}, debt: {}".format(
+            agent.cash, market.holdings_text(agent.holdings), agent.loans))
+    # 规则跟随者的编号排在所有交易员之后，与交易员共用结算和风控
+    population = Population(ctx, market, config.AGENTS_NUM, config.FOLLOWERS_NUM)
+    accounts = all_agents + population.accounts
+    settlement = Settlement(accounts, len(market.tickers))
+    risk = RiskEngine(ctx, market, accounts)
+
+    def leave(bankrupt):
+        for agent in bankrupt:
+            if agent.order in agents:
+                all_agents.remove(agent)
+                del agents[agent.order]
 
     last_day_forum_message = []
-    stock_a_deals = {"sell": [], "buy": []}
-    stock_b_deals = {"sell": [], "buy": []}
 
-    log.logger.debug("--------Simulation Start!--------")
-    for date in range(1, util.TOTAL_DATE + 1):
-        log.logger.debug(f"--------DAY {date}---------")
+    ctx.log.logger.debug("--------Simulation Start!--------")
+    for date in range(1, config.TOTAL_DATE + 1):
+        ctx.log.logger.debug(f"--------DAY {date}---------")
 
-        stock_a_deals["sell"].clear()
-        stock_a_deals["buy"].clear()
-        stock_b_deals["buy"].clear()
-        stock_b_deals["sell"].clear()
+        market.new_day()
 
         for agent in all_agents[:]:
             agent.chat_history.clear()
             agent.loan_repayment(date)
 
-        if date in util.REPAYMENT_DAYS:
+        if date in config.REPAYMENT_DAYS:
             for agent in all_agents[:]:
                 agent.interest_payment()
 
-        for agent in all_agents[:]:
-            if agent.is_bankrupt:
-                quit_sig = agent.bankrupt_process(stock_a.get_price(), stock_b.get_price())
-                if quit_sig:
-                    agent.quit = True
-                    all_agents.remove(agent)
-
-        if date == util.EVENT_1_DAY:
-            util.LOAN_RATE = util.EVENT_1_LOAN_RATE
-            last_day_forum_message.append({"name": -1, "message": util.EVENT_1_MESSAGE})
-        if date == util.EVENT_2_DAY:
-            util.LOAN_RATE = util.EVENT_2_LOAN_RATE
-            last_day_forum_message.append({"name": -1, "message": util.EVENT_2_MESSAGE})
-
-        daily_agent_records = []
-        for agent in all_agents:
-            loan = agent.plan_loan(date, stock_a.get_price(), stock_b.get_price(), last_day_forum_message)
-            daily_agent_records.append(AgentRecordDaily(date, agent.order, loan))
-
-        for session in range(1, util.TOTAL_SESSION + 1):
-            log.logger.debug(f"SESSION {session}")
-
-            sequence = list(range(len(all_agents)))
-            random.shuffle(sequence)
-            for i in sequence:
-                agent = all_agents[i]
-
-                action = agent.plan_stock(date, session, stock_a, stock_b, stock_a_deals, stock_b_deals)
-                proper, cash, valua_a, value_b = agent.get_proper_cash_value(stock_a.get_price(), stock_b.get_price())
-                create_agentses_record(agent.order, date, session, proper, cash, valua_a, value_b, action)
+        # 还款、付息后现金为负的账户在第一个交易阶段强制平仓
+        leave(risk.check(date, 1, settlement))
+
+        day_events = timeline.on(date)
+        if day_events.loan_rate is not None:
+            ctx.loan_rate = list(day_events.loan_rate)
+        for name, value in day_events.params.items():
+            if not hasattr(config, name):
+                ctx.log.logger.warning(f"Unknown scenario parameter {name}, ignored.")
+                continue
+            config.set(name, value)
+        for message in day_events.messages:
+            last_day_forum_message.append({"name": -1, "message": message})
+
+        # 模型接口熔断时（"wait" 模式）在交易日、交易阶段之间暂停，等冷却结束再继续
+        ctx.wait_for_backends()
+        # 各交易员的贷款决策相互独立，并发提问，记录按交易员顺序生成
+        loans = ctx.map_agents(lambda agent: agent.plan_loan(date, last_day_forum_message), all_agents)
+        # 按交易员编号记录：交易阶段中被强制平仓退出的交易员不再做预估，但当日的贷款记录照常写出
+        daily_agent_records = {agent.order: AgentRecordDaily(agent.order, date, loan)
+                               for agent, loan in zip(all_agents, loans)}
+
+        for session in range(1, config.TOTAL_SESSION + 1):
+            ctx.log.logger.debug(f"SESSION {session}")
+            ctx.wait_for_backends()
+
+            # 回放时沿用原始运行的提问顺序（只保留仍在市场中的交易员）
+            if ctx.replay is not None:
+                sequence = [agents[order] for order in ctx.replay.session_order(date, session) if order in agents]
+            else:
+                sequence = all_agents[:]
+                ctx.rng.shuffle(sequence)
+                ctx.decisions.record("order", date, session, -1, [agent.order for agent in sequence])
+            if config.MATCHING_MODE == "auction":
+                # 集合竞价前谁也看不到别人本阶段的挂单，各交易员的决策相互独立，并发提问
+                actions = ctx.map_agents(lambda agent: agent.plan_stock(date, session, day_events.reports), sequence)
+            else:
+                # 连续撮合逐个决策：每个交易员下单前都能看到前面交易员已提交的挂单
+                actions = (agent.plan_stock(date, session, day_events.reports) for agent in sequence)
+            auction_orders = []
+            for agent, action in zip(sequence, actions):
+                proper, cash, values = agent.get_proper_cash_value(market.prices)
+                create_agentses_record(ctx, agent.order, date, session, proper, cash,
+                                       dict(zip(market.tickers, values.tolist())), action)
 
                 action["agent"] = agent.order
                 action["date"] = date
 
                 if not action["action_type"] == "no":
-                    if action["stock"] == 'A':
-                        handle_action(action, stock_a_deals, all_agents, stock_a, session)
+                    if config.MATCHING_MODE == "auction":
+                        auction_orders.append(action)
                     else:
-                        handle_action(action, stock_b_deals, all_agents, stock_b, session)
-
-            stock_a.update_price(date)
-            stock_b.update_price(date)
-            create_stock_record(date, session, stock_a.get_price(), stock_b.get_price())
-
-        for idx, agent in enumerate(all_agents):
-            estimation = agent.next_day_estimate()
-            log.logger.info("Agent {} tomorrow estimation: {}".format(agent.order, estimation))
-            if idx >= len(daily_agent_records):
-                break
-            daily_agent_records[idx].add_estimate(estimation)
-            daily_agent_records[idx].write_to_excel()
-        daily_agent_records.clear()
+                        market.handle_action(action, settlement, session)
+
+            # 跟随者在交易员之后下单，挂单只在本阶段有效，不出现在交易员的提示词中
+            for action in population.decide(market, date, session):
+                if config.MATCHING_MODE == "auction":
+                    auction_orders.append(action)
+                else:
+                    market.handle_action(action, settlement, session)
+
+            # 集合竞价：所有交易员看到同一盘口后统一下单，成交结果与下单顺序无关
+            if config.MATCHING_MODE == "auction":
+                for action in auction_orders:
+                    market.submit(action)
+                market.call_auction(settlement, date, session)
+
+            # 本阶段的成交在阶段结束时统一结算
+            settlement.settle()
+            market.end_session()
+            market.update_prices(date, session)
+            create_stock_record(ctx, date, session, market.price_dict())
+            # 最后一个阶段之后盘口会被清空，只检查破产，强制平仓留到次日开盘前
+            leave(risk.check(date, session + 1 if session < config.TOTAL_SESSION else None, settlement))
+            ctx.sink.flush()
+
+        # 每个交易员先做次日预估、再发论坛消息（同一对话），不同交易员之间并发
+        evening = ctx.map_agents(lambda agent: (agent.next_day_estimate(date), agent.post_message(date)), all_agents)
+
+        for agent, (estimation, _) in zip(all_agents, evening):
+            ctx.log.logger.info("Agent {} tomorrow estimation: {}".format(agent.order, estimation))
+            daily_agent_records[agent.order].add_estimate(estimation)
+        for record in daily_agent_records.values():
+            ctx.sink.write(record)
+        ctx.sink.flush()
+        population.observe([estimation for estimation, _ in evening])
 
         last_day_forum_message.clear()
-        log.logger.debug(f"DAY {date} ends, display forum messages...")
-        for agent in all_agents:
-            chat_history = agent.chat_history
-            message = agent.post_message()
-            log.logger.info("Agent {} says: {}".format(agent.order, message))
+        ctx.log.logger.debug(f"DAY {date} ends, display forum messages...")
+        for agent, (_, message) in zip(all_agents, evening):
+            ctx.log.logger.info("Agent {} says: {}".format(agent.order, message))
             last_day_forum_message.append({"name": agent.order, "message": message})
 
-    log.logger.debug("--------Simulation finished!--------")
-    log.logger.debug("--------Agents action history--------")
+    ctx.log.logger.debug("--------Simulation finished!--------")
+    ctx.log.logger.debug("--------Agents action history--------")
+    for agent in all_agents:
+        history = agent.action_history
+        ctx.log.logger.debug(f"Agent {agent.order}: {len(history)} orders and fills, "
+                             f"realized {float(history.realized.sum()):.2f}, "
+                             f"unrealized {float(history.unrealized(market.prices).sum()):.2f}")
+    ctx.log.logger.info(f"Forced liquidation orders: {risk.submitted}, sold directly to the market: {risk.direct}")
+    if len(population):
+        history = [account.action_history for account in population.accounts]
+        ctx.log.logger.info(f"Followers: {len(population)}, orders {population.submitted}, "
+                            f"fills {sum(len(h) for h in history)}, "
+                            f"realized {sum(float(h.realized.sum()) for h in history):.2f}")
+    ctx.log.logger.info("Model calls: {}, skipped: {}, streams stopped early: {}".format(
+        dict(ctx.model_calls), dict(ctx.skipped_calls), dict(ctx.early_stops)))
+    if ctx.deadline_calls:
+        ctx.log.logger.info("Deadline fallbacks: " + ", ".join(
+            f"{kind} {ctx.fallbacks[kind]}/{n}" for kind, n in ctx.deadline_calls.items()))
+    if ctx.unavailable:
+        ctx.log.logger.warning(f"Fallbacks while the model backend was unavailable: {dict(ctx.unavailable)}")
+    if ctx.profiler is not None:
+        ctx.log.logger.info("Prompt sizes by block and input:\n" + ctx.profiler.report())
+    if ctx.replay is not None and ctx.replay.missing:
+        ctx.log.logger.warning(f"{ctx.replay.missing} decisions were not in the replay log and defaulted to no.")
+    ctx.close()
+
+
+def run_until_unavailable(ctx, timeline):
+    try:
+        run_simulation(ctx, timeline)
+    except BackendUnavailable as e:
+        # 熔断：在当前交易阶段停止，已完成阶段的记录和决策日志照常写出，不把无人交易的市场当作结果
+        ctx.log.logger.error(f"Model backend unavailable, run stopped: {e}")
+        ctx.close()
+        raise
+
+
+def simulation(args):
+    timeline = Timeline.from_file(args.scenario)
+    overrides = dict(MATCHING_MODE=args.matching, PROFILE_PROMPTS=args.profile_prompts, RECORD_SINK=args.sink,
+                     CHEAP_MODEL=args.cheap_model, STREAM_RESPONSES=args.stream, BREAKER_ON_OPEN=args.on_unavailable,
+                     FOLLOWERS_NUM=args.followers)
+    if args.deadline is not None:
+        overrides["DECISION_DEADLINES"] = dict.fromkeys(util.DECISION_DEADLINES, args.deadline)
+    if args.replay:
+        # 不调用模型，按决策日志重跑；撮合方式、利率等可与原始运行不同
+        res_dir = args.res_dir or os.path.join(os.path.dirname(args.replay), "replay")
+        run_simulation(SimulationContext.for_replay(args.replay, res_dir, run_name=args.run_name, **overrides),
+                       timeline)
+        return
+    if args.runs == 1:
+        run_until_unavailable(SimulationContext(args.model, config=Config(**overrides), seed=args.seed,
+                                                run_name=args.run_name, res_dir=args.res_dir or "res"),
+                              timeline)
+        return
+
+    # 多个相互隔离的模拟在同一进程中并行运行，共享同一个 API 连接池
+    contexts = [SimulationContext.for_run(args.model, i, seed=args.seed, res_dir=args.res_dir or "res", **overrides)
+                for i in range(args.runs)]
+    with ThreadPoolExecutor(max_workers=args.runs) as executor:
+        for future in [executor.submit(run_until_unavailable, ctx, timeline) for ctx in contexts]:
+            future.result()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--model", type=str, default="gpt-3.5-turbo-ca", help="model name")
+    parser.add_argument("--cheap-model", type=str, default=util.CHEAP_MODEL,
+                        help="model for estimates, forum posts and format retries (default: --model)")
+    parser.add_argument("--followers", type=int, default=util.FOLLOWERS_NUM,
+                        help="rule-based followers trading next to the model-driven agents, without model calls")
+    parser.add_argument("--scenario", type=str, default=util.SCENARIO_FILE, help="market event scenario file")
+    parser.add_argument("--runs", type=int, default=1, help="number of simulations run side by side")
+    parser.add_argument("--seed", type=int, default=None, help="random seed of the (first) simulation")
+    parser.add_argument("--run-name", type=str, default="",
+                        help="name of a single run: its log file and SQLite table prefix (default: seed{seed})")
+    parser.add_argument("--matching", type=str, default=util.MATCHING_MODE, choices=["continuous", "auction"],
+                        help="continuous matching or one call auction per session")
+    parser.add_argument("--sink", type=str, default=util.RECORD_SINK, choices=SINKS,
+                        help="write records to xlsx files or to a SQLite database (records.db)")
+    parser.add_argument("--on-unavailable", type=str, default=util.BREAKER_ON_OPEN, choices=["fail", "wait"],
+                        help="when the model backend keeps failing: stop the run, or pause until it recovers")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="seconds every decision may take before the fallback policy decides instead")
+    parser.add_argument("--stream", action="store_true", default=util.STREAM_RESPONSES,
+                        help="stream answers and stop as soon as the decision JSON is complete")
+    parser.add_argument("--profile-prompts", action="store_true", default=util.PROFILE_PROMPTS,
+                        help="log the characters and tokens of every prompt block and input at the end of the run")
+    parser.add_argument("--replay", type=str, default=None,
+                        help="re-run the decisions.jsonl of an earlier run without calling the model")
+    parser.add_argument("--res-dir", type=str, default=None,
+                        help="output directory (default: res, or replay/ next to the replayed log)")
 
     args = parser.parse_args()
 
@@ -0,0 +1,306 @@
+import json
+
+import numpy as np
+
+from auction import allocate, clearing_price, pair_fills
+from record import create_trade_record
+from stock import Stock
+
+
+class OpenOrders:
+    """Resting orders of all books, by order id and by agent."""
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_agent = {}
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def add(self, order):
+        self.by_id[order["id"]] = order
+        self.by_agent.setdefault(order["agent"], {})[order["id"]] = order
+
+    def remove(self, order):
+        del self.by_id[order["id"]]
+        orders = self.by_agent[order["agent"]]
+        del orders[order["id"]]
+        if not orders:
+            del self.by_agent[order["agent"]]
+
+    def of(self, agent):
+        """{id: order} of one agent's resting orders."""
+        return self.by_agent.get(agent, {})
+
+    def clear(self):
+        self.by_id.clear()
+        self.by_agent.clear()
+
+
+class OrderBook:
+    def __init__(self, index, stock, open_orders):
+        self.index = index  # 股票在 Market.tickers 中的下标
+        self.stock = stock
+        self.deals = {"sell": [], "buy": []}
+        self.open_orders = open_orders
+
+    def is_empty(self):
+        return not self.deals["sell"] and not self.deals["buy"]
+
+    def best_bid(self):
+        """Highest resting buy price, or None."""
+        return max((order["price"] for order in self.deals["buy"]), default=None)
+
+    def text(self):
+        """Resting orders as side, amount and price only; ids, owners and flags stay out of the prompts."""
+        return ", ".join(f"{side} {order['amount']} at {order['price']}"
+                         for side in ("sell", "buy") for order in self.deals[side])
+
+    def clear(self):
+        for side in self.deals.values():
+            for order in side:
+                self.open_orders.remove(order)
+            side.clear()
+
+    def rest(self, order):
+        self.deals[order["action_type"]].append(order)
+        self.open_orders.add(order)
+
+    def remove(self, order):
+        self.deals[order["action_type"]].remove(order)
+        self.open_orders.remove(order)
+
+    def expire(self, tif):
+        """Remove the resting orders with the given time in force."""
+        for side, orders in self.deals.items():
+            expired = [order for order in orders if order["tif"] == tif]
+            for order in expired:
+                self.open_orders.remove(order)
+            if expired:
+                self.deals[side] = [order for order in orders if order["tif"] != tif]
+
+    def handle_action(self, ctx, action, settlement, session):
+        """Match an incoming order against the resting orders at its price; the remainder rests in the book."""
+        stock = self.stock
+        side = action["action_type"]
+        opposite = "sell" if side == "buy" else "buy"
+        for resting in self.deals[opposite][:]:
+            if action["price"] != resting["price"]:
+                continue
+            buy_action, sell_action = (action, resting) if side == "buy" else (resting, action)
+            close_amount = min(action["amount"], resting["amount"])
+            failed = settlement.check(buy_action["agent"], sell_action["agent"], self.index, action["price"],
+                                      close_amount)
+            if opposite in failed:
+                # 挂单方已无法付款或交割（本阶段已有其他成交，或已退出市场），撤销该挂单
+                ctx.log.logger.warning(f"Order {resting['id']} of agent {resting['agent']} cannot settle, cancelled.")
+                self.remove(resting)
+            if side in failed:
+                ctx.log.logger.warning(f"Order {action['id']} of agent {action['agent']} cannot settle, rejected.")
+                return
+            if failed:
+                continue
+
+            settlement.record(action["date"], session, self.index, buy_action["agent"], sell_action["agent"],
+                              action["price"], close_amount, sell_action.get("liquidation", False))
+            stock.add_fill(action["date"], session, action["price"], close_amount)
+            create_trade_record(ctx, action["date"], session, stock.name, buy_action["agent"],
+                                sell_action["agent"], close_amount, action["price"])
+            ctx.log.logger.info(f"ACTION - BUY:{buy_action['agent']}, SELL:{sell_action['agent']}, "
+                                f"STOCK:{stock.name}, PRICE:{action['price']}, AMOUNT:{close_amount}")
+            action["amount"] -= close_amount
+            resting["amount"] -= close_amount
+            if resting["amount"] == 0:
+                self.remove(resting)
+            if action["amount"] == 0:
+                return
+        self.rest(action)
+
+    def call_auction(self, ctx, settlement, date, session, method):
+        """Clear every crossing order of the book at one uniform price."""
+        stock, stock_deals = self.stock, self.deals
+        price, volume = clearing_price(stock_deals["buy"], stock_deals["sell"], stock.get_price())
+        if volume == 0:
+            return
+
+        buy_fills = allocate([order for order in stock_deals["buy"] if order["price"] >= price], volume,
+                             lambda order: -order["price"], method)
+        sell_fills = allocate([order for order in stock_deals["sell"] if order["price"] <= price], volume,
+                              lambda order: order["price"], method)
+        for buy_action, sell_action, close_amount in pair_fills(buy_fills, sell_fills):
+            if buy_action["amount"] < close_amount or sell_action["amount"] < close_amount:
+                continue  # 其中一方已因无法结算被撤销
+            failed = settlement.check(buy_action["agent"], sell_action["agent"], self.index, price, close_amount)
+            for order in (buy_action, sell_action):
+                if order["action_type"] in failed:
+                    ctx.log.logger.warning(f"Order {order['id']} of agent {order['agent']} cannot settle, "
+                                           f"cancelled.")
+                    order["amount"] = 0
+            if failed:
+                continue
+
+            settlement.record(date, session, self.index, buy_action["agent"], sell_action["agent"], price,
+                              close_amount, sell_action.get("liquidation", False))
+            stock.add_fill(date, session, price, close_amount)
+            create_trade_record(ctx, date, session, stock.name, buy_action["agent"], sell_action["agent"],
+                                close_amount, price)
+            ctx.log.logger.info(f"AUCTION - BUY:{buy_action['agent']}, SELL:{sell_action['agent']}, "
+                                f"STOCK:{stock.name}, PRICE:{price}, AMOUNT:{close_amount}")
+            buy_action["amount"] -= close_amount
+            sell_action["amount"] -= close_amount
+
+        # 未成交的剩余挂单留在盘口，参与本交易日后续阶段的集合竞价（按有效期）
+        for side in ("buy", "sell"):
+            for order in stock_deals[side]:
+                if order["amount"] == 0:
+                    self.open_orders.remove(order)
+            stock_deals[side] = [order for order in stock_deals[side] if order["amount"] > 0]
+
+
+class Market:
+    """The ticker universe of one run, with one order book per ticker.
+
+    Only tickers that received orders today are "active": matching, price updates and the order book
+    section of the prompt only touch those, so a large universe costs nothing while it is quiet.
+    """
+
+    def __init__(self, ctx, stocks):
+        self.ctx = ctx
+        self.tickers = list(stocks)
+        self.index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.stocks = [Stock(ctx, ticker, price, 0, is_new=False) for ticker, price in stocks.items()]
+        self.open_orders = OpenOrders()
+        self.books = [OrderBook(i, stock, self.open_orders) for i, stock in enumerate(self.stocks)]
+        self.prices = np.array([stock.get_price() for stock in self.stocks], dtype=float)
+        self.active = set()  # 今日有挂单的股票下标
+        self.next_id = 0  # 挂单编号，按到达顺序递增，集合竞价按时间优先分配时使用
+        self._prices_text = None
+        self._books_text = None
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def stock(self, ticker):
+        return self.stocks[self.index[ticker]]
+
+    def get_price(self, ticker):
+        return self.prices[self.index[ticker]]
+
+    def price_dict(self):
+        return {ticker: self.prices[i].item() for i, ticker in enumerate(self.tickers)}
+
+    def _new_order(self, action):
+        # 新挂单（含改单后的挂单）取得新的编号，排在同价位已有挂单之后
+        action["id"] = self.next_id
+        self.next_id += 1
+        action.setdefault("tif", self.ctx.config.DEFAULT_TIME_IN_FORCE)
+        i = self.index[action["stock"]]
+        self.active.add(i)
+        self._books_text = None
+        return i
+
+    def cancel(self, order_id):
+        """Remove a resting order, if it is still in the book."""
+        order = self.open_orders.by_id.get(order_id)
+        if order is not None:
+            self.books[self.index[order["stock"]]].remove(order)
+            self._books_text = None
+        return order
+
+    def _amend(self, action):
+        """Apply a cancel or replace; a replace returns the new order to enter, otherwise None."""
+        order = self.open_orders.by_id.get(action.get("order_id"))
+        if order is None or order["agent"] != action["agent"]:
+            self.ctx.log.logger.warning(f"Agent {action['agent']} cannot {action['action_type']} "
+                                        f"order {action.get('order_id')}: not an open order of the agent.")
+            return None
+        self.cancel(order["id"])
+        if action["action_type"] == "cancel":
+            return None
+        return {"action_type": order["action_type"], "stock": order["stock"], "amount": action["amount"],
+                "price": action["price"], "tif": order["tif"], "agent": order["agent"], "date": action["date"]}
+
+    def handle_action(self, action, settlement, session):
+        if action["action_type"] in ("cancel", "replace"):
+            action = self._amend(action)
+            if action is None:
+                return
+        i = self._new_order(action)
+        self.books[i].handle_action(self.ctx, action, settlement, session)
+
+    def submit(self, action):
+        """Queue an order (or apply a cancel / replace) for the session's call auction without matching it."""
+        if action["action_type"] in ("cancel", "replace"):
+            action = self._amend(action)
+            if action is None:
+                return
+        i = self._new_order(action)
+        self.books[i].rest(action)
+
+    def end_session(self):
+        """Expire the orders that were only good for the session."""
+        for i in self.active:
+            self.books[i].expire("session")
+        self._books_text = None
+
+    def call_auction(self, settlement, date, session):
+        for i in sorted(self.active):
+            self.books[i].call_auction(self.ctx, settlement, date, session, self.ctx.config.AUCTION_ALLOCATION)
+        self._books_text = None
+
+    def update_prices(self, date, session):
+        for i in self.active:
+            self.stocks[i].update_price(date, session)
+            self.prices[i] = self.stocks[i].get_price()
+        self._prices_text = None
+
+    def new_day(self):
+        for i in self.active:
+            self.books[i].clear()
+        self.active.clear()
+        self._books_text = None
+
+    def prices_text(self):
+        # 同一时段内所有交易员共用同一份文本
+        if self._prices_text is None:
+            self._prices_text = ", ".join(f"Company {ticker}: {self.prices[i].item()} dollars per share"
+                                          for i, ticker in enumerate(self.tickers))
+        return self._prices_text
+
+    def books_text(self):
+        if self._books_text is None:
+            books = [f"stock {self.tickers[i]}: {self.books[i].text()}"
+                     for i in sorted(self.active) if not self.books[i].is_empty()]
+            self._books_text = "; ".join(books) if books else "no open orders"
+        return self._books_text
+
+    def holdings_text(self, holdings):
+        held = np.flatnonzero(holdings)
+        if len(held) == 0:
+            return "no shares of any company"
+        return ", ".join(f"{holdings[i]} shares of Company {self.tickers[i]}" for i in held)
+
+    def open_orders_text(self, agent):
+        orders = self.open_orders.of(agent)
+        if not orders:
+            return "You have no open orders."
+        listed = ", ".join(f"#{order_id} {order['action_type']} {order['amount']} shares of {order['stock']} "
+                           f"at {order['price']} (good for the {order['tif']})" for order_id, order in orders.items())
+        # 示例用第一笔挂单自己的编号、数量和价格
+        first, order = next(iter(orders.items()))
+        return (f"Your open orders are: {listed}. To cancel one of them, answer "
+                f'{{"action_type": "cancel", "order_id": {first}}}; to change its amount and price, answer '
+                f'{{"action_type": "replace", "order_id": {first}, "amount": {order["amount"]}, '
+                f'"price": {order["price"]}}} with the new values.')
+
+    def stock_choices(self, holdings=None):
+        """Tickers an order may name; only the held ones if holdings is given."""
+        if holdings is None:
+            return "|".join(f'"{ticker}"' for ticker in self.tickers)
+        return "|".join(f'"{self.tickers[i]}"' for i in np.flatnonzero(holdings))
+
+    def reports_text(self, reports):
+        return "\n".join(f"Stock {ticker}: {reports[ticker]}" for ticker in self.tickers if ticker in reports)
+
+    def estimate_example(self):
+        return json.dumps({"buy": [self.tickers[0]], "sell": [self.tickers[-1]], "loan": "yes"})
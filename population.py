@@ -0,0 +1,124 @@
+import numpy as np
+
+from agent import ActionLog
+
+STRATEGIES = ["momentum", "mean_reversion", "noise", "sentiment"]
+
+
+class Follower:
+    """Account of one rule-based trader; its cash and holdings are rows of the Population's arrays."""
+
+    __slots__ = ("population", "index", "order", "quit", "action_history")
+
+    def __init__(self, population, index, order, prices):
+        self.population = population
+        self.index = index
+        self.order = order
+        self.quit = False
+        self.action_history = ActionLog(self.holdings, prices, capacity=4)
+
+    @property
+    def cash(self):
+        return self.population.cash[self.index].item()
+
+    @cash.setter
+    def cash(self, value):
+        self.population.cash[self.index] = value
+
+    @property
+    def holdings(self):
+        return self.population.holdings[self.index]
+
+    def get_total_loan(self):
+        return 0.0
+
+
+class Population:
+    """Rule-based followers that trade in the same books as the model-driven agents, without model calls.
+
+    Every follower runs one strategy of STRATEGIES with its own threshold, order size and price offset.
+    Each session all of them decide in one vectorized pass: a follower is active with probability
+    FOLLOWER_ACTIVITY, looks at one random stock and trades it if its strategy's signal passes the
+    threshold. Signals per stock: momentum follows the return over the last FOLLOWER_LOOKBACK sessions,
+    mean reversion bets on the distance to their average close, sentiment follows the share of agents
+    planning to buy minus the share planning to sell (their evening estimates), noise trades at random.
+    """
+
+    def __init__(self, ctx, market, first_order, size):
+        config = ctx.config
+        self.ctx = ctx
+        self.rng = np.random.default_rng(ctx.seed)  # 与 ctx.rng 相互独立，不改变交易员的随机序列
+        n, s = size, len(market.tickers)
+        mix = np.array([config.FOLLOWER_MIX.get(name, 0.0) for name in STRATEGIES], dtype=float)
+        self.strategy = self.rng.choice(len(STRATEGIES), size=n, p=mix / mix.sum())
+        self.threshold = self.rng.uniform(0, config.FOLLOWER_MAX_THRESHOLD, n)
+        self.fraction = self.rng.uniform(0, config.FOLLOWER_MAX_FRACTION, n)  # 每笔下单动用的现金或持仓比例
+        self.offset = self.rng.uniform(0, config.FOLLOWER_MAX_OFFSET, n)  # 买单加价、卖单让价的比例
+
+        # 初始财产与交易员同分布，随机分配到现金和各只股票，没有贷款
+        wealth = self.rng.uniform(config.MIN_INITIAL_PROPERTY, config.MAX_INITIAL_PROPERTY, n)
+        split = self.rng.dirichlet(np.ones(s + 1), n)
+        self.cash = wealth * split[:, 0]
+        self.holdings = np.floor(wealth[:, None] * split[:, 1:] / market.prices).astype(np.int64)
+        self.tickers = market.tickers
+        self.sentiment = np.zeros(s)
+        self.accounts = [Follower(self, i, first_order + i, market.prices) for i in range(n)]
+        self.first_order = first_order
+        self.submitted = 0
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def observe(self, estimates):
+        """Take the agents' estimates for the next day as the sentiment signal."""
+        if not estimates:
+            return
+        index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        sentiment = np.zeros(len(self.sentiment))
+        for estimate in estimates:
+            for ticker in estimate.get("buy", []):
+                if ticker in index:
+                    sentiment[index[ticker]] += 1
+            for ticker in estimate.get("sell", []):
+                if ticker in index:
+                    sentiment[index[ticker]] -= 1
+        self.sentiment = sentiment / len(estimates)
+
+    def signals(self, market):
+        """(strategies, stocks) array of signals; positive means buy."""
+        lookback = self.ctx.config.FOLLOWER_LOOKBACK
+        signals = np.zeros((len(STRATEGIES), len(market.tickers)))
+        for i, stock in enumerate(market.stocks):
+            close = stock.bars.bars["close"][-lookback - 1:]
+            if len(close) > 1:
+                signals[0, i] = close[-1] / close[0] - 1
+                average = close[1:].mean()
+                signals[1, i] = average / market.prices[i] - 1
+        signals[3] = self.sentiment
+        return signals
+
+    def decide(self, market, date, session):
+        """Orders of the followers that trade this session; they are only good for the session."""
+        rng = self.rng
+        n = len(self.accounts)
+        stock = rng.integers(0, len(market.tickers), n)
+        signal = self.signals(market)[self.strategy, stock]
+        side = np.where(signal > self.threshold, 1, np.where(signal < -self.threshold, -1, 0))
+        noise = self.strategy == STRATEGIES.index("noise")
+        side[noise] = rng.choice([-1, 1], int(noise.sum()))
+
+        active = (rng.random(n) < self.ctx.config.FOLLOWER_ACTIVITY) & (side != 0)
+        active &= ~np.fromiter((account.quit for account in self.accounts), bool, n)
+        price = np.round(market.prices[stock] * (1 + side * self.offset), 2)
+        held = self.holdings[np.arange(n), stock]
+        amount = np.where(side > 0, np.floor(self.cash * self.fraction / price),
+                          np.ceil(held * self.fraction)).astype(np.int64)
+        active &= amount > 0
+
+        orders = []
+        for k in np.flatnonzero(active):
+            orders.append({"action_type": "buy" if side[k] > 0 else "sell", "stock": market.tickers[stock[k]],
+                           "amount": int(amount[k]), "price": price[k].item(), "agent": self.first_order + int(k),
+                           "date": date, "tif": "session"})
+        self.submitted += len(orders)
+        return orders
@@ -12,7 +12,7 @@ BACKGROUND_PROMPT = NamedBlock(
     name="Background",
     content="""
         You are a stock trader, and next you will simulate interactions with other traders in the market.
-        There are two stocks in the market, A and B, where B is the newly listed stock. 
+        There are {stock_count} stocks in the market: {stock_names}. 
         Next, please complete your trading actions according to the order.
     """
 )
@@ -29,8 +29,7 @@ BACKGROUND_PROMPT = NamedBlock(
 LASTDAY_FORUM_AND_STOCK_PROMPT = NamedBlock(
     name="Last Day Forum and Stock",
     content="""
-        After the close of trading yesterday, the stock prices of Company A and Company B 
-        were {stock_a_price} dollars per share and {stock_b_price} dollars per share, respectively. 
+        After the close of trading yesterday, the stock prices were: {stock_prices}. 
         Posts by other traders on the forum are as follows: {lastday_forum_message}
     """
 )
@@ -73,7 +72,7 @@ DECIDE_IF_LOAN_PROMPT = NamedBlock(
     name="Instruction",
     content="""
     It is the {date} day, and your current character is {character}. 
-    You hold {stock_a} shares of Company A, {stock_b} shares of Company B,
+    You hold {holdings},
     Now you have {cash} dollars in cash and {debt} in your loan situation.
     You need to decide whether to continue the loan and the amount of the loan.
     The alternative type is {loan_type_prompt}, and you should use the number to select a loan type. 
@@ -127,16 +126,18 @@ DECIDE_BUY_STOCK_PROMPT = NamedBlock(
     name="Instruction",
     content="""
     It is the {time} trading session on the {date} day, and after the previous session, 
-    the stock price of Company A is {stock_a_price} and the stock price of Company B is {stock_b_price}.
-    In the current session, the buy and sell order of stock A is {stock_a_deals}, 
-    and the buy and sell order of stock B is {stock_b_deals}
-    You currently hold {stock_a} shares of Company A, {stock_b} shares of Company B, and {cash} yuan in cash.
-    You need to decide whether to buy/sell shares of Company A or Company B, and how much to buy/sell and at what price.
+    the stock prices are: {stock_prices}.
+    In the current session, the buy and sell orders are: {order_books}
+    {open_orders}
+    You currently hold {holdings}, and {cash} yuan in cash.
+    You need to decide whether to buy/sell shares of one company, and how much to buy/sell and at what price.
     You can refer to the current share price and the market to determine the price yourself, not the current share price. 
     The quantity must be an integer.
     We encourage you to buy and sell more. You can only answer one json action.
     Return the result as json, for example:
-    {{"action_type":"buy"|"sell", "stock":"A"|"B", amount: 100, price : 30.1}}
+    {{"action_type":{action_choices}, "stock":{stock_choices}, amount: 100, price : 30.1}}
+    An order that is not filled stays in the order book. You can add "tif": "session" to cancel it when this session ends,
+    or "tif": "day" to keep it until the end of the day; without "tif" it is {tif_default}.
     If neither buy nor sell, return:
     {{"action_type" : "no"}}
     """
@@ -158,7 +159,9 @@ BUY_STOCK_RETRY_PROMPT = NamedBlock(
     content="""
     The following questions appeared in the action format you last answered: {fail_response}.
     You should return the result as json, for example:
-    {{"action_type":"buy"|"sell", "stock":"A"|"B", amount: 100, price: 30.1}}
+    {{"action_type":{action_choices}, "stock":{stock_choices}, amount: 100, price: 30.1}}
+    The optional key "tif" is "session" (cancel the order when this session ends) or "day" (keep it until the end of
+    the day); without "tif" it is {tif_default}.
     If neither buy nor sell, return:
     {{"action_type" : "no"}}
     Please answer again. You can only answer one json action.
@@ -226,10 +229,9 @@ FIRST_DAY_BACKGROUND_KNOWLEDGE = NamedBlock(
 
 SEASONAL_FINANCIAL_REPORT = NamedVariable(
     refname="seasonal_financial_report",
-    name="The Seasonal financial report of Stock A and B",
+    name="The Seasonal financial report",
     content="""
-        Stock A: {stock_a_report}
-        Stock B: {stock_b_report}
+        {stock_reports}
     """
 )
 
@@ -264,10 +266,11 @@ NEXT_DAY_ESTIMATE_PROMPT = NamedBlock(
     name="Instruction",
     content="""
     Based on the market information and forum information of the current trading day, 
-    please estimate whether you will buy and sell stock A and stock B tomorrow, and whether you will choose loan.
-    Actions that are expected to take place are marked yes, and actions that will not take place are marked no. 
+    please estimate which stocks you will buy and sell tomorrow, and whether you will choose loan.
+    List the stocks you expect to buy under "buy" and the stocks you expect to sell under "sell".
+    Mark loan yes if you expect to take a loan, and no otherwise. 
     Return the result in json format, for example:
-    {{"buy_A":"yes", "buy_B":"no", "sell_A":"yes", "sell_B": "no", "loan": "yes"}}
+    {estimate_example}
     """
 )
 
@@ -287,6 +290,23 @@ NEXT_DAY_ESTIMATE_RETRY = NamedBlock(
     content="""
     The following questions appeared in the JSON format you last answered: {fail_response}.
     Return the result in json format, for example:
-    {{"buy_A":"yes", "buy_B":"no", "sell_A":"yes", "sell_B": "no", "loan": "yes"}}
+    {estimate_example}
     """
-)
\ No newline at end of file
+)
+
+# 完整的提示词组合只构建一次，各模块的渲染缓存在多次调用间复用
+FIRST_DAY_LOAN_PROMPT = Collection(BACKGROUND_PROMPT,
+                                   LOAN_TYPE_PROMPT,
+                                   DECIDE_IF_LOAN_PROMPT).set_indexing_method(sharp2_indexing).set_sep("\n")
+
+LOAN_PROMPT = Collection(BACKGROUND_PROMPT,
+                         LASTDAY_FORUM_AND_STOCK_PROMPT,
+                         LOAN_TYPE_PROMPT,
+                         DECIDE_IF_LOAN_PROMPT).set_indexing_method(sharp2_indexing).set_sep("\n")
+
+REPORT_SESSION_STOCK_PROMPT = Collection(FIRST_DAY_FINANCIAL_REPORT, FIRST_DAY_BACKGROUND_KNOWLEDGE,
+                                         SEASONAL_FINANCIAL_REPORT,
+                                         DECIDE_BUY_STOCK_PROMPT).set_indexing_method(sharp2_indexing).set_sep("\n")
+
+FIRST_SESSION_STOCK_PROMPT = Collection(FIRST_DAY_FINANCIAL_REPORT, FIRST_DAY_BACKGROUND_KNOWLEDGE,
+                                        DECIDE_BUY_STOCK_PROMPT).set_indexing_method(sharp2_indexing).set_sep("\n")
@@ -1,8 +1,116 @@
-import pandas as pd
 import os
+import re
+import sqlite3
+import threading
+
+# pandas/openpyxl 只在写 xlsx 时才导入（见各 write_to_excel），使用 SQLite 或不写记录时不必加载
+SINKS = ["excel", "sqlite"]
+
+
+class ExcelSink:
+    """Writes records to the xlsx files of one run directory."""
+
+    def __init__(self, res_dir="res"):
+        self.res_dir = res_dir
+        os.makedirs(res_dir, exist_ok=True)
+
+    def write(self, record):
+        record.write_to_excel(os.path.join(self.res_dir, record.FILE_NAME))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# 表结构：(列定义, 索引列)；每次运行的表名带有各自的前缀
+SQLITE_TABLES = {
+    "trades": ("date INTEGER, session INTEGER, stock TEXT, buyer INTEGER, seller INTEGER, amount INTEGER, price REAL",
+               [("date", "session"), ("buyer",), ("seller",), ("stock",)]),
+    "stocks": ("date INTEGER, session INTEGER, stock TEXT, price REAL",
+               [("date", "session"), ("stock",)]),
+    "agent_day": ("agent INTEGER, date INTEGER, loan TEXT, loan_type INTEGER, loan_amount REAL, "
+                  "will_loan TEXT, will_buy TEXT, will_sell TEXT",
+                  [("date",), ("agent",)]),
+    "agent_session": ("agent INTEGER, date INTEGER, session INTEGER, proper REAL, cash REAL, "
+                      "action_type TEXT, action_stock TEXT, amount INTEGER, price REAL",
+                      [("date", "session"), ("agent",), ("action_stock",)]),
+    "agent_session_values": ("agent INTEGER, date INTEGER, session INTEGER, stock TEXT, value REAL",
+                             [("date", "session"), ("agent",), ("stock",)]),
+}
+
+
+class SQLiteSink:
+    """Writes records to run-prefixed tables of a SQLite database in WAL mode.
+
+    Rows are buffered and inserted by flush(), which the engine calls once per session, in a single
+    transaction. Several processes can write their own runs into the same database file; a sink never
+    appends to the tables of another run, it raises FileExistsError if its prefix is already taken.
+    """
+
+    def __init__(self, path, prefix=""):
+        self.path = path
+        self.prefix = re.sub(r"\W", "_", prefix) + "_" if prefix else ""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 同一进程内的多个模拟在各自的线程中写入，连接由锁保护
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.pending = {table: [] for table in SQLITE_TABLES}
+        # 检查与建表在同一个写事务中，两个进程用同一前缀时只有一个能建表
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = [table for table in SQLITE_TABLES if self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.prefix + table,)).fetchone()]
+            if existing:
+                raise FileExistsError(f"{path} already has tables of run {prefix!r} ({', '.join(existing)}); "
+                                      f"give this run another name (--run-name) or database")
+            for table, (columns, indexes) in SQLITE_TABLES.items():
+                name = self.prefix + table
+                self.conn.execute(f"CREATE TABLE {name} ({columns})")
+                for index in indexes:
+                    self.conn.execute(f"CREATE INDEX {name}_{'_'.join(index)} ON {name} ({', '.join(index)})")
+        except BaseException:
+            self.conn.rollback()
+            self.conn.close()
+            raise
+        self.conn.commit()
+
+    def write(self, record):
+        with self.lock:
+            for table, rows in record.sql_rows().items():
+                self.pending[table].extend(rows)
+
+    def flush(self):
+        with self.lock:
+            if not any(self.pending.values()):
+                return
+            with self.conn:
+                for table, rows in self.pending.items():
+                    if rows:
+                        marks = ", ".join("?" * len(rows[0]))
+                        self.conn.executemany(f"INSERT INTO {self.prefix}{table} VALUES ({marks})", rows)
+                        rows.clear()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+
+def create_sink(kind, res_dir, prefix=""):
+    if kind == "excel":
+        return ExcelSink(res_dir)
+    if kind == "sqlite":
+        return SQLiteSink(os.path.join(res_dir, "records.db"), prefix)
+    raise ValueError(f"Unknown record sink {kind}, should be one of {SINKS}")
 
 
 class TradeRecord:
+    FILE_NAME = "trades.xlsx"
+
     def __init__(self, date, session, stock_type, buyer, seller, quantity, price):
         self.date = date
         self.session = session
@@ -13,6 +121,7 @@ class TradeRecord:
         self.price = price
 
     def write_to_excel(self, file_name="res/trades.xlsx"):
+        import pandas as pd
         if os.path.isfile(file_name):
             existing_df = pd.read_excel(file_name)
         else:
@@ -23,39 +132,50 @@ class TradeRecord:
         all_records_df = pd.concat([existing_df, new_df], ignore_index=True)
         all_records_df.to_excel(file_name, index=False)
 
+    def sql_rows(self):
+        return {"trades": [(self.date, self.session, self.stock_type, self.buyer, self.seller,
+                            int(self.quantity), float(self.price))]}
+
 
-def create_trade_record(date, stage, stock, buy_trader, sell_trader, amount, price):
+def create_trade_record(ctx, date, stage, stock, buy_trader, sell_trader, amount, price):
     record = TradeRecord(date, stage, stock, buy_trader, sell_trader, amount, price)
-    record.write_to_excel()
+    ctx.sink.write(record)
     record = None
 
 
 class StockRecord:
-    def __init__(self, date, session, stock_a_price, stock_b_price):
+    FILE_NAME = "stocks.xlsx"
+
+    def __init__(self, date, session, prices):
         self.date = date
         self.session = session
-        self.stock_a_price = stock_a_price
-        self.stock_b_price = stock_b_price
+        self.prices = prices  # {stock: price}
 
     def write_to_excel(self, file_name="res/stocks.xlsx"):
+        import pandas as pd
         if os.path.isfile(file_name):
             existing_df = pd.read_excel(file_name)
         else:
             existing_df = pd.DataFrame(
-                columns=["交易日", "第几个交易阶段", "阶段结束后股票A价格", "阶段结束后股票B价格"])
-        new_records = [[self.date, self.session, self.stock_a_price, self.stock_b_price]]
+                columns=["交易日", "第几个交易阶段"] + [f"阶段结束后股票{stock}价格" for stock in self.prices])
+        new_records = [[self.date, self.session] + list(self.prices.values())]
         new_df = pd.DataFrame(new_records, columns=existing_df.columns)
         all_records_df = pd.concat([existing_df, new_df], ignore_index=True)
         all_records_df.to_excel(file_name, index=False)
 
+    def sql_rows(self):
+        return {"stocks": [(self.date, self.session, stock, float(price)) for stock, price in self.prices.items()]}
+
 
-def create_stock_record(date, session, stock_a_price, stock_b_price):
-    record = StockRecord(date, session, stock_a_price, stock_b_price)
-    record.write_to_excel()
+def create_stock_record(ctx, date, session, prices):
+    record = StockRecord(date, session, prices)
+    ctx.sink.write(record)
     record = None
 
 
 class AgentRecordDaily:
+    FILE_NAME = "agent_day_record.xlsx"
+
     def __init__(self, agent, date, loan_json):
         self.agent = agent
         self.date = date
@@ -66,72 +186,81 @@ class AgentRecordDaily:
             self.loan_type = loan_json["loan_type"]
             self.loan_amount = loan_json["amount"]
         self.will_loan = "no"
-        self.will_buy_a = "no"
-        self.will_sell_a = "no"
-        self.will_buy_b = "no"
-        self.will_sell_b = "no"
+        self.will_buy = "-"
+        self.will_sell = "-"
 
     def add_estimate(self, js):
         self.will_loan = js["loan"]
-        self.will_buy_a = js["buy_A"]
-        self.will_sell_a = js["sell_A"]
-        self.will_buy_b = js["buy_B"]
-        self.will_sell_b = js["sell_B"]
+        self.will_buy = ",".join(js["buy"]) or "-"
+        self.will_sell = ",".join(js["sell"]) or "-"
 
     def write_to_excel(self, file_name="res/agent_day_record.xlsx"):
+        import pandas as pd
         if os.path.isfile(file_name):
             existing_df = pd.read_excel(file_name)
         else:
             existing_df = pd.DataFrame(columns=["交易员", "交易日", "是否贷款", "贷款类型", "贷款数量",
-                                                "明日是否贷款", "明日是否买入A", "明日是否卖出A", "明日是否买入B",
-                                                "明日是否卖出B"])
+                                                "明日是否贷款", "明日计划买入", "明日计划卖出"])
         new_records = [[self.agent, self.date, self.if_loan, self.loan_type, self.loan_amount,
-                        self.will_loan, self.will_buy_a, self.will_sell_a, self.will_buy_b, self.will_sell_b]]
+                        self.will_loan, self.will_buy, self.will_sell]]
         new_df = pd.DataFrame(new_records, columns=existing_df.columns)
         all_records_df = pd.concat([existing_df, new_df], ignore_index=True)
         all_records_df.to_excel(file_name, index=False)
 
+    def sql_rows(self):
+        return {"agent_day": [(self.agent, self.date, self.if_loan, self.loan_type, self.loan_amount,
+                               self.will_loan, self.will_buy, self.will_sell)]}
 
-def create_agent_daily_recoder(agent, date, loan_json):
+
+def create_agent_daily_recoder(ctx, agent, date, loan_json):
     record = AgentRecordDaily(agent, date, loan_json)
-    record.write_to_excel()
+    ctx.sink.write(record)
     record = None
 
 
 class AgentRecordSession:
-    def __init__(self, agent, date, session, proper, cash, stock_a_value, stock_b_value, action_json):
+    FILE_NAME = "agent_session_record.xlsx"
+
+    def __init__(self, agent, date, session, proper, cash, stock_values, action_json):
         self.agent = agent
         self.date = date
         self.session = session
         self.proper = proper
         self.cash = cash
-        self.stock_a_value = stock_a_value
-        self.stock_b_value = stock_b_value
+        self.stock_values = stock_values  # {stock: value}
         self.action_stock = "-"
         self.amount = 0
         self.price = 0
         self.action_type = action_json["action_type"]
         if not self.action_type == "no":
-            self.action_stock = action_json["stock"]
-            self.amount = action_json["amount"]
-            self.price = action_json["price"]
+            # 撤单只有挂单编号
+            self.action_stock = action_json.get("stock", "-")
+            self.amount = action_json.get("amount", 0)
+            self.price = action_json.get("price", 0)
 
     def write_to_excel(self, file_name="res/agent_session_record.xlsx"):
+        import pandas as pd
         if os.path.isfile(file_name):
             existing_df = pd.read_excel(file_name)
         else:
-            existing_df = pd.DataFrame(columns=["交易员", "交易日", "交易阶段", "交易前资产总额",
-                                                "交易前持有现金", "交易前持有的A股价值", "交易前持有的B股价值",
-                                                "挂单类型", "挂单股票类别", "挂单数量", "挂单价格"])
-        new_records = [[self.agent, self.date, self.session, self.proper, self.cash,
-                        self.stock_a_value, self.stock_b_value, self.action_type, self.action_stock,
-                        self.amount, self.price]]
+            existing_df = pd.DataFrame(columns=["交易员", "交易日", "交易阶段", "交易前资产总额", "交易前持有现金"]
+                                       + [f"交易前持有的{stock}股价值" for stock in self.stock_values]
+                                       + ["挂单类型", "挂单股票类别", "挂单数量", "挂单价格"])
+        new_records = [[self.agent, self.date, self.session, self.proper, self.cash]
+                       + list(self.stock_values.values())
+                       + [self.action_type, self.action_stock, self.amount, self.price]]
         new_df = pd.DataFrame(new_records, columns=existing_df.columns)
         all_records_df = pd.concat([existing_df, new_df], ignore_index=True)
         all_records_df.to_excel(file_name, index=False)
 
+    def sql_rows(self):
+        return {"agent_session": [(self.agent, self.date, self.session, self.proper, self.cash,
+                                   self.action_type, self.action_stock, self.amount, self.price)],
+                "agent_session_values": [(self.agent, self.date, self.session, stock, float(value))
+                                         for stock, value in self.stock_values.items()]}
+
 
-def create_agentses_record(agent, date, session, proper, cash, stock_a_value, stock_b_value, action_json):
-    record = AgentRecordSession(agent, date, session, proper, cash, stock_a_value, stock_b_value, action_json)
-    record.write_to_excel()
+def create_agentses_record(ctx, agent, date, session, proper, cash, stock_values, action_json):
+    record = AgentRecordSession(agent, date, session, proper, cash, stock_values, action_json)
+    ctx.sink.write(record)
     record = None
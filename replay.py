@@ -0,0 +1,91 @@
+import copy
+import json
+import os
+import threading
+
+# 决定初始状态（随机初始化的交易员、股票池）以及不经模型决策的规则跟随者的设置，回放时必须与原始运行一致
+REPLAY_KEYS = ["AGENTS_NUM", "TOTAL_DATE", "TOTAL_SESSION", "STOCKS",
+               "MAX_INITIAL_PROPERTY", "MIN_INITIAL_PROPERTY", "LOAN_TYPE", "REPAYMENT_DAYS",
+               "FOLLOWERS_NUM", "FOLLOWER_MIX", "FOLLOWER_ACTIVITY", "FOLLOWER_LOOKBACK", "FOLLOWER_MAX_THRESHOLD",
+               "FOLLOWER_MAX_FRACTION", "FOLLOWER_MAX_OFFSET"]
+
+DECISION_KINDS = ["loan", "action", "estimate", "post", "order"]
+
+
+def _to_json(value):
+    # numpy 标量
+    return value.item()
+
+
+class DecisionLog:
+    """Append-only JSONL log of every decision of one run, enough to replay it without the model.
+
+    The first line holds the seed and the settings in REPLAY_KEYS; every other line is one decision:
+    {"kind", "date", "session", "agent", "decision"}. Session orders are logged as kind "order".
+    """
+
+    def __init__(self, path, ctx):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        try:
+            # 独占创建：不覆盖之前或同时运行的另一次运行的日志
+            self.file = open(path, "x", encoding="utf-8")
+        except FileExistsError:
+            raise FileExistsError(f"{path} already holds the decision log of another run; "
+                                  f"use another output directory (--res-dir)") from None
+        self._write({"kind": "run", "model": ctx.model, "seed": ctx.seed,
+                     "config": {key: getattr(ctx.config, key) for key in REPLAY_KEYS}})
+
+    def _write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, default=_to_json)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def record(self, kind, date, session, agent, decision):
+        self._write({"kind": kind, "date": date, "session": session, "agent": agent, "decision": decision})
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def discard(self):
+        """Close and delete the log of a run that could not start."""
+        self.close()
+        os.remove(self.path)
+
+
+class ReplaySource:
+    """Decisions of a recorded run, looked up by (kind, date, session, agent)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.decisions = {}
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("kind") != "run":
+                raise ValueError(f"{path} is not a decision log: missing run header")
+            self.model = header["model"]
+            self.seed = header["seed"]
+            self.config = header["config"]
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["kind"] not in DECISION_KINDS:
+                    raise ValueError(f"Unknown decision kind {entry['kind']} in {path}")
+                self.decisions[(entry["kind"], entry["date"], entry["session"], entry["agent"])] = entry["decision"]
+        self.missing = 0  # 回放中找不到记录、按默认决策处理的次数
+
+    def decision(self, kind, date, session, agent, default):
+        key = (kind, date, session, agent)
+        if key not in self.decisions:
+            # 反事实运行中原本破产退出的交易员可能继续存活，此时没有可回放的决策
+            self.missing += 1
+            return copy.deepcopy(default)
+        return copy.deepcopy(self.decisions[key])
+
+    def session_order(self, date, session):
+        """Agent orders in the sequence they were asked during the recorded session."""
+        return self.decisions.get(("order", date, session, -1), [])
@@ -0,0 +1,129 @@
+import numpy as np
+
+from record import create_trade_record
+
+
+class RiskEngine:
+    """Marks every account to market in one vectorized pass and liquidates the ones short of margin.
+
+    equity = cash + holdings @ prices - debt, leverage = holdings @ prices / equity. An account is short
+    when its cash is negative or its equity is below MAINTENANCE_MARGIN of its holdings' value; its
+    holdings are then sold through the order book, in ticker order, until the shortfall is covered.
+    An account whose cash and holdings together are negative is bankrupt and leaves the market.
+    """
+
+    def __init__(self, ctx, market, agents):
+        self.ctx = ctx
+        self.market = market
+        self.agents = agents  # 全部交易员，下标即编号
+        self.orders = {}  # {交易员编号: [尚在盘口的强制平仓挂单]}
+        self.attempts = np.zeros(len(agents), dtype=np.int64)  # 各账户连续处于缺口状态、已重新下单的次数
+        self.submitted = 0
+        self.direct = 0
+
+    def measure(self, prices):
+        """Equity, leverage, shortfall (value of holdings to sell) and bankrupt/short masks of all accounts."""
+        agents = self.agents
+        n = len(agents)
+        alive = np.fromiter((not agent.quit for agent in agents), bool, n)
+        cash = np.fromiter((agent.cash for agent in agents), float, n)
+        debt = np.fromiter((agent.get_total_loan() for agent in agents), float, n)
+        holdings = np.stack([agent.holdings for agent in agents])
+
+        value = holdings @ prices
+        equity = cash + value - debt
+        with np.errstate(divide="ignore", invalid="ignore"):
+            leverage = np.where(equity > 0, value / equity, np.inf)
+        # 需卖出的持仓市值：补足负现金，并使权益回到维持保证金之上
+        need = np.maximum(-cash, 0.0)
+        margin = self.ctx.config.MAINTENANCE_MARGIN
+        if margin > 0:
+            excess = np.where(equity < margin * value, value - np.maximum(equity, 0.0) / margin, 0.0)
+            need = np.maximum(need, excess)
+        shortfall = np.minimum(need, value)
+        bankrupt = alive & (cash + value < 0)
+        short = alive & ~bankrupt & (shortfall > 0)
+        return {"equity": equity, "leverage": leverage, "shortfall": shortfall, "bankrupt": bankrupt,
+                "short": short, "holdings": holdings}
+
+    def check(self, date, session, settlement):
+        """Quit the bankrupt accounts and enter the liquidation orders of the short ones for `session`.
+
+        session None only measures (the books are cleared before the next session anyway). Returns the
+        agents that went bankrupt.
+        """
+        market = self.market
+        risk = self.measure(market.prices)
+
+        bankrupt = [self.agents[i] for i in np.flatnonzero(risk["bankrupt"])]
+        for agent in bankrupt:
+            self.ctx.log.logger.warning(f"Agent {agent.order} bankrupt. ")
+            agent.quit = True
+
+        # 上一次的强制平仓挂单按最新价格和缺口重新下单
+        for orders in self.orders.values():
+            for order in orders:
+                market.cancel(order["id"])
+        self.orders.clear()
+        self.attempts[~risk["short"]] = 0
+        short = np.flatnonzero(risk["short"])
+        if session is None or len(short) == 0:
+            return bankrupt
+
+        # 盘口挂单未能补足缺口的账户直接按最新价卖给市场，与原先的破产处理相同
+        config = self.ctx.config
+        direct = self.attempts[short] >= config.LIQUIDATION_MAX_ATTEMPTS
+        if direct.any():
+            self._sell_to_market(short[direct], risk, date, session, settlement)
+            short = short[~direct]
+
+        # 每次重新下单加大折价；连续撮合只在价格相同时成交，有更高的买单时直接按买价卖出
+        discount = np.minimum(config.LIQUIDATION_DISCOUNT + self.attempts[short] * config.LIQUIDATION_STEP, 0.99)
+        prices = np.round(market.prices * (1 - discount[:, None]), 2)
+        if config.MATCHING_MODE != "auction":
+            for j, book in enumerate(market.books):
+                bid = book.best_bid()
+                if bid is not None:
+                    prices[:, j] = np.where(bid >= prices[:, j], bid, prices[:, j])
+        sell = self._amounts(risk["holdings"][short], risk["shortfall"][short], prices)
+        self.attempts[short] += 1
+        for k, j in zip(*np.nonzero(sell)):
+            agent = self.agents[short[k]]
+            order = {"action_type": "sell", "stock": market.tickers[j], "amount": int(sell[k, j]),
+                     "price": prices[k, j].item(), "agent": agent.order, "date": date, "tif": "day",
+                     "liquidation": True}
+            self.ctx.log.logger.info(f"INFO: Agent {agent.order} short of margin by "
+                                     f"{risk['shortfall'][short[k]]:.2f}, forced sell: {order}")
+            if config.MATCHING_MODE == "auction":
+                market.submit(order)
+            else:
+                market.handle_action(order, settlement, session)
+            if order["amount"] > 0 and order["id"] in market.open_orders.by_id:
+                self.orders.setdefault(agent.order, []).append(order)
+            self.submitted += 1
+        return bankrupt
+
+    @staticmethod
+    def _amounts(holdings, shortfall, prices):
+        # 按股票池顺序卖出，直到卖出金额补足缺口
+        values = holdings * prices
+        before = np.cumsum(values, axis=1) - values
+        remaining = np.clip(shortfall[:, None] - before, 0.0, None)
+        return np.minimum(holdings, np.ceil(remaining / prices)).astype(np.int64)
+
+    def _sell_to_market(self, accounts, risk, date, session, settlement):
+        prices = np.broadcast_to(self.market.prices, (len(accounts), len(self.market.prices)))
+        sell = self._amounts(risk["holdings"][accounts], risk["shortfall"][accounts], prices)
+        for k, j in zip(*np.nonzero(sell)):
+            agent = self.agents[accounts[k]]
+            self.ctx.log.logger.warning(f"Agent {agent.order} still short by {risk['shortfall'][accounts[k]]:.2f} "
+                                        f"after {self.attempts[accounts[k]]} checks, sold {sell[k, j]} shares of "
+                                        f"{self.market.tickers[j]} to the market at {prices[k, j]}")
+            settlement.record(date, session, j, -1, agent.order, prices[k, j].item(), int(sell[k, j]),
+                              liquidation=True)
+            # 买方记为 -1（市场），与其他成交一样写入成交记录
+            create_trade_record(self.ctx, date, session, self.market.tickers[j], -1, agent.order, int(sell[k, j]),
+                                prices[k, j].item())
+            self.direct += 1
+        settlement.settle()
+        self.attempts[accounts] = 0
@@ -1,17 +1,10 @@
 import json
-import openai
-from log.custom_logger import log
 
-import util
 
-
-def run_api(model, prompt, temperature: float = 0):
-    # 设置OpenAI的API密钥（这里为空字符串）
-    openai.api_key = util.OPENAI_API_KEY
-    openai.base_url = util.OPENAI_BASE_URL
-
-    # 创建一个OpenAI客户端实例
-    client = openai.OpenAI(api_key=openai.api_key, base_url=openai.base_url)
+def run_api(config, model, prompt, temperature: float = 0):
+    import openai
+    # 使用本次模拟配置中的密钥创建OpenAI客户端实例（不修改 openai 模块的全局状态）
+    client = openai.OpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL)
 
     # 使用给定的模型和prompt调用OpenAI的聊天API
     response = client.chat.completions.create(
@@ -28,11 +21,12 @@ def run_api(model, prompt, temperature: float = 0):
 
 
 class Secretary:
-    def __init__(self, model):
-        self.model = model  # 初始化Secretary实例时存储模型名称
+    def __init__(self, ctx):
+        self.ctx = ctx  # 本次模拟的上下文（配置、日志）
 
     def get_response(self, prompt):
-        return run_api(self.model, prompt)  # 使用存储的模型名称调用run_api获取响应
+        # 模型按 MODEL_ROUTES["secretary"] 选择（默认为较便宜的模型），仅支持 OpenAI 接口
+        return run_api(self.ctx.config, self.ctx.model_for("secretary"), prompt)
 
     """
         用json形式返回结果，例如：
@@ -49,7 +43,7 @@ class Secretary:
             end_idx = resp.index('}')
         else:
             # 如果不符合格式，记录日志并返回错误信息
-            log.logger.debug("Wrong json content in response: {}".format(resp))
+            self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
             fail_response = "Wrong json format, there is no {} or more than one {} in response."
             return False, fail_response, None
 
@@ -61,27 +55,27 @@ class Secretary:
             parsed_json = json.loads(action_json)  # 解析JSON
         except json.JSONDecodeError as e:
             print(e)
-            log.logger.debug("Illegal json content in response: {}".format(resp))
+            self.ctx.log.logger.debug("Illegal json content in response: {}".format(resp))
             fail_response = "Illegal json format."
             return False, fail_response, None
 
         # 内容检查
         try:
             if "loan" not in parsed_json:
-                log.logger.debug("Wrong json content in response: {}".format(resp))
+                self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                 fail_response = "Key 'loan' not in response."
                 return False, fail_response, None
 
             # 确保"loan"键的值是"yes"或"no"
             if parsed_json["loan"].lower() not in ["yes", "no"]:
-                log.logger.debug("Wrong json content in response: {}".format(resp))
+                self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                 fail_response = "Value of key 'loan' should be yes or no."
                 return False, fail_response, None
 
             # "loan"为"no"时，不应该包含"loan_type"或"amount"
             if parsed_json["loan"].lower() == "no":
                 if "loan_type" in parsed_json or "amount" in parsed_json:
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                     fail_response = "Don't include loan_type or amount in response if value of key 'loan' is no."
                     return False, fail_response, None
                 else:
@@ -90,39 +84,38 @@ class Secretary:
             # "loan"为"yes"时，必须包含"loan_type"和"amount"
             if parsed_json["loan"].lower() == "yes":
                 if "loan_type" not in parsed_json or "amount" not in parsed_json:
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                     fail_response = "Should include loan_type and amount in response if value of key 'loan' is yes."
                     return False, fail_response, None
 
                 # 检查"loan_type"是否在允许的范围内
                 if parsed_json["loan_type"] not in [0, 1, 2]:
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                     fail_response = "Value of key 'loan_type' should be 0, 1 or 2."
                     return False, fail_response, None
 
                 # 检查"amount"是否在允许的范围内
                 if parsed_json["amount"] <= 0 or parsed_json["amount"] > max_loan:
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                     fail_response = f"Value of key 'amount' should be positive and less than {max_loan}"
                     return False, fail_response, None
                 return True, "", parsed_json
 
-            log.logger.error("UNSOLVED LOAN JSON RESPONSE:{}".format(parsed_json))
+            self.ctx.log.logger.error("UNSOLVED LOAN JSON RESPONSE:{}".format(parsed_json))
             return False, "", None
         except Exception as e:
-            log.logger.error("UNSOLVED LOAN JSON RESPONSE:{}".format(parsed_json))
+            self.ctx.log.logger.error("UNSOLVED LOAN JSON RESPONSE:{}".format(parsed_json))
             return False, "", None
 
-    def check_action(self, resp, cash, stock_a_amount,
-                     stock_b_amount, stock_a_price, stock_b_price) -> (bool, str, dict):
-        # 检查响应格式是否符合要求，并验证买卖操作的内容
+    def check_action(self, resp, cash, holdings, market, open_orders=None) -> (bool, str, dict):
+        # 检查响应格式是否符合要求，并验证买卖操作的内容；open_orders 为该交易员的挂单 {编号: 挂单}，用于撤单、改单
 
         # 格式检查：确保响应是有效的 JSON 格式
         if isinstance(resp, str) and resp.count('{') == 1 and resp.count('}') == 1:
             start_idx = resp.index('{')
             end_idx = resp.index('}')
         else:
-            log.logger.debug("Wrong json content in response: {}".format(resp))
+            self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
             fail_response = "Wrong json format, there is no {} or more than one {} in response."
             return False, fail_response, None
 
@@ -132,47 +125,71 @@ class Secretary:
             parsed_json = json.loads(action_json)
         except json.JSONDecodeError as e:
             print(e)
-            log.logger.debug("Illegal json content in response: {}".format(resp))
+            self.ctx.log.logger.debug("Illegal json content in response: {}".format(resp))
             fail_response = "Illegal json format."
             return False, fail_response, None
 
         # 内容检查：验证 JSON 内容是否符合要求
         try:
-            prices = {"A": stock_a_price, "B": stock_b_price}
-            holds = {"A": stock_a_amount, "B": stock_b_amount}
             if "action_type" not in parsed_json:
-                log.logger.debug("Wrong json content in response: {}".format(resp))
+                self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                 fail_response = "Key 'action_type' not in response."
                 return False, fail_response, None
 
-            if parsed_json["action_type"].lower() not in ["buy", "sell", "no"]:
-                log.logger.debug("Wrong json content in response: {}".format(resp))
-                fail_response = "Value of key 'action_type' should be 'buy', 'sell' or 'no'."
+            if parsed_json["action_type"].lower() not in ["buy", "sell", "no", "cancel", "replace"]:
+                self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
+                fail_response = "Value of key 'action_type' should be 'buy', 'sell', 'cancel', 'replace' or 'no'."
+                return False, fail_response, None
+
+            if parsed_json["action_type"].lower() in ["cancel", "replace"]:
+                open_orders = open_orders or {}
+                if parsed_json.get("order_id") not in open_orders:
+                    self.ctx.log.logger.debug("Wrong order id in response: {}".format(resp))
+                    fail_response = f"Value of key 'order_id' should be one of your open orders {list(open_orders)}."
+                    return False, fail_response, None
+                if parsed_json["action_type"].lower() == "cancel":
+                    return True, "", parsed_json
+                order = open_orders[parsed_json["order_id"]]
+                if not isinstance(parsed_json.get("amount"), int) or parsed_json["amount"] <= 0 \
+                        or not isinstance(parsed_json.get("price"), (int, float)) or parsed_json["price"] <= 0:
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
+                    fail_response = "Should include a positive integer amount and a positive price to replace an order."
+                    return False, fail_response, None
+                # 改单后的挂单按买卖方向检查
+                parsed_json = {**parsed_json, "action_type": order["action_type"], "stock": order["stock"]}
+                valid, fail_response, _ = self.check_action(json.dumps(parsed_json), cash, holdings, market)
+                if not valid:
+                    return False, fail_response, None
+                return True, "", {**parsed_json, "action_type": "replace"}
+
+            if parsed_json.get("tif", "day") not in ["session", "day"]:
+                self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
+                fail_response = "Value of key 'tif' should be 'session' or 'day'."
                 return False, fail_response, None
 
             if parsed_json["action_type"].lower() == "no":
                 if "stock" in parsed_json or "amount" in parsed_json:
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                     fail_response = "Don't include stock or amount in response if value of key 'action_type' is no."
                     return False, fail_response, None
                 else:
                     return True, "", parsed_json
             else:
                 if "stock" not in parsed_json or "amount" not in parsed_json or "price" not in parsed_json:
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                     fail_response = "Should include stock, amount and price in response " \
                                     "if value of key 'action_type' is buy or sell."
                     return False, fail_response, None
-                if parsed_json["stock"] not in ['A', 'B']:
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
-                    fail_response = "Value of key 'stock' should be 'A' or 'B'."
+                if parsed_json["stock"] not in market.index:
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
+                    fail_response = f"Value of key 'stock' should be one of {market.stock_choices()}."
                     return False, fail_response, None
                 if parsed_json["price"] <= 0:
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                     fail_response = f"Value of key 'price' should be positive."
                     return False, fail_response, None
                 if not isinstance(parsed_json["amount"], int):
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
                     fail_response = f"Value of key 'amount' should be integer."
                     return False, fail_response, None
 
@@ -180,16 +197,16 @@ class Secretary:
                 price = parsed_json["price"]
                 if parsed_json["action_type"].lower() == "buy":
                     if parsed_json["amount"] <= 0 or parsed_json["amount"] * price > cash:
-                        log.logger.debug("Buy more than cash: {}".format(resp))
+                        self.ctx.log.logger.debug("Buy more than cash: {}".format(resp))
                         fail_response = f"The cash you have now is {cash}, " \
                                         f"the value of 'amount' * 'price'  " \
                                         f"should be positive and not exceed cash."
                         return False, fail_response, None
 
-                hold_amount = holds[parsed_json["stock"]]
+                hold_amount = holdings[market.index[parsed_json["stock"]]]
                 if parsed_json["action_type"].lower() == "sell":
                     if parsed_json["amount"] <= 0 or parsed_json["amount"] > hold_amount:
-                        log.logger.debug("Sell more than hold: {}".format(resp))
+                        self.ctx.log.logger.debug("Sell more than hold: {}".format(resp))
                         fail_response = f"The amount of stock you hold is {hold_amount}, " \
                                         f"the value of 'amount' should be positive and not exceed the " \
                                         f"amount of stock you hold."
@@ -197,17 +214,17 @@ class Secretary:
                 return True, "", parsed_json
 
         except Exception as e:
-            log.logger.error("UNSOLVED ACTION JSON RESPONSE:{}".format(parsed_json))
+            self.ctx.log.logger.error("UNSOLVED ACTION JSON RESPONSE:{}".format(parsed_json))
             return False, "", None
 
-    def check_estimate(self, resp):
+    def check_estimate(self, resp, market):
         # 格式检查：确保响应是有效的 JSON 格式
         if isinstance(resp, str) and resp.count('{') == 1 and resp.count('}') == 1:
             start_idx = resp.index('{')
             end_idx = resp.index('}')
         else:
             # 如果响应不符合预期的 JSON 格式，记录调试日志并返回错误信息
-            log.logger.debug("Wrong json content in response: {}".format(resp))
+            self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
             fail_response = "Wrong json format, there is no {} or more than one {} in response."
             return False, fail_response, None
 
@@ -220,31 +237,36 @@ class Secretary:
         except json.JSONDecodeError as e:
             # 如果 JSON 解码失败，记录异常信息并返回错误信息
             print(e)
-            log.logger.debug("Illegal json content in response: {}".format(resp))
+            self.ctx.log.logger.debug("Illegal json content in response: {}".format(resp))
             fail_response = "Illegal json format."
             return False, fail_response, None
 
         # 内容检查：验证 JSON 对象的键和值是否符合要求
         try:
             # 检查响应中是否包含所有必要的键
-            if "buy_A" not in parsed_json or "buy_B" not in parsed_json \
-                    or "sell_A" not in parsed_json or "sell_B" not in parsed_json \
-                    or "loan" not in parsed_json:
-                log.logger.debug("Wrong json content in response: {}".format(resp))
-                fail_response = "Key 'buy_A', 'buy_B', 'sell_A', 'sell_B' and 'loan' should in response."
+            if "buy" not in parsed_json or "sell" not in parsed_json or "loan" not in parsed_json:
+                self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
+                fail_response = "Key 'buy', 'sell' and 'loan' should in response."
                 return False, fail_response, None
 
-            # 验证所有键的值是否仅为 'yes' 或 'no'
-            for key, item in parsed_json.items():
-                if item not in ['yes', 'no']:
-                    log.logger.debug("Wrong json content in response: {}".format(resp))
-                    fail_response = "Value of all keys should be 'yes' or 'no'."
+            # 验证 'buy' 与 'sell' 为股票代码列表
+            for key in ["buy", "sell"]:
+                if not isinstance(parsed_json[key], list) \
+                        or any(stock not in market.index for stock in parsed_json[key]):
+                    self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
+                    fail_response = f"Value of key '{key}' should be a list of stocks in {market.stock_choices()}."
                     return False, fail_response, None
 
+            # 验证 'loan' 的值是否仅为 'yes' 或 'no'
+            if parsed_json["loan"] not in ['yes', 'no']:
+                self.ctx.log.logger.debug("Wrong json content in response: {}".format(resp))
+                fail_response = "Value of key 'loan' should be 'yes' or 'no'."
+                return False, fail_response, None
+
             # 如果所有检查通过，返回 True 和解析后的 JSON 对象
             return True, "", parsed_json
 
         except Exception as e:
             # 捕获任何异常，记录错误日志并返回错误信息
-            log.logger.error("UNSOLVED ESTIMATE JSON RESPONSE:{}".format(parsed_json))
+            self.ctx.log.logger.error("UNSOLVED ESTIMATE JSON RESPONSE:{}".format(parsed_json))
             return False, "", None
@@ -0,0 +1,125 @@
+import numpy as np
+
+from agent import FILL, LIQUIDATION
+
+# 成交日志；buyer/seller 为账户编号：交易员编号，最后一个账户为市场（挂单的 agent 为 -1，如新股发行）；
+# liquidation 表示卖方是风控强制平仓
+JOURNAL_DTYPE = np.dtype([("date", np.int32), ("session", np.int16), ("stock", np.int32),
+                          ("buyer", np.int32), ("seller", np.int32), ("price", np.float64), ("amount", np.int64),
+                          ("liquidation", np.bool_)])
+
+
+class SettlementError(RuntimeError):
+    """Raised when a session's fills would overdraw an account or do not conserve cash and shares."""
+
+
+class Settlement:
+    """Journal of the fills of one run, settled into the agents' accounts once per session.
+
+    Every fill is a double entry: its value moves from the buyer's cash to the seller's, its shares
+    from the seller's holdings to the buyer's. Until the session is settled, check() tests a fill
+    against the settled balances plus the pending entries, so only fills that will settle are matched.
+    """
+
+    def __init__(self, agents, n_stocks, capacity=64):
+        self.agents = agents  # 全部交易员，下标即编号
+        self.market = len(agents)  # 市场账户
+        self.journal = np.zeros(capacity, dtype=JOURNAL_DTYPE)
+        self.size = 0
+        self.settled = 0  # journal[:settled] 已结算
+        self.pending_cash = np.zeros(len(agents) + 1)
+        self.pending_shares = np.zeros((len(agents) + 1, n_stocks), dtype=np.int64)
+        # 市场账户的余额：发行的股份为负，收到的现金为正
+        self.market_cash = 0.0
+        self.market_shares = np.zeros(n_stocks, dtype=np.int64)
+
+    def account(self, agent):
+        return self.market if agent < 0 else agent
+
+    def check(self, buyer, seller, stock, price, amount):
+        """Sides ("buy", "sell") of a fill that could not settle: the agent quit, cannot pay or cannot deliver."""
+        failed = []
+        if buyer >= 0:
+            agent = self.agents[buyer]
+            if agent.quit or agent.cash + self.pending_cash[buyer] < price * amount:
+                failed.append("buy")
+        if seller >= 0:
+            agent = self.agents[seller]
+            if agent.quit or agent.holdings[stock] + self.pending_shares[seller, stock] < amount:
+                failed.append("sell")
+        return failed
+
+    def record(self, date, session, stock, buyer, seller, price, amount, liquidation=False):
+        if self.size == len(self.journal):
+            grown = np.zeros(2 * len(self.journal), dtype=JOURNAL_DTYPE)
+            grown[:self.size] = self.journal
+            self.journal = grown
+        buyer, seller = self.account(buyer), self.account(seller)
+        self.journal[self.size] = (date, session, stock, buyer, seller, price, amount, liquidation)
+        self.size += 1
+        self.pending_cash[buyer] -= price * amount
+        self.pending_cash[seller] += price * amount
+        self.pending_shares[buyer, stock] += amount
+        self.pending_shares[seller, stock] -= amount
+
+    @property
+    def fills(self):
+        return self.journal[:self.size]
+
+    def settle(self):
+        """Post the pending fills to the agents' cash, holdings and action logs; returns their number."""
+        batch = self.journal[self.settled:self.size]
+        if len(batch) == 0:
+            return 0
+        n = self.market + 1
+        value = batch["price"] * batch["amount"]
+        cash = np.bincount(batch["seller"], value, n) - np.bincount(batch["buyer"], value, n)
+        shares = np.zeros_like(self.pending_shares)
+        np.add.at(shares, (batch["buyer"], batch["stock"]), batch["amount"])
+        np.subtract.at(shares, (batch["seller"], batch["stock"]), batch["amount"])
+
+        # 复式记账：所有账户的现金变动之和为零，每只股票的股数变动之和为零
+        if abs(cash.sum()) > 1e-9 * max(value.sum(), 1.0) or shares.sum(axis=0).any():
+            raise SettlementError(f"fills {self.settled}..{self.size} do not conserve cash or shares")
+        if not (np.allclose(cash, self.pending_cash) and np.array_equal(shares, self.pending_shares)):
+            raise SettlementError(f"fills {self.settled}..{self.size} differ from the pending entries")
+
+        touched = np.flatnonzero((cash[:-1] != 0) | shares[:-1].any(axis=1))
+        agents = [self.agents[a] for a in touched]
+        new_cash = np.array([agent.cash for agent in agents]) + cash[touched]
+        new_holdings = np.array([agent.holdings for agent in agents]).reshape(shares[touched].shape)
+        new_holdings += shares[touched]
+        # 还款、付息后现金可能已为负（等待强制平仓），只拒绝本批成交使现金减少并透支的账户
+        overdrawn = touched[((cash[touched] < 0) & (new_cash < -1e-9)) | (new_holdings < 0).any(axis=1)]
+        if len(overdrawn):
+            raise SettlementError(f"fills {self.settled}..{self.size} overdraw the accounts of agents "
+                                  f"{overdrawn.tolist()}")
+
+        for agent, agent_cash, holdings in zip(agents, new_cash, new_holdings):
+            agent.cash = agent_cash.item()
+            agent.holdings[:] = holdings
+        self.market_cash += cash[-1]
+        self.market_shares += shares[-1]
+        self._post_action_logs(batch)
+
+        self.pending_cash[:] = 0
+        self.pending_shares[:] = 0
+        self.settled = self.size
+        return len(batch)
+
+    def _post_action_logs(self, batch):
+        # 买卖双方各记一笔，按账户分组后每个交易员一次批量写入
+        accounts = np.concatenate((batch["buyer"], batch["seller"]))
+        sides = np.repeat(np.array([1, -1], dtype=np.int8), len(batch))
+        entries = np.concatenate((batch, batch))
+        kinds = np.where((sides < 0) & entries["liquidation"], LIQUIDATION, FILL).astype(np.int8)
+        order = np.argsort(accounts, kind="stable")
+        accounts, sides, entries, kinds = accounts[order], sides[order], entries[order], kinds[order]
+        starts = np.flatnonzero(np.r_[True, accounts[1:] != accounts[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(accounts)]):
+            if accounts[start] == self.market:
+                continue
+            part = entries[start:end]
+            self.agents[accounts[start]].action_history.fills(part["date"], part["session"], part["stock"],
+                                                              sides[start:end], part["price"], part["amount"],
+                                                              kinds[start:end])
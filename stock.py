@@ -1,31 +1,154 @@
-import util
+import numpy as np
 
+FILL_DTYPE = np.dtype([("date", np.int32), ("session", np.int16), ("price", np.float64), ("amount", np.int64)])
+
+# 每个交易阶段一根K线；cum_* 为前缀和，使任意区间的成交量、成交额和收盘价均值/方差为 O(1)
+BAR_DTYPE = np.dtype([("date", np.int32), ("session", np.int16),
+                      ("open", np.float64), ("high", np.float64), ("low", np.float64), ("close", np.float64),
+                      ("volume", np.int64), ("turnover", np.float64), ("trades", np.int32),
+                      ("cum_volume", np.int64), ("cum_turnover", np.float64),
+                      ("cum_close", np.float64), ("cum_close2", np.float64)])
+
+
+class FillTape:
+    """Ring buffer of the most recent fills, so memory stays bounded however long the run is."""
+
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=FILL_DTYPE)
+        self.count = 0  # 累计成交笔数（含已被覆盖的）
+
+    def __len__(self):
+        return min(self.count, len(self.data))
+
+    def append(self, date, session, price, amount):
+        self.data[self.count % len(self.data)] = (date, session, price, amount)
+        self.count += 1
+
+    def recent(self, n=None):
+        """The last n (default: all retained) fills in chronological order."""
+        n = len(self) if n is None else min(n, len(self))
+        end = self.count % len(self.data)
+        idx = np.arange(end - n, end) % len(self.data)
+        return self.data[idx]
+
+
+class BarSeries:
+    """Growable per-session OHLCV bars of one stock."""
+
+    def __init__(self, capacity):
+        self.data = np.zeros(max(capacity, 1), dtype=BAR_DTYPE)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, date, session, open_, high, low, close, volume, turnover, trades):
+        if self.size == len(self.data):
+            grown = np.zeros(2 * len(self.data), dtype=BAR_DTYPE)
+            grown[:self.size] = self.data
+            self.data = grown
+
+        prev = self.data[self.size - 1] if self.size else None
+        self.data[self.size] = (
+            date, session, open_, high, low, close, volume, turnover, trades,
+            volume + (prev["cum_volume"] if prev is not None else 0),
+            turnover + (prev["cum_turnover"] if prev is not None else 0.0),
+            close + (prev["cum_close"] if prev is not None else 0.0),
+            close * close + (prev["cum_close2"] if prev is not None else 0.0))
+        self.size += 1
+
+    @property
+    def bars(self):
+        return self.data[:self.size]
+
+    def date_range(self, start_date, end_date):
+        """Bar index range [lo, hi) of the trading days start_date..end_date (inclusive)."""
+        dates = self.data["date"][:self.size]
+        return int(np.searchsorted(dates, start_date, "left")), int(np.searchsorted(dates, end_date, "right"))
+
+    def _prefix(self, field, i):
+        return self.data[field][i - 1] if i > 0 else 0
+
+    def range_sum(self, field, lo, hi):
+        return self._prefix("cum_" + field, hi) - self._prefix("cum_" + field, lo)
 
 
 class Stock:
-    def __init__(self, name, initial_price, initial_stock, is_new=False):
+    def __init__(self, ctx, name, initial_price, initial_stock, is_new=False):
+        self.ctx = ctx
         self.name = name
         self.price = initial_price
         self.ideal_price = 0
         self.initial_stock = initial_stock
-        self.history = {}  # {date: session_deal}
-        self.session_deal = []  # [{"price", "amount"}]
+        self.tape = FillTape(ctx.config.TAPE_CAPACITY)
+        self.bars = BarSeries(ctx.config.TOTAL_DATE * ctx.config.TOTAL_SESSION)
+        self._reset_session()
 
-    def gen_financial_report(self, index):
-        if self.name == "A":
-            return util.FINANCIAL_REPORT_A[index]
-        elif self.name == "B":
-            return util.FINANCIAL_REPORT_B[index]
+    def _reset_session(self):
+        # 当前交易阶段的累计量，收盘时写入一根K线
+        self._open = self._high = self._low = self._close = 0.0
+        self._volume = 0
+        self._turnover = 0.0
+        self._trades = 0
 
-    def add_session_deal(self, price_and_amount):
-        self.session_deal.append(price_and_amount)
+    def add_fill(self, date, session, price, amount):
+        self.tape.append(date, session, price, amount)
+        if self._trades == 0:
+            self._open = self._high = self._low = price
+        else:
+            self._high = max(self._high, price)
+            self._low = min(self._low, price)
+        self._close = price
+        self._volume += amount
+        self._turnover += price * amount
+        self._trades += 1
 
-    def update_price(self, date):
-        if len(self.session_deal) == 0:
+    def update_price(self, date, session):
+        if self._trades == 0:
             return
-        self.price = self.session_deal[-1]["price"]
-        self.history[date] = self.session_deal
-        self.session_deal.clear()
+        self.price = self._close
+        self.bars.append(date, session, self._open, self._high, self._low, self._close,
+                         self._volume, self._turnover, self._trades)
+        self._reset_session()
 
     def get_price(self):
         return self.price
+
+    def range_stats(self, start_date, end_date):
+        """Volume, turnover, VWAP, high and low over trading days start_date..end_date."""
+        lo, hi = self.bars.date_range(start_date, end_date)
+        if lo == hi:
+            return {"volume": 0, "turnover": 0.0, "vwap": self.price, "high": self.price, "low": self.price}
+        volume = int(self.bars.range_sum("volume", lo, hi))
+        turnover = float(self.bars.range_sum("turnover", lo, hi))
+        bars = self.bars.data[lo:hi]
+        return {"volume": volume, "turnover": turnover,
+                "vwap": turnover / volume if volume else float(bars["close"][-1]),
+                "high": float(bars["high"].max()), "low": float(bars["low"].min())}
+
+    def vwap(self):
+        """Per-bar VWAP; bars whose fills all had zero amount fall back to the close."""
+        bars = self.bars.bars
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(bars["volume"] > 0, bars["turnover"] / bars["volume"], bars["close"])
+
+    def rolling_mean(self, window):
+        """Rolling mean of bar closes over the last `window` bars, for every full window."""
+        cum = self.bars.bars["cum_close"]
+        if len(cum) < window:
+            return np.empty(0)
+        return (cum[window - 1:] - np.concatenate(([0.0], cum[:-window]))) / window
+
+    def rolling_std(self, window):
+        """Rolling (population) standard deviation of bar closes, from the same prefix sums."""
+        cum, cum2 = self.bars.bars["cum_close"], self.bars.bars["cum_close2"]
+        if len(cum) < window:
+            return np.empty(0)
+        mean = (cum[window - 1:] - np.concatenate(([0.0], cum[:-window]))) / window
+        mean2 = (cum2[window - 1:] - np.concatenate(([0.0], cum2[:-window]))) / window
+        return np.sqrt(np.maximum(mean2 - mean * mean, 0.0))
+
+    def returns(self):
+        """Close-to-close simple returns between consecutive bars."""
+        close = self.bars.bars["close"]
+        return close[1:] / close[:-1] - 1 if len(close) > 1 else np.empty(0)
@@ -0,0 +1,133 @@
+import json
+import time
+from types import SimpleNamespace
+
+# 各类提示词的回答中必须包含的键；论坛发言是自由文本，不提前结束
+RESPONSE_KEYS = {
+    "loan": {"loan"}, "loan_retry": {"loan"},
+    "action": {"action_type"}, "action_retry": {"action_type"},
+    "estimate": {"buy", "sell", "loan"}, "estimate_retry": {"buy", "sell", "loan"},
+}
+
+
+class JsonObjectScanner:
+    """Finds top-level {...} objects in text that arrives in chunks, scanning every character once."""
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.start = -1
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, chunk):
+        """Append chunk; yields (start, end) of every top-level object closed by it."""
+        self.text += chunk
+        text = self.text
+        for i in range(self.pos, len(text)):
+            c = text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = self.depth > 0
+            elif c == "{":
+                if self.depth == 0:
+                    self.start = i
+                self.depth += 1
+            elif c == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.pos = i + 1
+                    yield self.start, i + 1
+        self.pos = len(text)
+
+
+def is_complete(obj_text, keys):
+    """Whether obj_text parses (as leniently as Secretary does) to an object with all the keys."""
+    for candidate in (obj_text, obj_text.replace("\n", "").replace(" ", "")):
+        try:
+            parsed = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        return isinstance(parsed, dict) and keys <= parsed.keys()
+    return False
+
+
+def read_stream(chunks, keys):
+    """Concatenate streamed text chunks, stopping after the first complete JSON object with the keys.
+
+    Returns (text, stopped_early). An early-stopped text ends with that object and contains no other
+    braces (text before it is dropped if it has any), so Secretary finds exactly that {...} span.
+    stopped_early is True only if non-blank text followed the object, in its chunk or a later one, so
+    at most one more non-blank chunk is read after the object to tell.
+    """
+    scanner = JsonObjectScanner()
+    chunks = iter(chunks)
+    for chunk in chunks:
+        if not chunk:
+            continue
+        for start, end in scanner.feed(chunk):
+            if is_complete(scanner.text[start:end], keys):
+                head = scanner.text[:start]
+                if "{" in head or "}" in head:
+                    head = ""
+                # 对象之后没有内容（回答本就到此为止）时不算提前结束
+                unread = bool(scanner.text[end:].strip()) or any(rest and rest.strip() for rest in chunks)
+                return head + scanner.text[start:end], unread
+    return scanner.text, False
+
+
+class LocalStream:
+    """Iterator of OpenAI-style stream chunks over a fixed text."""
+
+    def __init__(self, client, text):
+        self.client = client
+        self.text = text
+        self.pos = 0
+        self.closed = False
+
+    def __iter__(self):
+        client = self.client
+        while self.pos < len(self.text) and not self.closed:
+            if client.delay:
+                time.sleep(client.delay)
+            chunk = self.text[self.pos:self.pos + client.chunk_chars]
+            self.pos += len(chunk)
+            client.sent += len(chunk)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))])
+
+    def close(self):
+        self.closed = True
+
+
+class LocalStreamingClient:
+    """Stand-in for openai.OpenAI that answers with responder(messages), streamed in small chunks.
+
+    Set it as ctx.openai_client to exercise the streaming path without a backend. Every chunk takes
+    `delay` seconds; `sent` counts the characters delivered, `generated` those the responder produced.
+    """
+
+    def __init__(self, responder, chunk_chars=4, delay=0.0):
+        self.responder = responder
+        self.chunk_chars = chunk_chars
+        self.delay = delay
+        self.sent = 0
+        self.generated = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, temperature=1, stream=False):
+        text = self.responder(messages)
+        self.generated += len(text)
+        if stream:
+            return LocalStream(self, text)
+        # 非流式：等整段生成完才返回
+        for _ in LocalStream(self, text):
+            pass
+        message = SimpleNamespace(role="assistant", content=text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
@@ -0,0 +1,49 @@
+import json
+import logging
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log.custom_logger import log  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def log_to_tmp(tmp_path):
+    # 模拟日志写到 pytest 的临时目录，运行测试不在仓库的 log/ 下留下文件
+    logger = log.logger
+    handlers = [handler for handler in logger.handlers if isinstance(handler, logging.FileHandler)]
+    for handler in handlers:
+        logger.removeHandler(handler)
+    file_handler = logging.FileHandler(tmp_path / "log.txt", delay=True)
+    logger.addHandler(file_handler)
+    yield tmp_path / "log.txt"
+    logger.removeHandler(file_handler)
+    file_handler.close()
+    for handler in handlers:
+        logger.addHandler(handler)
+
+
+def fake_run_api(self, prompt, kind="action", failures=0, temperature=1):
+    # 按交易员和提示词内容确定性地回答，不调用模型
+    text = "".join(prompt) if not isinstance(prompt, str) else prompt
+    rng = random.Random(f"{self.order}:{len(self.chat_history)}:{kind}")
+    if kind.startswith("action"):
+        return json.dumps({"action_type": rng.choice(["buy", "sell"]), "stock": rng.choice(["A", "B"]),
+                           "amount": rng.randint(1, 3), "price": rng.choice([30, 40])})
+    if kind.startswith("estimate"):
+        return '{"buy": ["A"], "sell": [], "loan": "no"}'
+    if kind.startswith("loan") or '"loan"' in text:
+        return '{"loan": "no"}'
+    return "hello forum"
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Agents answer with fake_run_api instead of calling a model."""
+    import agent
+    monkeypatch.setattr(agent.Agent, "run_api", fake_run_api)
+    return fake_run_api
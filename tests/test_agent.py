@@ -0,0 +1,52 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+import agent
+from breaker import CLOSED, OPEN, CircuitBreaker
+from context import DecisionCall
+
+
+class Completions:
+    def __init__(self, error):
+        self.error = error
+
+    def create(self, **kwargs):
+        if self.error:
+            raise self.error
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+
+def make_agent(error, breaker, monkeypatch):
+    monkeypatch.setattr(agent, "get_breaker", lambda backend, config: breaker)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=Completions(error)))
+    ctx = SimpleNamespace(openai_client=client, config=SimpleNamespace(), current_call=DecisionCall,
+                          log=SimpleNamespace(logger=logging.getLogger("test")))
+    trader = agent.Agent.__new__(agent.Agent)
+    trader.ctx, trader.chat_history = ctx, []
+    return trader
+
+
+def half_open_breaker():
+    clock = [0.0]
+    breaker = CircuitBreaker("openai", window=2, min_calls=1, cooldown=1.0, clock=lambda: clock[0])
+    breaker.record(False)
+    clock[0] = 5.0
+    return breaker
+
+
+def test_probe_failing_with_other_error_reopens_breaker(monkeypatch):
+    # 半开状态的探测调用抛出非 OpenAIError 的异常，也要记为失败，不能一直占着探测名额
+    breaker = half_open_breaker()
+    trader = make_agent(ValueError("bad response"), breaker, monkeypatch)
+    with pytest.raises(ValueError):
+        trader.run_api_gpt("hi", "gpt")
+    assert breaker.state == OPEN and not breaker._probing
+
+
+def test_probe_success_closes_breaker(monkeypatch):
+    breaker = half_open_breaker()
+    trader = make_agent(None, breaker, monkeypatch)
+    assert trader.run_api_gpt("hi", "gpt") == "ok"
+    assert breaker.state == CLOSED
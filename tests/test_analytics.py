@@ -0,0 +1,38 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agent import ActionLog
+from analytics import RunFrames, run_prices, trade_pnl
+
+
+def make_frames(trades):
+    trades = pd.DataFrame(trades, columns=["date", "session", "stock", "buyer", "seller", "amount", "price"])
+    prices = pd.DataFrame({"date": [1, 1, 1], "session": [1, 2, 3], "A": [10.0, 12.0, 20.0]})
+    sessions = pd.DataFrame({"agent": [0, 1], "date": [1, 1], "session": [1, 1], "equity": [1000.0, 1000.0],
+                             "cash": [1000.0, 1000.0], "value_A": [0.0, 0.0]})
+    daily = pd.DataFrame(columns=["agent", "date", "loan", "loan_amount"])
+    return RunFrames(trades, prices, sessions, daily, ["A"])
+
+
+def test_later_buys_do_not_change_realized_pnl():
+    # 先买后卖已实现 20，之后更高价买入不应改变这笔卖出的成本
+    frames = make_frames([(1, 1, "A", 0, 1, 10, 10.0), (1, 2, "A", 1, 0, 10, 12.0), (1, 3, "A", 0, -1, 10, 20.0)])
+    realized, unrealized, traded = trade_pnl(frames, [0, 1], {"A": 10.0})
+    log = ActionLog([0], [10.0])
+    for session, side, price in [(1, 1, 10.0), (2, -1, 12.0), (3, 1, 20.0)]:
+        log.fills(np.array([1]), np.array([session]), np.array([0]), np.array([side]), np.array([price]),
+                  np.array([10]))
+    assert realized[0] == pytest.approx(log.realized.sum()) == pytest.approx(20.0)
+    assert unrealized[0] == pytest.approx(log.unrealized([20.0]).sum()) == pytest.approx(0.0)
+    assert traded.tolist() == [420.0, 220.0]
+
+
+def test_run_prices_come_from_the_decision_log(tmp_path):
+    path = tmp_path / "decisions.jsonl"
+    path.write_text(json.dumps({"kind": "run", "model": "m", "seed": 1, "config": {"STOCKS": {"X": 5.0}}}) + "\n")
+    assert run_prices(str(path)) == {"X": 5.0}
+    with pytest.raises(FileNotFoundError):
+        run_prices(str(tmp_path / "missing.jsonl"))
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+import main
+from auction import allocate, clearing_price, pair_fills
+from context import Config, SimulationContext
+from timeline import Timeline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def order(order_id, price, amount, side="buy"):
+    return {"id": order_id, "action_type": side, "price": price, "amount": amount}
+
+
+def test_clearing_price_maximizes_volume():
+    buys = [order(1, 31.0, 10), order(2, 30.0, 10)]
+    sells = [order(3, 29.0, 5, "sell"), order(4, 30.0, 10, "sell")]
+    # 30 时需求 20、供给 15，成交 15；31 时只有 10
+    assert clearing_price(buys, sells, 25.0) == (30.0, 15)
+
+
+def test_clearing_price_ties_go_to_the_reference_price():
+    buys = [order(1, 32.0, 10)]
+    sells = [order(2, 28.0, 10, "sell")]
+    assert clearing_price(buys, sells, 31.0) == (32.0, 10)
+    assert clearing_price(buys, sells, 27.0) == (28.0, 10)
+
+
+def test_books_that_do_not_cross_clear_nothing():
+    assert clearing_price([order(1, 29.0, 10)], [order(2, 30.0, 10, "sell")], 30.0) == (None, 0)
+
+
+def test_pro_rata_shares_the_marginal_level():
+    orders = [order(1, 31.0, 4), order(2, 30.0, 6), order(3, 30.0, 3)]
+    fills = allocate(orders, 10, lambda o: -o["price"], "pro_rata")
+    # 31 的挂单全部成交，剩余 6 股在 30 价位按 6:3 分配
+    assert [(o["id"], amount) for o, amount in fills] == [(1, 4), (2, 4), (3, 2)]
+
+
+def test_time_priority_fills_the_earlier_order_first():
+    orders = [order(2, 30.0, 6), order(1, 30.0, 6)]
+    fills = allocate(orders, 8, lambda o: -o["price"], "time")
+    assert [(o["id"], amount) for o, amount in fills] == [(1, 6), (2, 2)]
+
+
+def test_pair_fills_matches_allocated_quantities():
+    b1, b2, s1 = order(1, 30.0, 4), order(2, 30.0, 6), order(3, 30.0, 10, "sell")
+    assert pair_fills([(b1, 4), (b2, 6)], [(s1, 10)]) == [(b1, s1, 4), (b2, s1, 6)]
+
+
+def test_auction_session_decisions_run_concurrently(tmp_path, fake_model, monkeypatch):
+    lock, active, peak = threading.Lock(), [0], [0]
+    plan_stock = main.Agent.plan_stock
+
+    def slow_plan_stock(self, date, session, reports=None):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return plan_stock(self, date, session, reports)
+
+    monkeypatch.setattr(main.Agent, "plan_stock", slow_plan_stock)
+    config = Config(AGENTS_NUM=4, TOTAL_DATE=1, TOTAL_SESSION=1, MATCHING_MODE="auction")
+    main.run_simulation(SimulationContext("fake", config=config, seed=3, res_dir=str(tmp_path)),
+                        Timeline.from_file(os.path.join(ROOT, "scenario", "default.json")))
+    assert peak[0] > 1
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+from breaker import HALF_OPEN, BackendUnavailable, CircuitBreaker
+from context import Config, SimulationContext
+
+
+def tripped(on_open, cooldown=30.0):
+    breaker = CircuitBreaker("test", window=2, min_calls=1, cooldown=cooldown, on_open=on_open, max_wait=5.0)
+    breaker.record(False)
+    return breaker
+
+
+def test_open_breaker_rejects_calls_without_waiting_in_wait_mode():
+    breaker = tripped("wait")
+    start = time.monotonic()
+    with pytest.raises(BackendUnavailable):
+        breaker.before_call()
+    assert time.monotonic() - start < 0.5
+
+
+def test_wait_until_available_returns_after_the_cooldown():
+    breaker = tripped("wait", cooldown=0.05)
+    assert breaker.is_open()
+    breaker.wait_until_available()
+    assert not breaker.is_open()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def unavailable():
+    raise BackendUnavailable("down")
+
+
+def test_decisions_fall_back_while_unavailable_in_wait_mode(tmp_path):
+    ctx = SimulationContext("fake", config=Config(BREAKER_ON_OPEN="wait"), seed=1, res_dir=str(tmp_path))
+    assert ctx.decide("action", 1, 1, 0, unavailable, {"action_type": "no"}) == {"action_type": "no"}
+    assert ctx.unavailable == {"action": 1}
+    ctx.close()
+
+
+def test_unavailable_backend_stops_the_run_in_fail_mode(tmp_path):
+    ctx = SimulationContext("fake", config=Config(BREAKER_ON_OPEN="fail"), seed=1, res_dir=str(tmp_path))
+    with pytest.raises(BackendUnavailable):
+        ctx.decide("action", 1, 1, 0, unavailable, {"action_type": "no"})
+    ctx.close()
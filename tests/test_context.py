@@ -0,0 +1,54 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import agent
+from context import Config, SimulationContext
+
+
+class SlowCompletions:
+    """Answers "late" once released; until then every call hangs."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.answered = threading.Event()
+
+    def create(self, **kwargs):
+        self.release.wait(5)
+        self.answered.set()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="late"))])
+
+
+def make_run(tmp_path, completions, **config):
+    ctx = SimulationContext("fake", config=Config(DECISION_DEADLINES={"action": 0.05}, **config), seed=1,
+                            res_dir=str(tmp_path))
+    ctx.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    trader = agent.Agent.__new__(agent.Agent)
+    trader.ctx, trader.chat_history = ctx, [{"role": "user", "content": "earlier"}]
+    return ctx, trader
+
+
+def test_late_reply_does_not_change_agent_state(tmp_path):
+    completions = SlowCompletions()
+    ctx, trader = make_run(tmp_path, completions)
+    decision = ctx.decide("action", 1, 1, 0, lambda: trader.run_api_gpt("hi", "gpt"), "no answer")
+    assert decision == "no answer"
+    # 放弃的提问连同其提示词一起撤回；之后才到达的回答也不写入对话
+    assert trader.chat_history == [{"role": "user", "content": "earlier"}]
+    completions.release.set()
+    assert completions.answered.wait(5)
+    time.sleep(0.05)
+    assert trader.chat_history == [{"role": "user", "content": "earlier"}]
+    ctx.close()
+
+
+def test_hanging_calls_do_not_starve_later_decisions(tmp_path):
+    completions = SlowCompletions()
+    ctx, trader = make_run(tmp_path, completions, LLM_CONCURRENCY=2)
+    for _ in range(2):
+        ctx.decide("action", 1, 1, 0, lambda: trader.run_api_gpt("hi", "gpt"), "no answer")
+    # 4 个线程中的一半被卡住后换用新的线程池，之后的决策仍能按时回答
+    assert ctx.replaced_pools == 1
+    assert ctx.decide("action", 1, 2, 0, lambda: "answered", "no answer") == "answered"
+    completions.release.set()
+    ctx.close()
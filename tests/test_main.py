@@ -0,0 +1,37 @@
+import os
+import sqlite3
+
+import main
+import risk
+from context import Config, SimulationContext
+from timeline import Timeline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ESTIMATES = {0: '["A"]', 1: '["B"]', 2: '["A", "B"]'}
+
+
+def test_estimates_stay_with_their_agent_after_one_leaves(tmp_path, fake_model, monkeypatch):
+    def run_api(self, prompt, kind="action", failures=0, temperature=1):
+        if kind.startswith("estimate"):
+            return f'{{"buy": {ESTIMATES[self.order]}, "sell": [], "loan": "no"}}'
+        return fake_model(self, prompt, kind, failures, temperature)
+
+    check = risk.RiskEngine.check
+
+    def leave_after_first_session(self, date, session, settlement):
+        bankrupt = check(self, date, session, settlement)
+        if (date, session) == (1, 2):
+            # 第一天第一阶段结束后交易员 1 退出市场
+            self.agents[1].quit = True
+            bankrupt = bankrupt + [self.agents[1]]
+        return bankrupt
+
+    monkeypatch.setattr(main.Agent, "run_api", run_api)
+    monkeypatch.setattr(risk.RiskEngine, "check", leave_after_first_session)
+    config = Config(AGENTS_NUM=3, TOTAL_DATE=1, RECORD_SINK="sqlite")
+    main.run_simulation(SimulationContext("fake", config=config, seed=5, res_dir=str(tmp_path)),
+                        Timeline.from_file(os.path.join(ROOT, "scenario", "default.json")))
+
+    with sqlite3.connect(tmp_path / "records.db") as conn:
+        rows = conn.execute("SELECT agent, will_buy FROM seed5_agent_day ORDER BY agent").fetchall()
+    assert rows == [(0, "A"), (1, "-"), (2, "A,B")]
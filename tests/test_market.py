@@ -0,0 +1,30 @@
+import logging
+from types import SimpleNamespace
+
+from context import Config
+from market import Market
+
+
+def make_market(**config):
+    ctx = SimpleNamespace(config=Config(**{"STOCKS": {"A": 30.0, "B": 40.0}, **config}),
+                          log=SimpleNamespace(logger=logging.getLogger("test")),
+                          sink=SimpleNamespace(write=lambda record: None))
+    return Market(ctx, ctx.config.STOCKS)
+
+
+def test_books_text_shows_only_side_amount_and_price():
+    market = make_market(MATCHING_MODE="auction")
+    market.handle_action({"action_type": "buy", "stock": "A", "amount": 5, "price": 29.5, "agent": 1, "date": 1},
+                         None, 1)
+    market.handle_action({"action_type": "sell", "stock": "A", "amount": 3, "price": 31.0, "agent": 2, "date": 1,
+                          "liquidation": True}, None, 1)
+    assert market.books_text() == "stock A: sell 3 at 31.0, buy 5 at 29.5"
+
+
+def test_open_orders_example_uses_the_agents_order():
+    market = make_market(MATCHING_MODE="auction")
+    market.handle_action({"action_type": "sell", "stock": "A", "amount": 7, "price": 33.5, "agent": 4, "date": 1},
+                         None, 1)
+    order_id = next(iter(market.open_orders.of(4)))
+    assert f'{{"action_type": "replace", "order_id": {order_id}, "amount": 7, "price": 33.5}}' \
+        in market.open_orders_text(4)
@@ -0,0 +1,66 @@
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+
+from context import Config
+from market import Market
+from population import Population
+from settlement import Settlement
+
+
+def make_population(size=200, **config):
+    ctx = SimpleNamespace(config=Config(**{"STOCKS": {"A": 30.0, "B": 40.0}, **config}), seed=3,
+                          log=SimpleNamespace(logger=logging.getLogger("test")),
+                          sink=SimpleNamespace(write=lambda record: None))
+    market = Market(ctx, ctx.config.STOCKS)
+    return market, Population(ctx, market, 2, size)
+
+
+def test_follower_accounts_are_rows_of_the_population_arrays():
+    market, population = make_population(size=3)
+    follower = population.accounts[1]
+    assert follower.order == 3
+    follower.cash = 12.5
+    follower.holdings[0] += 4
+    assert population.cash[1] == 12.5
+    assert follower.holdings[0] == population.holdings[1, 0]
+
+    # 结算直接修改人群的数组
+    settlement = Settlement([None, None] + population.accounts, 2)
+    cash, held = population.cash.copy(), population.holdings.copy()
+    settlement.record(1, 1, 0, 2, 3, 10.0, 1)
+    settlement.settle()
+    assert population.cash[0] == cash[0] - 10.0 and population.cash[1] == cash[1] + 10.0
+    assert population.holdings[0, 0] == held[0, 0] + 1 and population.holdings[1, 0] == held[1, 0] - 1
+
+
+def test_orders_stay_within_cash_and_holdings():
+    market, population = make_population(FOLLOWER_ACTIVITY=1.0, FOLLOWER_MIX={"noise": 1.0})
+    population.accounts[0].quit = True
+    orders = population.decide(market, 1, 1)
+    assert orders and population.submitted == len(orders)
+    for order in orders:
+        k, i = order["agent"] - 2, market.index[order["stock"]]
+        assert k != 0 and order["tif"] == "session" and order["amount"] > 0
+        if order["action_type"] == "buy":
+            assert order["amount"] * order["price"] <= population.cash[k]
+        else:
+            assert order["amount"] <= population.holdings[k, i]
+
+
+def test_sentiment_followers_trade_with_the_agents_estimates():
+    market, population = make_population(FOLLOWER_ACTIVITY=1.0, FOLLOWER_MIX={"sentiment": 1.0})
+    assert population.decide(market, 1, 1) == []  # 还没有交易员的预期，没有信号
+    population.observe([{"buy": ["A"], "sell": ["B"]}, {"buy": ["A", "X"], "sell": []}])
+    assert population.sentiment.tolist() == [1.0, -0.5]
+    orders = population.decide(market, 1, 2)
+    assert orders
+    assert {(order["stock"], order["action_type"]) for order in orders} <= {("A", "buy"), ("B", "sell")}
+
+
+def test_decisions_follow_the_seed():
+    first = make_population(FOLLOWER_ACTIVITY=0.5)
+    second = make_population(FOLLOWER_ACTIVITY=0.5)
+    assert np.array_equal(first[1].holdings, second[1].holdings)
+    assert first[1].decide(first[0], 1, 1) == second[1].decide(second[0], 1, 1)
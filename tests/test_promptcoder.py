@@ -0,0 +1,79 @@
+from PromptCoder.procoder.functional import format_prompt, removed_submodule, replace_prompt, replace_submodule
+from PromptCoder.procoder.prompt import Collection, NamedBlock, Single, dash_indexing
+
+
+def test_single_render_follows_inputs_and_prompt_text():
+    single = Single("price {price} for {name}")
+    assert single(x={"price": 1, "name": "A"}) == "price 1 for A"
+    assert single(x={"price": 2, "name": "A"}) == "price 2 for A"
+    # 1、1.0 和 True 相等但格式化结果不同，缓存不能混用
+    assert single(x={"price": 1.0, "name": "A"}) == "price 1.0 for A"
+    assert single(x={"price": True, "name": "A"}) == "price True for A"
+    assert single(x={"price": [1, 2], "name": "A"}) == "price [1, 2] for A"  # 不可哈希的输入不缓存
+
+    single.prompt = "{name} costs {price}"
+    assert single(x={"price": 1, "name": "A"}) == "A costs 1"
+
+
+def test_single_render_cache_is_bounded():
+    single = Single("{i}")
+    for i in range(3 * Single.MAX_CACHED_RENDERS):
+        assert single(x={"i": i}) == str(i)
+    assert len(single._renders) <= Single.MAX_CACHED_RENDERS
+
+
+def test_sequential_prefixes_follow_layout_changes():
+    prompt = Collection(Single("first"), Single("second {x}"))
+    assert format_prompt(prompt, {"x": 1}) == "1. first\n2. second 1"
+
+    prompt.set_indexing_method(dash_indexing)
+    assert format_prompt(prompt, {"x": 1}) == "- first\n- second 1"
+
+    prompt._replace_submodule("_0", Single("replaced"))
+    assert format_prompt(prompt, {"x": 1}) == "- replaced\n- second 1"
+
+    prompt.set_submodules({"only": Single("alone {x}")})
+    assert format_prompt(prompt, {"x": 2}) == "- alone 2"
+
+    prompt.enable_name()
+    assert format_prompt(prompt, {"x": 2}) == "- only: alone 2"
+
+
+def make_tree():
+    rules = Collection(NamedBlock("Loan", "Loan rules {rate}", refname="loan"),
+                       NamedBlock("Stock", "Stock rules", refname="stock"))
+    return Collection(NamedBlock("Rules", rules, refname="rules"), NamedBlock("Task", "Decide", refname="task"))
+
+
+def test_replace_submodule_copies_only_the_edited_path():
+    tree = make_tree()
+    before = format_prompt(tree, {"rate": 1})
+    rules, task = tree._modules.values()
+    loan, stock = rules._modules["content"]._modules.values()
+
+    new, success = replace_submodule(tree, "loan", NamedBlock("Loan", "No loans"))
+    assert success
+    new_rules, new_task = new._modules.values()
+    new_loan, new_stock = new_rules._modules["content"]._modules.values()
+    # 根到被替换模块路径上的模块是新的，其余子树与原树共用
+    assert new is not tree and new_rules is not rules and new_loan is not loan
+    assert new_task is task and new_stock is stock and new_rules._modules["name"] is rules._modules["name"]
+    assert format_prompt(new, {}) == before.replace("Loan rules 1", "No loans")
+    assert format_prompt(tree, {"rate": 1}) == before
+
+    same, success = replace_submodule(tree, "missing", NamedBlock("X", "x"))
+    assert not success and same is tree
+
+
+def test_remove_and_replace_prompt_leave_the_input_unchanged():
+    tree = make_tree()
+    before = format_prompt(tree, {"rate": 1})
+    _, task = tree._modules.values()
+
+    removed = removed_submodule(tree, "stock")
+    assert "Stock rules" not in format_prompt(removed, {"rate": 1})
+    assert list(removed._modules.values())[1] is task
+
+    upper = replace_prompt(task, str.upper)
+    assert format_prompt(upper, {}) == format_prompt(task, {}).upper()
+    assert format_prompt(tree, {"rate": 1}) == before
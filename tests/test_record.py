@@ -0,0 +1,28 @@
+import pytest
+
+from context import Config, SimulationContext
+from record import SQLiteSink
+
+
+def test_sqlite_sink_refuses_tables_of_another_run(tmp_path):
+    path = str(tmp_path / "records.db")
+    SQLiteSink(path, "seed42").close()
+    with pytest.raises(FileExistsError, match="seed42"):
+        SQLiteSink(path, "seed42")
+    SQLiteSink(path, "seed42_b").close()
+
+
+def test_second_run_in_the_same_directory_is_refused(tmp_path):
+    config = Config(RECORD_SINK="sqlite")
+    first = SimulationContext("fake", config=config, seed=42, res_dir=str(tmp_path))
+    with pytest.raises(FileExistsError, match="decisions.jsonl"):
+        SimulationContext("fake", config=config, seed=42, res_dir=str(tmp_path))
+    first.close()
+    assert (tmp_path / "decisions.jsonl").read_text(encoding="utf-8").count("\n") == 1
+
+
+def test_run_that_cannot_start_leaves_no_decision_log(tmp_path):
+    SQLiteSink(str(tmp_path / "records.db"), "seed42").close()
+    with pytest.raises(FileExistsError):
+        SimulationContext("fake", config=Config(RECORD_SINK="sqlite"), seed=42, res_dir=str(tmp_path))
+    assert not (tmp_path / "decisions.jsonl").exists()
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+
+import main
+from context import Config, SimulationContext
+from timeline import Timeline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def trades(res_dir, seed):
+    with sqlite3.connect(os.path.join(res_dir, "records.db")) as conn:
+        return conn.execute(f"SELECT * FROM seed{seed}_trades ORDER BY rowid").fetchall()
+
+
+def test_replay_keeps_followers(tmp_path, fake_model, log_to_tmp):
+    timeline = Timeline.from_file(os.path.join(ROOT, "scenario", "default.json"))
+    config = Config(AGENTS_NUM=3, TOTAL_DATE=2, FOLLOWERS_NUM=200, FOLLOWER_ACTIVITY=0.5,
+                    MATCHING_MODE="auction", RECORD_SINK="sqlite")
+    main.run_simulation(SimulationContext("fake", config=config, seed=7, res_dir=str(tmp_path)), timeline)
+
+    # 回放时不再传入跟随者数量，应从决策日志中恢复
+    replay_dir = str(tmp_path / "replay")
+    ctx = SimulationContext.for_replay(str(tmp_path / "decisions.jsonl"), replay_dir,
+                                       MATCHING_MODE="auction", RECORD_SINK="sqlite", FOLLOWERS_NUM=0)
+    assert ctx.config.FOLLOWERS_NUM == 200
+    main.run_simulation(ctx, timeline)
+
+    original = trades(str(tmp_path), 7)
+    assert any(row[3] >= 3 or row[4] >= 3 for row in original)  # 有跟随者参与的成交
+    assert trades(replay_dir, 7) == original
+    assert log_to_tmp.exists()
+
+
+def test_continuous_replay_reproduces_trades_without_model_calls(tmp_path, fake_model, monkeypatch):
+    timeline = Timeline.from_file(os.path.join(ROOT, "scenario", "default.json"))
+    config = Config(AGENTS_NUM=4, TOTAL_DATE=2, MATCHING_MODE="continuous", RECORD_SINK="sqlite")
+    main.run_simulation(SimulationContext("fake", config=config, seed=11, res_dir=str(tmp_path)), timeline)
+
+    def no_model(*args, **kwargs):
+        raise AssertionError("a replay must not call the model")
+
+    monkeypatch.setattr(main.Agent, "run_api", no_model)
+    replay_dir = str(tmp_path / "replay")
+    ctx = SimulationContext.for_replay(str(tmp_path / "decisions.jsonl"), replay_dir, RECORD_SINK="sqlite")
+    assert ctx.config.MATCHING_MODE == "continuous"
+    main.run_simulation(ctx, timeline)
+
+    original = trades(str(tmp_path), 11)
+    assert original and trades(replay_dir, 11) == original
+    assert not ctx.replay.missing
@@ -0,0 +1,58 @@
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+
+from agent import ActionLog
+from context import Config
+from market import Market
+from risk import RiskEngine
+from settlement import Settlement
+
+
+class Account:
+    def __init__(self, order, cash, holdings, prices):
+        self.order = order
+        self.cash = cash
+        self.holdings = np.array(holdings, dtype=np.int64)
+        self.quit = False
+        self.loans = []
+        self.action_history = ActionLog(self.holdings, prices)
+
+    def get_total_loan(self):
+        return 0.0
+
+
+def make_run(**config):
+    records = []
+    ctx = SimpleNamespace(config=Config(STOCKS={"A": 30.0, "B": 40.0}, **config),
+                          log=SimpleNamespace(logger=logging.getLogger("test")),
+                          sink=SimpleNamespace(write=records.append), records=records)
+    market = Market(ctx, ctx.config.STOCKS)
+    accounts = [Account(0, -100.0, [10, 0], market.prices), Account(1, 1000.0, [0, 0], market.prices)]
+    return ctx, market, accounts, Settlement(accounts, 2), RiskEngine(ctx, market, accounts)
+
+
+def test_liquidation_crosses_best_bid():
+    ctx, market, accounts, settlement, risk = make_run(MATCHING_MODE="continuous")
+    market.handle_action({"action_type": "buy", "stock": "A", "amount": 5, "price": 31.0, "agent": 1, "date": 1},
+                         settlement, 1)
+    risk.check(1, 1, settlement)
+    settlement.settle()
+    assert accounts[0].holdings.tolist() == [6, 0]
+    assert accounts[0].cash == 24.0
+
+
+def test_liquidation_discount_widens_then_sells_to_market():
+    ctx, market, accounts, settlement, risk = make_run(MATCHING_MODE="continuous", LIQUIDATION_MAX_ATTEMPTS=2)
+    risk.check(1, 1, settlement)
+    assert [order["price"] for order in risk.orders[0]] == [30.0]
+    risk.check(1, 2, settlement)
+    assert [order["price"] for order in risk.orders[0]] == [29.7]
+    # 两次挂单都没有成交，第三次检查按最新价直接卖给市场
+    risk.check(1, 3, settlement)
+    assert accounts[0].holdings.tolist() == [6, 0]
+    assert accounts[0].cash == 20.0
+    assert risk.direct == 1 and 0 not in risk.orders
+    trade = ctx.records[-1]
+    assert (trade.stock_type, trade.buyer, trade.seller, trade.quantity, trade.price) == ("A", -1, 0, 4, 30.0)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from agent import LIQUIDATION, ActionLog
+from settlement import Settlement, SettlementError
+
+
+class Account:
+    def __init__(self, cash, holdings, prices=(10.0, 20.0)):
+        self.cash = cash
+        self.holdings = np.array(holdings, dtype=np.int64)
+        self.quit = False
+        self.action_history = ActionLog(self.holdings, prices)
+
+
+def test_negative_cash_account_can_sell():
+    # 还款后现金为负的账户被强制平仓，部分成交只增加现金，结算后仍为负也不报错
+    seller, buyer = Account(-1000.0, [50, 0]), Account(500.0, [0, 0])
+    settlement = Settlement([seller, buyer], 2)
+    settlement.record(44, 1, 0, 1, 0, 10.0, 9, liquidation=True)
+    assert settlement.settle() == 1
+    assert seller.cash == pytest.approx(-910.0)
+    assert seller.holdings.tolist() == [41, 0]
+    assert buyer.cash == pytest.approx(410.0)
+    assert seller.action_history.actions["kind"].tolist() == [LIQUIDATION]
+
+
+def test_negative_cash_account_cannot_buy():
+    buyer, seller = Account(-1000.0, [0, 0]), Account(0.0, [10, 0])
+    settlement = Settlement([buyer, seller], 2)
+    assert settlement.check(0, 1, 0, 10.0, 1) == ["buy"]
+    settlement.record(1, 1, 0, 0, 1, 10.0, 1)
+    with pytest.raises(SettlementError):
+        settlement.settle()
@@ -0,0 +1,15 @@
+from streaming import read_stream
+
+KEYS = {"action_type"}
+
+
+def test_stops_early_when_text_follows_object():
+    chunks = iter(['Decision: {"action_type": ', '"buy"}', "\nReasoning: ", "because", " it is cheap"])
+    assert read_stream(chunks, KEYS) == ('Decision: {"action_type": "buy"}', True)
+    # 只多读了对象之后的一个块
+    assert next(chunks) == "because"
+
+
+def test_not_stopped_early_when_object_ends_stream():
+    assert read_stream(['{"action_type": ', '"buy"}'], KEYS) == ('{"action_type": "buy"}', False)
+    assert read_stream(['{"action_type": "buy"}', "", " \n"], KEYS) == ('{"action_type": "buy"}', False)
@@ -0,0 +1,16 @@
+import pytest
+
+from timeline import Timeline
+
+
+def test_loan_rate_param_becomes_loan_rate_event():
+    timeline = Timeline([{"type": "param", "date": 3, "params": {"LOAN_RATE": [0.05, 0.06, 0.07], "MAX_PRICE": 9}}])
+    day = timeline.on(3)
+    assert day.loan_rate == [0.05, 0.06, 0.07]
+    assert day.params == {"MAX_PRICE": 9}
+
+
+def test_loan_rate_param_and_event_on_same_day_conflict():
+    with pytest.raises(ValueError, match="Duplicate loan_rate"):
+        Timeline([{"type": "loan_rate", "date": 2, "loan_rate": [0.1, 0.1, 0.1]},
+                  {"type": "param", "date": 2, "params": {"LOAN_RATE": [0.2, 0.2, 0.2]}}])
@@ -0,0 +1,69 @@
+import json
+
+from log.custom_logger import log
+
+EVENT_TYPES = ["loan_rate", "message", "report", "param"]
+
+
+class DayEvents:
+    """All scheduled events of one trading day, merged at load time."""
+
+    __slots__ = ("date", "loan_rate", "messages", "reports", "params")
+
+    def __init__(self, date):
+        self.date = date
+        self.loan_rate = None  # 新的贷款利率，None 表示不变
+        self.messages = []  # 以系统身份(-1)发布到论坛的新闻
+        self.reports = {}  # {stock_name: report}
+        self.params = {}  # {util 参数名: 新值}
+
+    def is_empty(self):
+        return self.loan_rate is None and not self.messages and not self.reports and not self.params
+
+
+NO_EVENTS = DayEvents(None)
+
+
+class Timeline:
+    def __init__(self, events=None, name=""):
+        self.name = name
+        self.days = {}  # {date: DayEvents}
+        for event in events or []:
+            self.add_event(event)
+
+    @classmethod
+    def from_file(cls, file_name):
+        with open(file_name, "r", encoding="utf-8") as f:
+            scenario = json.load(f)
+        timeline = cls(scenario.get("events", []), name=scenario.get("name", file_name))
+        log.logger.debug(f"Scenario {timeline.name} loaded: {len(timeline.days)} event days")
+        return timeline
+
+    def add_event(self, event):
+        if event.get("type") not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type {event.get('type')}, should be one of {EVENT_TYPES}")
+        if not isinstance(event.get("date"), int) or event["date"] < 1:
+            raise ValueError(f"Event date should be a positive integer, got {event.get('date')}")
+
+        day = self.days.get(event["date"])
+        if day is None:
+            day = self.days[event["date"]] = DayEvents(event["date"])
+
+        if event["type"] == "loan_rate":
+            if day.loan_rate is not None:
+                raise ValueError(f"Duplicate loan_rate event on day {event['date']}")
+            day.loan_rate = list(event["loan_rate"])
+        elif event["type"] == "message":
+            day.messages.append(event["message"])
+        elif event["type"] == "report":
+            day.reports.update(event["reports"])
+        elif event["type"] == "param":
+            params = dict(event["params"])
+            if "LOAN_RATE" in params:
+                # 运行中的贷款利率保存在 ctx.loan_rate，config.LOAN_RATE 只决定初始值，按 loan_rate 事件处理
+                self.add_event({"type": "loan_rate", "date": event["date"], "loan_rate": params.pop("LOAN_RATE")})
+            day.params.update(params)
+
+    def on(self, date):
+        """O(1) lookup of the events of a day, NO_EVENTS if nothing happens."""
+        return self.days.get(date, NO_EVENTS)
@@ -15,11 +15,67 @@ AGENTS_NUM = 5
 TOTAL_DATE = 100 
 TOTAL_SESSION = 3
 
-# 股票初始价格
-STOCK_A_INITIAL_PRICE = 30
-STOCK_B_INITIAL_PRICE = 40
+# 股票代码及初始价格（按顺序构成市场中的股票池）
+STOCKS = {"A": 30, "B": 40}
 # STOCK_B_PUBLISH = 100
 
+# 撮合方式："continuous" 逐笔连续撮合；"auction" 每个交易阶段集中竞价，统一价格成交
+MATCHING_MODE = "continuous"
+AUCTION_ALLOCATION = "pro_rata"  # 边际价位的分配方式："pro_rata" 按比例；"time" 时间优先
+# 挂单未指定 "tif" 时的有效期："day" 当日有效；"session" 仅本交易阶段有效，阶段结束后撤销
+DEFAULT_TIME_IN_FORCE = "day"
+
+# 风控：每个交易阶段结束后检查所有账户；权益低于持仓市值的该比例时强制平仓，0 表示只在现金为负时平仓
+MAINTENANCE_MARGIN = 0.0
+LIQUIDATION_DISCOUNT = 0.0  # 强制平仓挂单相对最新价的折价比例
+LIQUIDATION_STEP = 0.01  # 强制平仓未能补足缺口时，每次重新下单增加的折价比例
+LIQUIDATION_MAX_ATTEMPTS = 5  # 连续这么多次检查仍有缺口时，按最新价直接卖给市场（不经过盘口）
+
+# 混合人群：AGENTS_NUM 个由模型决策的交易员之外，再加入 FOLLOWERS_NUM 个按规则批量决策的跟随者，不调用模型
+FOLLOWERS_NUM = 0
+FOLLOWER_MIX = {"momentum": 0.3, "mean_reversion": 0.3, "noise": 0.2, "sentiment": 0.2}  # 各策略的人数占比
+FOLLOWER_ACTIVITY = 0.1  # 每个交易阶段下单的概率
+FOLLOWER_LOOKBACK = 5  # 动量、均值回归回看的交易阶段数
+FOLLOWER_MAX_THRESHOLD = 0.02  # 信号触发阈值的上限，每个跟随者在 [0, 上限) 内随机
+FOLLOWER_MAX_FRACTION = 0.1  # 每笔下单动用现金或持仓比例的上限
+FOLLOWER_MAX_OFFSET = 0.01  # 报价相对最新价加价/让价比例的上限
+
+# 记录的写入方式："excel" 每次运行目录下的 xlsx 文件；"sqlite" 运行目录下的 records.db（按运行分表）
+RECORD_SINK = "excel"
+
+# 每支股票保留的最近成交笔数（逐笔成交环形缓冲区，K线不受影响）
+TAPE_CAPACITY = 100000
+
+# 每次模拟同时进行的模型调用数上限（贷款、次日预估和论坛发言阶段按交易员并发）
+LLM_CONCURRENCY = 8
+
+# 按提示词类型选择模型："main" 为 --model，"cheap" 为 CHEAP_MODEL（未设置时同 --model），也可直接写模型名
+# 模型名含 "gpt" 的走 OpenAI 接口，含 "gemini" 的走 Gemini 接口；同一交易员的对话可以跨模型延续
+CHEAP_MODEL = None
+MODEL_ROUTES = {"loan": "main", "action": "main", "estimate": "cheap", "post": "cheap",
+                "loan_retry": "cheap", "action_retry": "cheap", "estimate_retry": "cheap", "secretary": "cheap"}
+ESCALATE_AFTER = 2  # 格式重试连续失败达到该次数后改用主模型（0 表示不升级）
+
+# 模型接口熔断：最近 BREAKER_WINDOW 次调用中（至少 BREAKER_MIN_CALLS 次）失败比例达到 BREAKER_FAILURE_RATE 时熔断，
+# BREAKER_COOLDOWN 秒后放行一次探测调用；熔断期间 "fail" 立即停止运行并报错，"wait" 时熔断期间的决策按回退策略处理，
+# 并在下一个交易阶段开始前暂停，等冷却结束（最多 BREAKER_MAX_WAIT 秒）
+BREAKER_WINDOW = 20
+BREAKER_MIN_CALLS = 10
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_COOLDOWN = 30.0
+BREAKER_ON_OPEN = "fail"
+BREAKER_MAX_WAIT = 600.0
+
+# 每类决策的时限（秒，None 为不限）；超时后按 FALLBACK_POLICIES 中的策略决定（见 fallback.POLICIES），迟到的回答丢弃
+DECISION_DEADLINES = {"loan": None, "action": None, "estimate": None, "post": None}
+FALLBACK_POLICIES = {"loan": "default", "action": "default", "estimate": "default", "post": "default"}
+
+# 流式接收回答，收到完整且包含所需键的 JSON 对象后立即结束（不再等待其后的解释文字）
+STREAM_RESPONSES = False
+
+# 统计每个提示词模块和输入字段的字符数、token数，运行结束时写入日志
+PROFILE_PROMPTS = False
+
 # agent初始财产
 MAX_INITIAL_PROPERTY = 5000000.0
 MIN_INITIAL_PROPERTY = 100000.0
@@ -31,26 +87,5 @@ LOAN_RATE = [0.027, 0.03, 0.033]  # 贷款利率
 
 REPAYMENT_DAYS = [22, 44, 66, 88, 110, 132, 154, 176, 198, 220, 242, 264]  # 付息日
 
-# 财报
-SEASONAL_DAYS = 66 
-SEASON_REPORT_DAYS = [12, 78, 144, 210]
-FINANCIAL_REPORT_A = [
-    "Last quarter's financial report of Company A. Revenue growth rate (YoY): 9.49%, Revenue million: 4483.99, Gross margin: 41.05%, Income Tax as a percentage of Revenue: 11.31%, Selling Expense Rate:6.83%, Management Expense Rate: 3.83%, Net profit million: 856.6705, Depreciation and Amortization: 0.91%, Capital Expenditures: 2.30%, Changes in working capital: 0.82%, Cash Flow(million): 756.7537",
-    "Last quarter's financial report of Company A. Revenue growth rate (YoY): 7.38%, Revenue million: 4417.79, Gross margin: 35.68%, Income Tax as a percentage of Revenue: 11.75%, Selling Expense Rate:8.13%, Management Expense Rate: 4.62%, Net profit million: 493.9451, Depreciation and Amortization: 1.34%, Capital Expenditures: 2.68%, Changes in working capital: 0.86%, Cash Flow(million): 396.5329",
-    "Last quarter's financial report of Company A. Revenue growth rate (YoY): 8.70%, Revenue million: 4041.30, Gross margin: 37.45%, Income Tax as a percentage of Revenue: 9.34%, Selling Expense Rate:6.79%, Management Expense Rate: 3.41%, Net profit million: 724.3648, Depreciation and Amortization: 1.27%, Capital Expenditures: 2.44%, Changes in working capital: 0.94%, Cash Flow(million): 639.5329",
-    "Last quarter's financial report of Company A. Revenue growth rate (YoY): 7.75%, Revenue million: 5024.04, Gross margin: 42.47%, Income Tax as a percentage of Revenue: 10.67%, Selling Expense Rate:6.56%, Management Expense Rate: 4.72%, Net profit million: 1031.214, Depreciation and Amortization: 1.08%, Capital Expenditures: 2.71%, Changes in working capital: 0.08%, Cash Flow(million): 945.5034"]  # 各个季度的财报
-FINANCIAL_REPORT_B = [
-    "Last quarter's financial report of Company B. Revenue growth rate (YoY): 19.96%, Revenue million: 1319.94, Gross margin: 31.21%, Income Tax as a percentage of Revenue: 0.70%, Selling Expense Rate:4.69%, Management Expense Rate: 8.78%, Net profit million: 224.9179, Depreciation and Amortization: 1.13%, Capital Expenditures: 1.77%, Changes in working capital: 0.59%, Cash Flow(million): 208.7266",
-    "Last quarter's financial report of Company B. Revenue growth rate (YoY): 19.86%, Revenue million: 1096.70, Gross margin: 31.26%, Income Tax as a percentage of Revenue: 0.71%, Selling Expense Rate:3.62%, Management Expense Rate: 9.90%, Net profit million: 186.7678, Depreciation and Amortization: 0.67%, Capital Expenditures: 1.44%, Changes in working capital: -0.31%, Cash Flow(million): 181.6862",
-    "Last quarter's financial report of Company B. Revenue growth rate (YoY): 18.21%, Revenue million: 1676.70, Gross margin: 31.58%, Income Tax as a percentage of Revenue: 0.92%, Selling Expense Rate:3.78%, Management Expense Rate: 10.27%, Net profit million: 278.3327, Depreciation and Amortization: 0.77%, Capital Expenditures: 1.56%, Changes in working capital: -0.06%, Cash Flow(million): 266.1486",
-    "Last quarter's financial report of Company B. Revenue growth rate (YoY): 15.98%, Revenue million: 1075.13, Gross margin: 32.41%, Income Tax as a percentage of Revenue: 1.08%, Selling Expense Rate:3.79%, Management Expense Rate: 10.70%, Net profit million: 181.1602, Depreciation and Amortization: 1.09%, Capital Expenditures: 2.28%, Changes in working capital: 0.67%, Cash Flow(million): 161.1985"]
-
-# 特殊事件
-EVENT_1_DAY = 78
-EVENT_1_MESSAGE = "The government has announced a reduction in the reserve requirement ratio. " \
-                  "The lending interest rates have been lowered."
-EVENT_1_LOAN_RATE = [0.024, 0.027, 0.030]  # 降准后的利率
-
-EVENT_2_DAY = 144
-EVENT_2_MESSAGE = "The government has announced an increase in interest rates."
-EVENT_2_LOAN_RATE = [0.0255, 0.0285, 0.0315]
+# 市场事件（利率变动、新闻、财报、参数冲击）见场景文件
+SCENARIO_FILE = "scenario/default.json"